@@ -0,0 +1,262 @@
+"""Encoder benchmark: every supported video and audio encoder over the same synthetic input
+
+The input is generated once from ffmpeg's testsrc2 and sine sources and stored uncompressed,
+so every run decodes it for free and results only differ by the encoder and its options.
+The options come from the same builder the GUI and batch mode use:
+    python benchmarks/bench_encoders.py --output encoders.json
+    python benchmarks/bench_encoders.py --codecs H.264,H.265 --presets ultrafast,medium --crf 23,28
+    python benchmarks/bench_encoders.py --output encoders.csv --baseline encoders.json
+With --baseline the exit code is 1 if a combination got slower than the tolerance allows.
+"""
+import argparse
+import csv
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT_DIRECTORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIRECTORY)
+
+import src.constants as constants  # noqa: E402
+from src.settings import (EncodeSettings, build_audio_arguments, build_job_arguments,  # noqa: E402
+                          build_video_arguments)
+from src.utils import support_crf  # noqa: E402
+
+# -preset only changes anything for these, the other encoders ignore it and run once
+PRESET_FORMATS = ["H.264", "H.265"]
+
+# matroska takes every supported encoder, so one container keeps the results comparable
+OUTPUT_FORMAT = "mkv"
+
+REPORT_FIELDS = ["name", "kind", "format", "encoder", "preset", "crf", "wall_time", "fps", "speed",
+                 "cpu_time", "cpu_usage", "peak_rss", "output_size", "exit_code"]
+
+
+def generate_source(program: str, path: str, size: str, rate: int, duration: float):
+    """Write the deterministic benchmark input, raw yuv420p video and 16 bit pcm audio"""
+    subprocess.run([program, "-v", "error", "-y",
+                    "-f", "lavfi", "-i", f"testsrc2=size={size}:rate={rate}:duration={duration}",
+                    "-f", "lavfi", "-i", f"sine=frequency=1000:sample_rate=48000:duration={duration}",
+                    "-c:v", "rawvideo", "-pix_fmt", "yuv420p", "-c:a", "pcm_s16le",
+                    "-fflags", "+bitexact", path],
+                   check=True, capture_output=True)
+
+
+def split_list(value: str, choices: list):
+    values = [item.strip() for item in value.split(",") if item.strip()]
+    unknown = [item for item in values if item not in choices]
+    if unknown:
+        raise argparse.ArgumentTypeError(f"unknown {', '.join(unknown)}, choose from {', '.join(choices)}")
+    return values
+
+
+def build_cases(video_formats: list, audio_formats: list, presets: list, crf_values: list):
+    """Return (name, kind, settings, details) of every combination to run"""
+    cases = []
+    for encode_format in video_formats:
+        format_presets = presets if encode_format in PRESET_FORMATS else [EncodeSettings.encode_speed]
+        format_crf_values = crf_values if support_crf(encode_format) else [None]
+        for preset in format_presets:
+            for crf in format_crf_values:
+                settings = EncodeSettings(enable_encode_format=True, encode_format=encode_format,
+                                          encode_speed=preset, file_format=OUTPUT_FORMAT)
+                if crf is not None:
+                    settings.video_quality = crf
+                name = " ".join(part for part in [encode_format,
+                                                  preset if encode_format in PRESET_FORMATS else None,
+                                                  f"crf {crf}" if crf is not None else None] if part)
+                cases.append((name, "video", settings, {"format": encode_format, "preset": preset, "crf": crf}))
+    for audio_format in audio_formats:
+        settings = EncodeSettings(audio_copy=False, enable_audio_format=True, audio_format=audio_format,
+                                  file_format=OUTPUT_FORMAT)
+        cases.append((audio_format, "audio", settings, {"format": audio_format, "preset": None, "crf": None}))
+    return cases
+
+
+def case_arguments(kind: str, settings: EncodeSettings, source: str, output: str):
+    # each case measures one encoder, the other stream is left out instead of copied
+    if kind == "video":
+        arguments = build_video_arguments(settings) + ["-an"]
+    else:
+        arguments = build_audio_arguments(settings) + ["-vn"]
+    return ["-v", "error", "-y", "-nostdin"] + build_job_arguments(source, arguments, output)
+
+
+def measure(program: str, arguments: list):
+    """Run ffmpeg once, return (exit code, wall time, cpu time or None, peak rss bytes or None, stderr)"""
+    with tempfile.TemporaryFile() as stderr:
+        start = time.perf_counter()
+        process = subprocess.Popen([program] + arguments, stdin=subprocess.DEVNULL,
+                                   stdout=subprocess.DEVNULL, stderr=stderr)
+        if hasattr(os, "wait4"):
+            # the resource usage of exactly this child, not of all children reaped so far
+            _, status, usage = os.wait4(process.pid, 0)
+            wall_time = time.perf_counter() - start
+            process.returncode = os.waitstatus_to_exitcode(status)
+            cpu_time = usage.ru_utime + usage.ru_stime
+            # Linux reports kilobytes, macOS bytes
+            peak_rss = usage.ru_maxrss if sys.platform == "darwin" else usage.ru_maxrss * 1024
+        else:
+            process.wait()
+            wall_time = time.perf_counter() - start
+            cpu_time, peak_rss = None, None
+        stderr.seek(0)
+        error = stderr.read().decode("utf-8", errors="replace").strip()
+    return process.returncode, wall_time, cpu_time, peak_rss, error
+
+
+def run_case(program: str, case: tuple, source: str, directory: str, repeat: int, frames: int, duration: float):
+    name, kind, settings, details = case
+    output = os.path.join(directory, f"output.{OUTPUT_FORMAT}")
+    arguments = case_arguments(kind, settings, source, output)
+    samples = []
+    for _ in range(repeat):
+        exit_code, wall_time, cpu_time, peak_rss, error = measure(program, arguments)
+        if exit_code != 0:
+            print(f"{name}: ffmpeg failed with exit code {exit_code}: {error.splitlines()[-1] if error else ''}")
+            return dict(name=name, kind=kind, encoder=encoder_of(kind, settings), exit_code=exit_code, **details)
+        samples.append((wall_time, cpu_time, peak_rss))
+
+    # the median run stands for the case, its cpu time belongs to the same run
+    samples.sort(key=lambda sample: sample[0])
+    wall_time, cpu_time, _ = samples[len(samples) // 2]
+    rss_values = [sample[2] for sample in samples if sample[2] is not None]
+    result = dict(name=name, kind=kind, encoder=encoder_of(kind, settings), **details,
+                  wall_time=wall_time,
+                  fps=frames / wall_time if kind == "video" else None,
+                  speed=duration / wall_time,
+                  cpu_time=cpu_time,
+                  cpu_usage=cpu_time / wall_time if cpu_time is not None else None,
+                  peak_rss=max(rss_values) if rss_values else None,
+                  output_size=os.path.getsize(output),
+                  exit_code=0)
+    os.remove(output)
+    return result
+
+
+def encoder_of(kind: str, settings: EncodeSettings):
+    if kind == "video":
+        return constants.SUPPORT_VIDEO_ENCODE_FORMAT[settings.encode_format]
+    return constants.SUPPORT_AUDIO_ENCODE_FORMAT[settings.audio_format]
+
+
+def print_result(result: dict):
+    if result["exit_code"] != 0:
+        return
+    fps = f"{result['fps']:8.1f} fps" if result["fps"] is not None else " " * 12
+    cpu = f"cpu {result['cpu_usage']:5.2f}x" if result["cpu_usage"] is not None else ""
+    rss = f"rss {result['peak_rss'] / 1048576:7.1f} MB" if result["peak_rss"] is not None else ""
+    print(f"{result['name']:28s} {result['wall_time']:8.2f} s {fps} {result['speed']:7.2f}x  {cpu}  {rss}  "
+          f"{result['output_size'] / 1024:10.1f} KB")
+
+
+def ffmpeg_version(program: str):
+    try:
+        output = subprocess.run([program, "-version"], capture_output=True, text=True, check=True).stdout
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return output.splitlines()[0] if output else None
+
+
+def write_report(path: str, report: dict):
+    if path.lower().endswith(".csv"):
+        with open(path, "w", encoding="utf-8", newline="") as file:
+            writer = csv.DictWriter(file, fieldnames=REPORT_FIELDS, extrasaction="ignore")
+            writer.writeheader()
+            writer.writerows(report["results"])
+    else:
+        with open(path, "w", encoding="utf-8") as file:
+            json.dump(report, file, indent=4)
+
+
+def read_results(path: str):
+    """Results of an earlier JSON or CSV report, keyed by name"""
+    with open(path, "r", encoding="utf-8", newline="") as file:
+        if path.lower().endswith(".csv"):
+            rows = list(csv.DictReader(file))
+            for row in rows:
+                row["wall_time"] = float(row["wall_time"]) if row["wall_time"] else None
+        else:
+            rows = json.load(file)["results"]
+    return {row["name"]: row for row in rows if row.get("wall_time")}
+
+
+def compare(results: list, baseline: dict, tolerance: float):
+    """Print a comparison against a baseline, return True if nothing regressed"""
+    is_ok = True
+    for result in results:
+        old = baseline.get(result["name"])
+        if old is None or result.get("wall_time") is None:
+            continue
+        change = (result["wall_time"] - old["wall_time"]) / old["wall_time"] if old["wall_time"] > 0 else 0.0
+        status = "ok"
+        if change > tolerance:
+            status = "REGRESSION"
+            is_ok = False
+        print(f"{result['name']:28s} {old['wall_time']:8.2f} s -> {result['wall_time']:8.2f} s  {change:+7.1%}  {status}")
+    return is_ok
+
+
+def main():
+    video_formats = list(constants.SUPPORT_VIDEO_ENCODE_FORMAT)
+    audio_formats = list(constants.SUPPORT_AUDIO_ENCODE_FORMAT)
+    parser = argparse.ArgumentParser(description="Measure the speed, cpu and memory use and output size of every encoder")
+    parser.add_argument("--ffmpeg", default=constants.DEFAULT_FFMPEG_PATH, help="path of the ffmpeg binary")
+    parser.add_argument("--codecs", type=lambda value: split_list(value, video_formats), default=video_formats,
+                        help="comma separated video formats, default all")
+    parser.add_argument("--audio-codecs", type=lambda value: split_list(value, audio_formats), default=audio_formats,
+                        help="comma separated audio formats, default all, empty for none")
+    parser.add_argument("--presets", type=lambda value: split_list(value, constants.ENCODE_SPEED),
+                        default=constants.ENCODE_SPEED, help="comma separated presets of H.264 and H.265, default all")
+    parser.add_argument("--crf", type=lambda value: [item.strip() for item in value.split(",") if item.strip()],
+                        default=[EncodeSettings.video_quality], help="comma separated CRF values of the CRF encoders")
+    parser.add_argument("--size", default="1280x720", help="size of the generated video")
+    parser.add_argument("--rate", type=int, default=25, help="frame rate of the generated video")
+    parser.add_argument("--duration", type=float, default=5.0, help="seconds of generated input")
+    parser.add_argument("--repeat", type=int, default=1, help="runs per combination, the median is reported")
+    parser.add_argument("--output", help="write the report to this file, CSV if it ends in .csv, JSON otherwise")
+    parser.add_argument("--baseline", help="JSON or CSV report of an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="allowed slowdown of a run, 0.1 is 10%%")
+    options = parser.parse_args()
+
+    program = options.ffmpeg if os.path.exists(options.ffmpeg) else shutil.which("ffmpeg") or options.ffmpeg
+    cases = build_cases(options.codecs, options.audio_codecs, options.presets, options.crf)
+    frames = round(options.duration * options.rate)
+
+    directory = tempfile.mkdtemp(prefix="ffmpeg-gui-bench-")
+    try:
+        source = os.path.join(directory, "source.nut")
+        try:
+            generate_source(program, source, options.size, options.rate, options.duration)
+        except (OSError, subprocess.CalledProcessError) as error:
+            print(f"Can't generate the input with {program}: {error}", file=sys.stderr)
+            return 2
+        print(f"Run {len(cases)} combinations over {frames} frames of {options.size} with {program}")
+        results = []
+        for case in cases:
+            result = run_case(program, case, source, directory, max(options.repeat, 1), frames, options.duration)
+            print_result(result)
+            results.append(result)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+    if options.output:
+        report = {"environment": {"ffmpeg": ffmpeg_version(program), "platform": platform.platform(),
+                                  "processor": platform.processor(), "cpu_count": os.cpu_count()},
+                  "source": {"size": options.size, "rate": options.rate, "duration": options.duration,
+                             "frames": frames},
+                  "results": results}
+        write_report(options.output, report)
+
+    if options.baseline:
+        return 0 if compare(results, read_results(options.baseline), options.tolerance) else 1
+    return 1 if any(result["exit_code"] != 0 for result in results) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
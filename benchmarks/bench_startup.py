@@ -0,0 +1,128 @@
+"""Startup benchmark: import time of the pure modules and of the GUI, and time to first window
+
+Each sample runs in a fresh interpreter:
+    python benchmarks/bench_startup.py --repeat 10 --output startup.json
+    python benchmarks/bench_startup.py --baseline startup.json
+With --baseline the exit code is 1 if a median got slower than the tolerance allows.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT_DIRECTORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PURE_MODULES = ["src.constants", "src.utils", "src.jobs", "src.settings", "src.progress", "src.probe", "src.job_logs"]
+
+
+def measure_child():
+    """Run inside the fresh interpreter and print the measurements as JSON"""
+    start = time.perf_counter()
+    sys.path.insert(0, ROOT_DIRECTORY)
+    result = {}
+
+    for module in PURE_MODULES:
+        __import__(module)
+    result["import_pure"] = time.perf_counter() - start
+    if "PySide6" in sys.modules:
+        raise RuntimeError("pure modules imported PySide6")
+
+    from PySide6.QtCore import QTimer
+    from PySide6.QtWidgets import QApplication
+    result["import_qt"] = time.perf_counter() - start - result["import_pure"]
+
+    mark = time.perf_counter()
+    from src.main_window import MainWindow
+    result["import_main_window"] = time.perf_counter() - mark
+
+    app = QApplication([sys.argv[0]])
+    mark = time.perf_counter()
+    window = MainWindow()
+    result["construct_window"] = time.perf_counter() - mark
+
+    def first_frame():
+        result["first_window"] = time.perf_counter() - start
+        app.quit()
+
+    # the timer fires once the event loop has processed the show and first paint
+    window.resize(800, 900)
+    window.show()
+    QTimer.singleShot(0, first_frame)
+    app.exec()
+
+    print(json.dumps(result))
+
+
+def run_samples(repeat: int):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        output = subprocess.run([sys.executable, os.path.abspath(__file__), "--child"],
+                                capture_output=True, text=True, check=True).stdout
+        sample = json.loads(output.strip().splitlines()[-1])
+        sample["process_total"] = time.perf_counter() - start
+        samples.append(sample)
+    return samples
+
+
+def summarize(samples: list):
+    result = {}
+    for key in samples[0]:
+        values = [sample[key] for sample in samples]
+        result[key] = {"median": statistics.median(values), "min": min(values), "max": max(values)}
+    return result
+
+
+def compare(result: dict, baseline: dict, tolerance: float):
+    """Print a comparison against a baseline, return True if nothing regressed"""
+    is_ok = True
+    for key, value in result.items():
+        if key not in baseline:
+            continue
+        old, new = baseline[key]["median"], value["median"]
+        change = (new - old) / old if old > 0 else 0.0
+        status = "ok"
+        if change > tolerance:
+            status = "REGRESSION"
+            is_ok = False
+        print(f"{key:20s} {old * 1000:9.1f} ms -> {new * 1000:9.1f} ms  {change:+7.1%}  {status}")
+    return is_ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure import time and time to first window")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--repeat", type=int, default=5, help="number of fresh interpreters to sample")
+    parser.add_argument("--output", help="write the summary as JSON to this file")
+    parser.add_argument("--baseline", help="JSON summary of an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed slowdown of a median, 0.2 is 20%%")
+    options = parser.parse_args()
+
+    if options.child:
+        # headless machines have no display to open the window on
+        if sys.platform.startswith("linux") and not (os.environ.get("DISPLAY") or os.environ.get("WAYLAND_DISPLAY")):
+            os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+        measure_child()
+        return 0
+
+    result = summarize(run_samples(options.repeat))
+    for key, value in result.items():
+        print(f"{key:20s} median {value['median'] * 1000:9.1f} ms  "
+              f"min {value['min'] * 1000:9.1f} ms  max {value['max'] * 1000:9.1f} ms")
+
+    if options.output:
+        with open(options.output, "w", encoding="utf-8") as file:
+            json.dump(result, file, indent=4)
+
+    if options.baseline:
+        with open(options.baseline, "r", encoding="utf-8") as file:
+            baseline = json.load(file)
+        return 0 if compare(result, baseline, options.tolerance) else 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,10 +1,19 @@
 # Copyright © 2024 Jiale Song. All rights reserved.
 
 import sys
-from PySide6.QtWidgets import QApplication
-from src.main_window import MainWindow
 
 if __name__ == '__main__':
+    # headless batch mode never touches the widgets
+    if len(sys.argv) > 1 and sys.argv[1] == "--batch":
+        from src.cli import main
+        sys.exit(main(sys.argv[2:]))
+    if len(sys.argv) > 1 and sys.argv[1] == "--agent":
+        from src.agent import main
+        sys.exit(main(sys.argv[2:]))
+
+    from PySide6.QtWidgets import QApplication
+    from src.main_window import MainWindow
+
     app = QApplication(sys.argv)
     window = MainWindow()
     window.resize(800, 900)
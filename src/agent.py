@@ -0,0 +1,227 @@
+"""Worker agent, runs the ffmpeg jobs of a GUI or batch run on another machine
+
+    python -m src.agent --listen 0.0.0.0:7000 --capacity 2
+    python -m src.agent --listen unix:/tmp/ffmpeg-gui-agent.sock
+    python main.py --agent --listen 127.0.0.1:7001
+
+Jobs arrive as the full ffmpeg argument list and write to the paths in it, so the
+dispatching machine and the agents need a shared file system with the same paths.
+Every client must send the token of FFMPEG_GUI_AGENT_TOKEN or --token, since a
+client can make ffmpeg read and write any file the agent can.
+"""
+import argparse
+import os
+import platform
+import signal
+import sys
+from collections import deque
+
+from PySide6.QtCore import QCoreApplication, QObject, QProcess, QTimer
+from PySide6.QtNetwork import QHostAddress, QLocalServer, QLocalSocket, QTcpServer
+
+import src.constants as constants
+from src.jobs import default_worker_count
+from src.remote import PROTOCOL_VERSION, MessageReader, default_token, encode_message, parse_address
+
+
+class AgentSession(QObject):
+    """One connected client and the jobs it sent"""
+
+    def __init__(self, server, connection, parent=None):
+        super().__init__(parent)
+        self.server = server
+        self.socket = connection
+        self.reader = MessageReader()
+        self.is_accepted = False
+        self.socket.readyRead.connect(self.handle_read)
+        self.socket.disconnected.connect(self.handle_disconnect)
+
+    def send(self, message: dict):
+        self.socket.write(encode_message(message))
+
+    def refuse(self, message: str):
+        self.send({"type": "error", "message": message})
+        self.socket.flush()
+        if isinstance(self.socket, QLocalSocket):
+            self.socket.disconnectFromServer()
+        else:
+            self.socket.disconnectFromHost()
+
+    def handle_read(self):
+        try:
+            messages = self.reader.feed(self.socket.readAll().data())
+        except ValueError as error:
+            self.refuse(f"invalid message: {error}")
+            return
+        for message in messages:
+            self.handle_message(message)
+
+    def handle_message(self, message: dict):
+        message_type = message.get("type")
+        if not self.is_accepted:
+            if message_type != "hello" or message.get("version") != PROTOCOL_VERSION:
+                self.refuse(f"expected hello of protocol version {PROTOCOL_VERSION}")
+            elif message.get("token", "") != self.server.token:
+                self.refuse("wrong token")
+            else:
+                self.is_accepted = True
+                self.send({"type": "hello", "version": PROTOCOL_VERSION, "name": self.server.name,
+                           "capacity": self.server.capacity, "cpu_count": os.cpu_count() or 1})
+            return
+
+        if message_type == "run":
+            arguments = message.get("arguments")
+            if not isinstance(arguments, list) or not all(isinstance(argument, str) for argument in arguments):
+                self.send({"type": "finished", "id": message.get("id"), "exit_code": -1,
+                           "error": "arguments must be a list of strings"})
+                return
+            self.server.submit(self, message.get("id"), arguments)
+        elif message_type == "cancel":
+            self.server.cancel(self, message.get("id"))
+
+    def handle_disconnect(self):
+        # nobody is left to receive the results, the client runs the jobs again elsewhere
+        self.server.drop(self)
+        self.socket.deleteLater()
+        self.deleteLater()
+
+
+class AgentServer(QObject):
+    """Accept clients on a TCP or Unix socket and run their jobs, at most capacity at a time"""
+
+    def __init__(self, program: str, capacity: int, token: str = "", name: str = None, parent=None):
+        super().__init__(parent)
+        self.program = program
+        self.capacity = max(1, capacity)
+        self.token = token
+        self.name = name or platform.node()
+        self.server = None
+        self.sessions = set()
+        self.waiting = deque()
+        # (session, job id) -> QProcess
+        self.processes = {}
+
+    def listen(self, address: str):
+        """Start listening, raise OSError if the address can't be used"""
+        target = parse_address(address)
+        if target[0] == "unix":
+            QLocalServer.removeServer(target[1])
+            self.server = QLocalServer(self)
+            is_listening = self.server.listen(target[1])
+        else:
+            self.server = QTcpServer(self)
+            is_listening = self.server.listen(QHostAddress(target[1]), target[2])
+        if not is_listening:
+            raise OSError(f"Can't listen on {address}: {self.server.errorString()}")
+        self.server.newConnection.connect(self.handle_connection)
+
+    def handle_connection(self):
+        while self.server.hasPendingConnections():
+            self.sessions.add(AgentSession(self, self.server.nextPendingConnection(), self))
+
+    def submit(self, session: AgentSession, job_id, arguments: list):
+        self.waiting.append((session, job_id, arguments))
+        self.fill_workers()
+
+    def cancel(self, session: AgentSession, job_id):
+        process = self.processes.get((session, job_id))
+        if process is not None:
+            process.terminate()
+            return
+        for item in list(self.waiting):
+            if item[0] is session and item[1] == job_id:
+                self.waiting.remove(item)
+                session.send({"type": "finished", "id": job_id, "exit_code": -1, "crashed": True})
+
+    def drop(self, session: AgentSession):
+        self.sessions.discard(session)
+        self.waiting = deque(item for item in self.waiting if item[0] is not session)
+        for (owner, job_id), process in list(self.processes.items()):
+            if owner is session:
+                process.kill()
+
+    def fill_workers(self):
+        while self.waiting and len(self.processes) < self.capacity:
+            session, job_id, arguments = self.waiting.popleft()
+            self.start_process(session, job_id, arguments)
+
+    def start_process(self, session: AgentSession, job_id, arguments: list):
+        key = (session, job_id)
+        process = QProcess(self)
+        process.readyReadStandardOutput.connect(lambda: self.forward(key, "stdout",
+                                                                     process.readAllStandardOutput()))
+        process.readyReadStandardError.connect(lambda: self.forward(key, "stderr",
+                                                                    process.readAllStandardError()))
+        process.finished.connect(lambda exit_code, exit_status: self.finish(key, process, {
+            "exit_code": exit_code, "crashed": exit_status != QProcess.NormalExit}))
+        process.errorOccurred.connect(lambda error: self.handle_error(key, process, error))
+        process.started.connect(lambda: self.notify(key, {"type": "started"}))
+        self.processes[key] = process
+        print(f"Start job {job_id}: {self.program} {' '.join(arguments)}", flush=True)
+        process.start(self.program, arguments)
+
+    def forward(self, key: tuple, channel: str, data):
+        self.notify(key, {"type": channel, "data": data.data().decode("utf-8", errors="replace")})
+
+    def notify(self, key: tuple, message: dict):
+        session, job_id = key
+        if session in self.sessions:
+            session.send(dict(message, id=job_id))
+
+    def handle_error(self, key: tuple, process: QProcess, error: QProcess.ProcessError):
+        # finished is never emitted for a process that could not be started
+        if error == QProcess.FailedToStart:
+            self.finish(key, process, {"exit_code": -1, "error": process.errorString()})
+
+    def finish(self, key: tuple, process: QProcess, result: dict):
+        if self.processes.pop(key, None) is None:
+            return
+        process.deleteLater()
+        session, job_id = key
+        print(f"Finish job {job_id}: {result}", flush=True)
+        self.notify(key, dict(type="finished", **result))
+        self.fill_workers()
+
+
+def main(argv: list = None):
+    parser = argparse.ArgumentParser(prog="ffmpeg-gui-agent", description="Run ffmpeg jobs sent by other machines")
+    parser.add_argument("--listen", default=f"127.0.0.1:{constants.DEFAULT_AGENT_PORT}",
+                        help="host:port or unix:/path to listen on")
+    parser.add_argument("--ffmpeg", default=constants.DEFAULT_FFMPEG_PATH, help="path of the ffmpeg binary")
+    parser.add_argument("-c", "--capacity", type=int, default=0, help="jobs to run at once, 0 for auto")
+    parser.add_argument("--name", default=None, help="name reported to clients, the host name by default")
+    parser.add_argument("--token", default=None, help=f"token clients must send, ${constants.AGENT_TOKEN_VARIABLE} "
+                                                      "by default")
+    options = parser.parse_args(argv)
+
+    app = QCoreApplication.instance() or QCoreApplication(sys.argv[:1])
+    capacity = options.capacity if options.capacity > 0 else default_worker_count()
+    token = default_token() if options.token is None else options.token
+    server = AgentServer(options.ffmpeg, capacity, token, options.name)
+    try:
+        server.listen(options.listen)
+    except (OSError, ValueError) as error:
+        print(error, file=sys.stderr)
+        return 2
+    target = parse_address(options.listen)
+    if not token and target[0] == "tcp" and target[1] not in ("127.0.0.1", "localhost", "::1"):
+        print(f"Warning: no token set, anyone who can reach {options.listen} can run ffmpeg here", file=sys.stderr)
+    print(f"Agent {server.name} listening on {options.listen} with capacity {capacity}, pid {os.getpid()}",
+          flush=True)
+
+    signal.signal(signal.SIGINT, lambda signum, frame: app.quit())
+    signal.signal(signal.SIGTERM, lambda signum, frame: app.quit())
+    # the timer gives the interpreter a chance to run the signal handlers
+    timer = QTimer()
+    timer.start(500)
+    timer.timeout.connect(lambda: None)
+    app.exec()
+
+    for process in list(server.processes.values()):
+        process.kill()
+        process.waitForFinished(2000)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
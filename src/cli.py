@@ -0,0 +1,421 @@
+"""Headless batch mode, run with `python -m src.cli job.json` or `python main.py --batch job.json`
+
+A job spec is a JSON object:
+    {
+        "inputs": ["/videos/a.mp4", "/videos/b.mov"],
+        "settings": {"enable_encode_format": true, "encode_format": "H.265", "file_format": "mkv"},
+        "arguments": "-c:v libx265 -crf 26",
+        "parallel_jobs": 0,
+        "agents": ["render-2:7000", "unix:/tmp/ffmpeg-gui-agent.sock"],
+        "priorities": {"/videos/b.mov": 2},
+        "trims": {"/videos/a.mp4": ["0:01:00", "0:01:30"], "/videos/b.mov": [12.5, null]}
+    }
+"settings" takes the fields of EncodeSettings, "arguments" optionally replaces the
+options built from them, and "parallel_jobs" 0 means choosing by core count and
+adjusting to the system load while the batch runs. "agents" are worker agents
+(src/agent.py) that run jobs besides the local workers. "priorities" gives inputs
+a priority other than 0, higher ones run first and pause running jobs of lower ones.
+"trims" keeps only the range from the in to the out point of an input, in seconds or
+HH:MM:SS, null for the end.
+"""
+import argparse
+import hashlib
+import json
+import os
+import signal
+import sys
+import time
+
+from PySide6.QtCore import QCoreApplication, QTimer
+
+import src.constants as constants
+from src.job_logs import JobLogWriter
+from src.job_queue import JobQueue
+from src.job_runner import JobRunner
+from src.jobs import JobState, default_worker_count, set_priorities, video_encoder_from_arguments
+from src.keyframes import KeyframeCache
+from src.metrics import BatchMetrics, MetricsRegistry, MetricsServer
+from src.output_cache import OutputCache, output_key_arguments, reuse_outputs
+from src.probe import ProbeCache, probe_file
+from src.progress import BatchProgress, format_seconds
+from src.sample_service import SampleEstimator
+from src.settings import EncodeSettings, build_arguments, build_jobs, ignored_by_edited_command, parse_command_line
+from src.system_load import LoadController
+from src.throughput import ThroughputHistory, estimate_jobs, estimate_makespan
+from src.trim import parse_trim
+from src.verify import add_verify_jobs, reject_unverified
+
+EXIT_OK = 0
+EXIT_FAILED = 1
+EXIT_USAGE = 2
+EXIT_INTERRUPTED = 130
+
+
+def load_job_spec(path: str):
+    """Read a job spec file
+
+    Return (settings, input files, arguments or None, parallel jobs, agents, priorities, trims).
+    """
+    with open(path, "r", encoding="utf-8") as file:
+        spec = json.load(file)
+    if not isinstance(spec, dict):
+        raise ValueError("Job spec must be a JSON object")
+
+    input_files = spec.get("inputs", [])
+    if not isinstance(input_files, list) or not all(isinstance(path, str) for path in input_files):
+        raise ValueError("\"inputs\" must be a list of paths")
+
+    settings = EncodeSettings.from_dict(spec.get("settings", {}))
+
+    arguments = spec.get("arguments")
+    if isinstance(arguments, str):
+        arguments = parse_command_line(arguments)
+    elif arguments is not None and not isinstance(arguments, list):
+        raise ValueError("\"arguments\" must be a string or a list")
+
+    agents = spec.get("agents", [])
+    if not isinstance(agents, list) or not all(isinstance(address, str) for address in agents):
+        raise ValueError("\"agents\" must be a list of addresses")
+
+    priorities = spec.get("priorities", {})
+    if not isinstance(priorities, dict) or not all(isinstance(priority, int) for priority in priorities.values()):
+        raise ValueError("\"priorities\" must map paths to integers")
+
+    trims = spec.get("trims", {})
+    if not isinstance(trims, dict) or not all(isinstance(trim, list) and len(trim) == 2 for trim in trims.values()):
+        raise ValueError("\"trims\" must map paths to [in, out] points")
+    trims = {path: parse_trim(*trim) for path, trim in trims.items()}
+
+    try:
+        parallel_jobs = int(spec.get("parallel_jobs", 0))
+    except (TypeError, ValueError):
+        raise ValueError("\"parallel_jobs\" must be a number of jobs, 0 for automatic")
+
+    return settings, input_files, arguments, parallel_jobs, agents, priorities, trims
+
+
+class BatchCli:
+    """Drive a JobRunner from a QCoreApplication and report progress on stdout"""
+
+    def __init__(self, app: QCoreApplication, jobs: list, workers: int, program: str,
+                 job_logs: JobLogWriter = None, quiet: bool = False, job_queue: JobQueue = None,
+                 load_controller: LoadController = None, agents: list = None, agent_token: str = None,
+                 metrics_path: str = None, prometheus_file: str = None, metrics_port: int = 0,
+                 history: ThroughputHistory = None, media: dict = None):
+        self.app = app
+        self.jobs = jobs
+        self.workers = workers
+        self.load_controller = load_controller if load_controller is not None and load_controller.is_supported() else None
+        self.job_logs = job_logs
+        self.job_queue = job_queue
+        self.quiet = quiet
+        self.is_interrupted = False
+        self.started = time.monotonic()
+
+        self.progress = BatchProgress.from_jobs(jobs)
+        for job in jobs:
+            if job.state == JobState.DONE:
+                self.progress.finish_job(job.index)
+
+        self.runner = JobRunner(program)
+        self.runner.job_started.connect(self.handle_start)
+        self.runner.job_stdout.connect(self.handle_stdout)
+        self.runner.job_stderr.connect(self.handle_stderr)
+        self.runner.job_finished.connect(self.handle_finish)
+        self.runner.all_finished.connect(self.app.quit)
+        self.runner.workers_changed.connect(self.handle_workers_change)
+        self.runner.agent_message.connect(self.print)
+        self.runner.job_paused.connect(lambda index, reason: self.print(f"Pause {index + 1}/{len(self.jobs)}: {reason}"))
+        self.runner.job_resumed.connect(lambda index: self.print(f"Continue {index + 1}/{len(self.jobs)}"))
+        self.runner.job_retrying.connect(self.handle_retry)
+        self.runner.set_agents(agents or [], agent_token)
+
+        registry = MetricsRegistry()
+        self.metrics = BatchMetrics(jobs, self.runner, registry, metrics_path, prometheus_file, history, media)
+        self.metrics_server = None
+        if metrics_port:
+            try:
+                self.metrics_server = MetricsServer(registry, metrics_port)
+            except OSError as error:
+                print(f"Metrics endpoint disabled: {error}", file=sys.stderr)
+
+        # the timer also gives the interpreter a chance to run the SIGINT handler
+        self.report_timer = QTimer()
+        self.report_timer.setInterval(1000)
+        self.report_timer.timeout.connect(self.report)
+
+    def run(self):
+        signal.signal(signal.SIGINT, self.handle_interrupt)
+        adaptive = ", adjusted to the system load" if self.load_controller is not None else ""
+        self.print(f"Run {len(self.jobs)} jobs with {self.workers} parallel workers{adaptive}")
+        if self.job_logs is not None:
+            self.print(f"Job logs are written to {self.job_logs.directory}")
+        if self.metrics.jsonl_path:
+            self.print(f"Metrics are written to {self.metrics.jsonl_path}")
+        if self.metrics_server is not None:
+            self.print(f"Metrics are served at http://127.0.0.1:{self.metrics_server.port()}/metrics")
+        if self.runner.agents:
+            self.print(f"Dispatch to {len(self.runner.agents)} worker agents as they connect")
+        self.started = time.monotonic()
+
+        # start from inside the event loop so an empty batch can quit it
+        QTimer.singleShot(0, lambda: self.runner.start(self.jobs, self.workers, self.load_controller))
+        self.report_timer.start()
+        self.app.exec()
+        self.report_timer.stop()
+        self.metrics.finish()
+        if self.metrics_server is not None:
+            self.metrics_server.close()
+        self.runner.set_agents([])
+        if self.job_logs is not None:
+            self.job_logs.close_all()
+
+        # a failed check shows up as the failure of the job it checked
+        failed = [job for job in self.jobs if job.state == JobState.FAILED and job.verifies is None]
+        done = sum(1 for job in self.jobs if job.state == JobState.DONE)
+        cancelled = sum(1 for job in self.jobs if job.state == JobState.CANCELLED)
+        self.print(f"Finished in {format_seconds(time.monotonic() - self.started)}: "
+                   f"{done} done, {len(failed)} failed, {cancelled} cancelled")
+        for job in failed:
+            self.print(f"  failed: {job.input_file} ({job.failure or f'exit code {job.exit_code}'})")
+        summary = self.metrics.summary()
+        if summary["verify_jobs"]:
+            self.print(f"Verified the outputs in {format_seconds(summary['verify_time'])} of checks, "
+                       f"{summary['verify_failed']} failed")
+        if self.job_queue is not None:
+            if self.job_queue.is_finished():
+                self.job_queue.remove()
+            else:
+                self.job_queue.compact()
+                self.print("Run again with --resume to continue where this run stopped")
+
+        if self.is_interrupted:
+            return EXIT_INTERRUPTED
+        return EXIT_FAILED if failed else EXIT_OK
+
+    def print(self, message: str):
+        print(message, flush=True)
+
+    def handle_interrupt(self, signum, frame):
+        self.is_interrupted = True
+        self.print("Interrupted, stopping all jobs")
+        self.runner.cancel_all()
+        # finished signals of the terminated processes are not needed any more
+        QTimer.singleShot(2000, self.app.quit)
+
+    def handle_workers_change(self, workers: int, reason: str):
+        self.print(f"Parallel workers changed to {workers}: {reason}")
+
+    def handle_start(self, index: int):
+        job = self.jobs[index]
+        self.progress.start_job(index)
+        if self.job_queue is not None:
+            self.job_queue.update(job)
+        if job.duration:
+            self.progress.set_duration(index, job.duration)
+        self.print(f"Start {index + 1}/{len(self.jobs)}: {job.input_file}")
+        for note in job.notes:
+            self.print(f"  {note}")
+        if self.job_logs is not None:
+            self.job_logs.open(index, f"{job.program or self.runner.program} {' '.join(job.arguments)}")
+
+    def handle_stdout(self, index: int, data: str):
+        self.progress.feed_stdout(index, data)
+
+    def handle_stderr(self, index: int, data: str):
+        self.progress.feed_stderr(index, data)
+        if self.job_logs is not None:
+            self.job_logs.write(index, data)
+
+    def handle_finish(self, index: int, exit_code: int):
+        job = self.jobs[index]
+        self.progress.finish_job(index)
+        if job.verifies is not None and job.state == JobState.FAILED:
+            reject_unverified(self.jobs, job)
+            verified = self.jobs[job.verifies]
+            if self.job_queue is not None:
+                self.job_queue.update(verified)
+            self.print(f"Verify {job.verifies + 1}/{len(self.jobs)}: "
+                       f"{verified.failure or 'its output failed verification'}")
+        if self.job_queue is not None:
+            self.job_queue.update(job)
+        if self.job_logs is not None:
+            self.job_logs.close(index)
+        status = "done" if job.state == JobState.DONE else f"failed with exit code {exit_code}"
+        if job.state == JobState.DONE and job.degraded is not None:
+            status += f" with the {job.degraded}"
+        self.print(f"Finish {index + 1}/{len(self.jobs)}: {job.output_file or job.input_file} {status}")
+
+    def handle_retry(self, index: int, reason: str):
+        self.progress.reset_job(index)
+        if self.job_logs is not None:
+            self.job_logs.close(index)
+        self.print(f"Failed {index + 1}/{len(self.jobs)}: {reason}")
+
+    def report(self):
+        if self.quiet or not self.progress.running():
+            return
+        details = [f"[{round(self.progress.overall_fraction() * 100):3d}%]",
+                   f"{self.runner.completed_count()}/{len(self.jobs)} done",
+                   f"{self.progress.speed():.2f}x",
+                   f"{self.progress.fps():.1f} fps"]
+        eta = self.progress.eta()
+        if eta is not None:
+            details.append(f"ETA {format_seconds(eta)}")
+        self.print("  ".join(details))
+
+
+def run_estimate(media: dict, arguments: list, file_format: str, workers: int, quality: bool, program: str):
+    """Print the estimate of every input from a few encoded samples instead of running the batch"""
+    app = QCoreApplication.instance() or QCoreApplication(sys.argv[:1])
+    estimator = SampleEstimator(program, ThroughputHistory())
+    failed = []
+
+    def print_estimate(path: str, estimate):
+        print(f"{path}: {estimate.summary()}", flush=True)
+        if estimate.size() is None:
+            failed.append(path)
+
+    def stop(signum, frame):
+        estimator.cancel()
+        app.quit()
+
+    estimator.estimated.connect(print_estimate)
+    estimator.finished.connect(app.quit)
+    signal.signal(signal.SIGINT, stop)
+    # the timer gives the interpreter a chance to run the SIGINT handler
+    timer = QTimer()
+    timer.start(500)
+    timer.timeout.connect(lambda: None)
+    print(f"Estimate {len(media)} inputs from samples with {workers} parallel workers", flush=True)
+    QTimer.singleShot(0, lambda: estimator.start(media, arguments, file_format, workers, quality))
+    app.exec()
+    return EXIT_FAILED if failed else EXIT_OK
+
+
+def queue_path(spec_path: str):
+    """Queue file of a job spec, one per spec so batches don't resume each other"""
+    key = hashlib.sha1(os.path.abspath(spec_path).encode("utf-8")).hexdigest()
+    return os.path.join(constants.CACHE_DIRECTORY, "queues", f"{key}.json")
+
+
+def main(argv: list = None):
+    parser = argparse.ArgumentParser(prog="ffmpeg-gui-batch", description="Run a batch of ffmpeg jobs without the GUI")
+    parser.add_argument("spec", help="job spec JSON file")
+    parser.add_argument("--ffmpeg", default=constants.DEFAULT_FFMPEG_PATH, help="path of the ffmpeg binary")
+    parser.add_argument("--ffprobe", default=constants.DEFAULT_FFPROBE_PATH, help="path of the ffprobe binary")
+    parser.add_argument("-j", "--jobs", type=int, default=None, help="number of parallel jobs, 0 for auto")
+    parser.add_argument("--log-dir", default=constants.LOG_DIRECTORY, help="directory for per-job log files")
+    parser.add_argument("-q", "--quiet", action="store_true", help="don't print periodic progress")
+    parser.add_argument("--agent", action="append", default=[], metavar="ADDRESS",
+                        help="worker agent at host:port or unix:/path, may be repeated")
+    parser.add_argument("--agent-token", default=None,
+                        help=f"token of the worker agents, ${constants.AGENT_TOKEN_VARIABLE} by default")
+    parser.add_argument("--metrics", default=None, metavar="FILE",
+                        help="append JSON lines of job and batch metrics to FILE, metrics.jsonl in the job log "
+                             "directory by default")
+    parser.add_argument("--prometheus-file", default=None, metavar="FILE",
+                        help="keep the metrics in FILE in Prometheus text format, e.g. for node_exporter")
+    parser.add_argument("--metrics-port", type=int, default=0, metavar="PORT",
+                        help="serve the metrics at http://127.0.0.1:PORT/metrics while the batch runs")
+    parser.add_argument("--estimate", action="store_true",
+                        help="only encode a few samples of every input and print the estimated size and time")
+    parser.add_argument("--quality", action="store_true", help="with --estimate, also measure PSNR and SSIM")
+    parser.add_argument("--resume", action="store_true",
+                        help="skip the jobs an interrupted run of the same spec finished")
+    options = parser.parse_args(argv)
+
+    try:
+        settings, input_files, arguments, parallel_jobs, agents, priorities, trims = load_job_spec(options.spec)
+    except (OSError, ValueError) as error:
+        print(f"Invalid job spec {options.spec}: {error}", file=sys.stderr)
+        return EXIT_USAGE
+
+    # stream copy, segmented encoding, loudness normalization and verification need the media
+    # info up front, otherwise cached info is enough for progress
+    cache = ProbeCache()
+    media = {}
+    must_probe = (settings.auto_stream_copy or settings.segmented_encoding or settings.use_loudness_normalization()
+                  or settings.verify_outputs or options.estimate)
+    for input_file in input_files:
+        try:
+            info = probe_file(input_file, cache, options.ffprobe) if must_probe else cache.get(input_file)
+        except (OSError, RuntimeError, ValueError) as error:
+            print(f"Failed to probe {input_file}: {error}", file=sys.stderr)
+            continue
+        if info is not None:
+            media[input_file] = info
+    cache.save()
+
+    if options.estimate:
+        arguments = arguments if arguments is not None else build_arguments(settings)
+        workers = options.jobs if options.jobs is not None else parallel_jobs
+        workers = workers if workers > 0 else default_worker_count(video_encoder_from_arguments(arguments))
+        return run_estimate({path: info for path, info in media.items() if info.duration > 0}, arguments,
+                            settings.file_format, workers, options.quality, options.ffmpeg)
+
+    ignored = ignored_by_edited_command(settings) if arguments is not None else []
+    if ignored:
+        print(f"\"arguments\" run as they are, without {', '.join(ignored)}", file=sys.stderr)
+    jobs = build_jobs(settings, input_files, arguments, media, KeyframeCache(), options.ffprobe, trims=trims)
+
+    if settings.reuse_outputs:
+        output_cache = OutputCache()
+        reused = reuse_outputs(jobs, output_cache, output_key_arguments(settings, arguments))
+        try:
+            output_cache.save()
+        except OSError as error:
+            print(f"Can't save the output cache: {error}", file=sys.stderr)
+        if reused > 0:
+            print(f"Skip {reused} jobs whose output an identical earlier job wrote")
+    if settings.verify_outputs:
+        add_verify_jobs(jobs, media, settings.verify_decode, ffprobe=options.ffprobe)
+    set_priorities(jobs, priorities)
+
+    job_queue = JobQueue.load(queue_path(options.spec)) if options.resume else None
+    if job_queue is None:
+        job_queue = JobQueue(queue_path(options.spec), settings, input_files, arguments, trims)
+    else:
+        job_queue.settings, job_queue.input_files, job_queue.arguments = settings, input_files, arguments
+        job_queue.trims = trims
+    try:
+        skipped = job_queue.track(jobs)
+    except OSError as error:
+        print(f"Can't save the job queue, resuming won't be possible: {error}", file=sys.stderr)
+        skipped, job_queue = 0, None
+    if skipped > 0:
+        print(f"Skip {skipped} jobs finished by an earlier run")
+
+    if options.jobs is not None:
+        parallel_jobs = options.jobs
+    load_controller = None
+    if parallel_jobs <= 0:
+        parallel_jobs = default_worker_count(video_encoder_from_arguments(jobs[0].arguments) if jobs else None)
+        load_controller = LoadController()
+
+    # the longest jobs start first so none of them is left running alone at the end
+    history = ThroughputHistory()
+    guessed = estimate_jobs(jobs, media, history)
+    guess_note = f", {guessed} jobs without speed history" if guessed else ""
+    print(f"Estimated time {format_seconds(estimate_makespan(jobs, parallel_jobs))}{guess_note}")
+
+    try:
+        job_logs = JobLogWriter(options.log_dir)
+    except OSError as error:
+        print(f"Job logs disabled: {error}", file=sys.stderr)
+        job_logs = None
+
+    app = QCoreApplication.instance() or QCoreApplication(sys.argv[:1])
+    try:
+        batch = BatchCli(app, jobs, parallel_jobs, options.ffmpeg, job_logs, options.quiet, job_queue,
+                         load_controller, agents + options.agent, options.agent_token,
+                         options.metrics or (job_logs.metrics_path() if job_logs is not None else None),
+                         options.prometheus_file, options.metrics_port, history, media)
+    except ValueError as error:
+        print(error, file=sys.stderr)
+        return EXIT_USAGE
+    return batch.run()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,3 +1,5 @@
+import os
+
 SUPPORT_FILE_FORMAT = [
     "avi",
     "flv",
@@ -41,4 +43,213 @@ ENCODE_SPEED = [
     "placebo"
 ]
 
-DEFAULT_FFMPEG_PATH = "./ffmpeg/ffmpeg"
\ No newline at end of file
+DEFAULT_FFMPEG_PATH = "./ffmpeg/ffmpeg"
+
+# Rough number of cores a single encode of each encoder keeps busy, used to
+# pick how many ffmpeg processes run in parallel.
+ENCODER_THREAD_USAGE = {
+    "libx264": 8,
+    "libx265": 8,
+    "libvpx": 2,
+    "libvpx-vp9": 4,
+    "libaom-av1": 4,
+    "mpeg2video": 2,
+    "prores": 4,
+    "cfhd": 4,
+    "mjpeg": 2,
+    "libtheora": 1,
+    "copy": 1
+}
+
+DEFAULT_ENCODER_THREAD_USAGE = 8
+
+# codec name ffprobe reports for the output of each encoder, inputs that
+# already use it can be stream copied instead of encoded again
+ENCODER_CODEC_NAMES = {
+    "libx264": "h264",
+    "libx265": "hevc",
+    "libvpx": "vp8",
+    "libvpx-vp9": "vp9",
+    "libaom-av1": "av1",
+    "mpeg2video": "mpeg2video",
+    "prores": "prores",
+    "cfhd": "cfhd",
+    "mjpeg": "mjpeg",
+    "libtheora": "theora",
+    "libmp3lame": "mp3",
+    "aac": "aac",
+    "pcm_s16le": "pcm_s16le",
+    "flac": "flac",
+    "alac": "alac"
+}
+
+MAX_PARALLEL_JOBS = 64
+
+# priorities of the jobs of a file, a ready job pauses running jobs of a lower priority
+JOB_PRIORITIES = {
+    "Urgent": 2,
+    "High": 1,
+    "Normal": 0,
+    "Low": -1
+}
+
+# a job that failed for a reason that may pass, e.g. out of memory or a busy network mount, runs
+# again up to MAX_JOB_RETRIES times, after RETRY_BACKOFF ms doubling up to MAX_RETRY_BACKOFF ms
+MAX_JOB_RETRIES = 2
+RETRY_BACKOFF = 5000
+MAX_RETRY_BACKOFF = 60000
+
+# with "Auto" parallel jobs the worker count follows the system load, sampled every
+# LOAD_SAMPLE_INTERVAL ms: it grows while the CPU is less busy than TARGET_CPU_USAGE and
+# shrinks when available memory or a disk runs out, waiting LOAD_SETTLE_SAMPLES samples
+# after each change so new workers are judged once they are up to speed
+LOAD_SAMPLE_INTERVAL = 2000
+TARGET_CPU_USAGE = 0.85
+MIN_AVAILABLE_MEMORY = 0.1
+MAX_DISK_BUSY = 0.9
+LOAD_SETTLE_SAMPLES = 2
+
+# worker agents on other machines, addressed as host:port or unix:/path/of/socket
+DEFAULT_AGENT_PORT = 7000
+# shared secret an agent requires from the machine dispatching jobs to it
+AGENT_TOKEN_VARIABLE = "FFMPEG_GUI_AGENT_TOKEN"
+AGENT_RECONNECT_INTERVAL = 5000
+# times a job is moved to another worker after losing the agent it ran on
+MAX_AGENT_RETRIES = 2
+# longest protocol message, a line of JSON
+MAX_AGENT_MESSAGE_BYTES = 16 * 1024 * 1024
+
+# encoders that support ffmpeg's -pass/-passlogfile two-pass mode, libx265 takes
+# its pass options through -x265-params instead
+TWO_PASS_ENCODERS = [
+    "libx264",
+    "libvpx",
+    "libvpx-vp9",
+    "libaom-av1",
+    "mpeg2video",
+    "libtheora"
+]
+
+DEFAULT_FFPROBE_PATH = "./ffmpeg/ffprobe"
+
+# directory for caches shared between runs (probe index, ...)
+CACHE_DIRECTORY = os.path.join(os.path.expanduser("~"), ".cache", "ffmpeg-gui")
+
+PROBE_CACHE_SIZE = 20000
+
+# outputs of earlier jobs that identical jobs reuse instead of encoding again, inputs are
+# recognized by content from their size and three blocks of FINGERPRINT_BLOCK_SIZE bytes
+OUTPUT_CACHE_SIZE = 20000
+OUTPUT_CACHE_COPIES = 4
+FINGERPRINT_BLOCK_SIZE = 64 * 1024
+
+# encode speeds measured per encoder, preset and resolution, a new measurement counts with
+# THROUGHPUT_HISTORY_WEIGHT against the ones before; jobs nothing is known about yet are
+# guessed to run at DEFAULT_ENCODE_SPEED times realtime
+THROUGHPUT_HISTORY_SIZE = 500
+THROUGHPUT_HISTORY_WEIGHT = 0.3
+DEFAULT_ENCODE_SPEED = 1.0
+# delay of the estimate shown before Start after the files or settings changed (ms)
+ESTIMATE_DELAY = 300
+
+# "Estimate" encodes SAMPLE_COUNT pieces of SAMPLE_LENGTH seconds spread over every input
+SAMPLE_COUNT = 3
+SAMPLE_LENGTH = 5.0
+# characters of stderr kept to read the quality a sample reached
+MAX_STDERR_TAIL = 8192
+
+MAX_PARALLEL_PROBES = 4
+
+# files found by a recursive folder scan are added to the list in batches of this size
+SCAN_BATCH_SIZE = 500
+
+# thumbnails in the file list and contact sheets, sizes in pixels
+THUMBNAIL_WIDTH = 96
+THUMBNAIL_HEIGHT = 54
+CONTACT_SHEET_COLUMNS = 4
+CONTACT_SHEET_ROWS = 3
+CONTACT_SHEET_FRAME_WIDTH = 240
+CONTACT_SHEET_FRAME_HEIGHT = 135
+
+# frames are taken at this fraction of each equal slice of the input, 0.5 is its middle
+THUMBNAIL_POSITION = 0.5
+
+MAX_PARALLEL_THUMBNAILS = 2
+
+# requests beyond this are dropped, oldest first, they belong to rows scrolled out of view
+THUMBNAIL_QUEUE_SIZE = 200
+
+THUMBNAIL_MEMORY_ITEMS = 1000
+
+THUMBNAIL_CACHE_BYTES = 256 * 1024 * 1024
+
+# removing more separate ranges of the file list than this resets the list view instead
+MAX_REMOVE_RANGES = 32
+
+# log browser keeps at most this many lines, flushed in batches every interval (ms)
+# upper bounds of the histogram buckets of the batch metrics, seconds and speed multipliers
+METRICS_TIME_BUCKETS = [1, 5, 15, 30, 60, 120, 300, 600, 1800, 3600, 7200]
+METRICS_LATENCY_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5]
+METRICS_SPEED_BUCKETS = [0.1, 0.25, 0.5, 1, 2, 4, 8, 16, 32, 64]
+# where the GUI publishes its metrics for Prometheus, a node_exporter textfile and/or
+# http://127.0.0.1:PORT/metrics, empty and 0 turn them off
+METRICS_PROMETHEUS_FILE = ""
+METRICS_HTTP_PORT = 0
+
+LOG_MAX_LINES = 5000
+
+LOG_FLUSH_INTERVAL = 100
+
+# full ffmpeg output of every job is written under this directory
+LOG_DIRECTORY = os.path.join(CACHE_DIRECTORY, "logs")
+
+JOB_LOG_MAX_BYTES = 10 * 1024 * 1024
+
+JOB_LOG_BACKUP_COUNT = 3
+
+LOG_KEEP_BATCHES = 20
+
+# segmented encoding never cuts an input into pieces shorter than this (seconds)
+MIN_SEGMENT_DURATION = 60
+
+# renditions of an encoding ladder, NAME=WIDTH:HEIGHT with an optional @ video bit rate in kb/s
+DEFAULT_LADDER_RENDITIONS = "1080p=-2:1080@5000, 720p=-2:720@2800, 480p=-2:480@1400"
+
+KEYFRAME_CACHE_SIZE = 2000
+
+# a trim point this close to a keyframe counts as on it (seconds), cutting there needs no encoding
+SMART_CUT_TOLERANCE = 0.01
+# the edges of a smart cut are joined with the copied middle, so they are encoded with the codec,
+# profile, level and pixel format of the source. Per codec: the encoder, its option taking encoder
+# parameters and the parameter of the level, ffprobe's level per level unit, and its profile names
+SMART_CUT_ENCODERS = {
+    "h264": {"encoder": "libx264", "parameters": "-x264-params", "level": "level", "level_scale": 10,
+             "profiles": {"Constrained Baseline": "baseline", "Baseline": "baseline", "Main": "main",
+                          "High": "high", "High 10": "high10", "High 4:2:2": "high422",
+                          "High 4:4:4 Predictive": "high444"}},
+    "hevc": {"encoder": "libx265", "parameters": "-x265-params", "level": "level-idc", "level_scale": 30,
+             "profiles": {"Main": "main", "Main 10": "main10", "Main Still Picture": "mainstillpicture"}}
+}
+
+# pass 1 statistics are large, keep those of fewer inputs
+PASSLOG_CACHE_SIZE = 200
+
+# EBU R128 loudness normalization, the integrated loudness target is a setting (LUFS); a
+# wide loudness range lets most inputs keep their dynamics with the linear second pass
+DEFAULT_LOUDNESS_TARGET = "-23"
+LOUDNORM_TRUE_PEAK = -1.0
+LOUDNORM_RANGE = 20.0
+# loudnorm works at 192 kHz, its output is resampled to this rate
+LOUDNORM_SAMPLE_RATE = 48000
+LOUDNESS_CACHE_SIZE = 5000
+# analysis jobs, loudness measurements and output checks, run in this many slots besides the workers
+MAX_PARALLEL_ANALYSES = 2
+
+# an output passes verification if its duration is within this many seconds or this share of
+# the expected one; outputs longer than VERIFY_FULL_DECODE_DURATION seconds are decode checked
+# in VERIFY_SAMPLE_COUNT pieces of VERIFY_SAMPLE_LENGTH seconds instead of as a whole
+VERIFY_DURATION_TOLERANCE = 1.0
+VERIFY_DURATION_SHARE = 0.01
+VERIFY_FULL_DECODE_DURATION = 600
+VERIFY_SAMPLE_COUNT = 3
+VERIFY_SAMPLE_LENGTH = 10.0
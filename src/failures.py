@@ -0,0 +1,69 @@
+import re
+from dataclasses import dataclass
+
+import src.constants as constants
+
+
+@dataclass
+class Failure:
+    """Why a job failed and what running it again may change"""
+    reason: str
+    is_retryable: bool = False
+    # a retry gets fewer threads and a faster preset
+    needs_fewer_resources: bool = False
+
+
+# checked in order against the end of ffmpeg's stderr, the first match decides
+FAILURE_PATTERNS = [
+    (r"Cannot allocate memory|Out of memory|bad_alloc|ENOMEM", Failure("out of memory", True, True)),
+    (r"No space left on device|ENOSPC|Disk quota exceeded", Failure("disk full", True)),
+    (r"Input/output error|Resource temporarily unavailable|Stale file handle|Connection (reset|refused|timed out)"
+     r"|Network is unreachable|Server returned 5\d\d", Failure("input or output temporarily unavailable", True)),
+    (r"No such file or directory", Failure("file not found")),
+    (r"Permission denied", Failure("permission denied")),
+    (r"Unknown encoder|Encoder not found|Unrecognized option|Option not found|Invalid argument"
+     r"|Error (while opening|initializing) (encoder|output stream)", Failure("invalid options")),
+    (r"matches no streams|does not contain any stream", Failure("stream not found")),
+    (r"Invalid data found when processing input|moov atom not found|could not find codec parameters",
+     Failure("unreadable input")),
+]
+
+
+def classify_failure(stderr_tail: str, exit_code: int):
+    """Failure of a job from the end of its stderr and its exit code
+
+    A process that died without an error message, exit code -1, was most likely killed,
+    e.g. by the out of memory killer, and is worth another try with fewer resources.
+    Anything else that can't be told apart is fatal.
+    """
+    for pattern, failure in FAILURE_PATTERNS:
+        if re.search(pattern, stderr_tail or ""):
+            return failure
+    if exit_code == -1:
+        return Failure("crashed or killed", True, True)
+    return Failure(f"exit code {exit_code}")
+
+
+def retry_delay(attempt: int):
+    """Milliseconds before retry number attempt, doubling from RETRY_BACKOFF up to MAX_RETRY_BACKOFF"""
+    return min(constants.RETRY_BACKOFF * 2 ** (attempt - 1), constants.MAX_RETRY_BACKOFF)
+
+
+def preset_of(arguments: list):
+    """Value of the last -preset in arguments, None if there is none"""
+    presets = [arguments[i + 1] for i, argument in enumerate(arguments[:-1]) if argument == "-preset"]
+    return presets[-1] if presets else None
+
+
+def faster_preset(arguments: list):
+    """arguments with the -preset one step faster, unchanged if there is none or it is the fastest
+
+    Pass 2 keeps its preset, it must match the statistics of pass 1.
+    """
+    if "-pass" in arguments:
+        return arguments
+    result = list(arguments)
+    for i, argument in enumerate(result[:-1]):
+        if argument == "-preset" and result[i + 1] in constants.ENCODE_SPEED:
+            result[i + 1] = constants.ENCODE_SPEED[max(0, constants.ENCODE_SPEED.index(result[i + 1]) - 1)]
+    return result
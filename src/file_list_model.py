@@ -0,0 +1,173 @@
+import os
+import time
+
+from PySide6.QtCore import QAbstractListModel, QModelIndex, Qt, QThread, Signal
+
+import src.constants as constants
+
+
+class FileListModel(QAbstractListModel):
+    """Input file list that stays fast with tens of thousands of paths
+
+    Paths are kept in a plain list with an index of their rows beside it, and rows are
+    inserted and removed in contiguous ranges so views update once per batch, not per row.
+    decoration_provider is called with a path to get the icon of its row, or None.
+    A detail set for a path, e.g. its estimate, is shown after it.
+    """
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.file_paths = []
+        self.path_index = {}
+        self.details = {}
+        self.decoration_provider = None
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.file_paths)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or not 0 <= index.row() < len(self.file_paths):
+            return None
+        if role in (Qt.DisplayRole, Qt.ToolTipRole):
+            path = self.file_paths[index.row()]
+            detail = self.details.get(path)
+            return f"{path}    [{detail}]" if detail else path
+        if role == Qt.DecorationRole and self.decoration_provider is not None:
+            return self.decoration_provider(self.file_paths[index.row()])
+        return None
+
+    def path(self, row: int):
+        return self.file_paths[row]
+
+    def paths(self):
+        return list(self.file_paths)
+
+    def contains(self, path: str):
+        return path in self.path_index
+
+    def update_path(self, path: str):
+        """Tell the views that the row of path changed, e.g. its thumbnail is ready"""
+        row = self.path_index.get(path)
+        if row is not None:
+            index = self.index(row)
+            self.dataChanged.emit(index, index, [Qt.DecorationRole])
+
+    def set_detail(self, path: str, detail: str = None):
+        if detail:
+            self.details[path] = detail
+        else:
+            self.details.pop(path, None)
+        row = self.path_index.get(path)
+        if row is not None:
+            index = self.index(row)
+            self.dataChanged.emit(index, index, [Qt.DisplayRole, Qt.ToolTipRole])
+
+    def add_paths(self, paths: list):
+        """Append the paths that are not in the list yet, return them"""
+        new_paths = []
+        for path in paths:
+            if path not in self.path_index:
+                self.path_index[path] = len(self.file_paths) + len(new_paths)
+                new_paths.append(path)
+        if new_paths:
+            first = len(self.file_paths)
+            self.beginInsertRows(QModelIndex(), first, first + len(new_paths) - 1)
+            self.file_paths.extend(new_paths)
+            self.endInsertRows()
+        return new_paths
+
+    def remove_rows(self, rows: list):
+        """Remove the given rows, one model update per contiguous range, return the removed paths"""
+        rows = sorted(set(rows), reverse=True)
+        ranges = []
+        for row in rows:
+            if ranges and ranges[-1][0] == row + 1:
+                ranges[-1][0] = row
+            else:
+                ranges.append([row, row])
+
+        # scattered selections are cheaper to apply as one reset than as many small updates
+        if len(ranges) > constants.MAX_REMOVE_RANGES:
+            removed_rows = set(rows)
+            removed = [self.file_paths[row] for row in rows]
+            self.beginResetModel()
+            self.file_paths = [path for row, path in enumerate(self.file_paths) if row not in removed_rows]
+            self.rebuild_index()
+            self.endResetModel()
+            return removed
+
+        # ranges run from the bottom, so removing one never shifts one still to come
+        removed = []
+        for first, last in ranges:
+            self.beginRemoveRows(QModelIndex(), first, last)
+            removed.extend(self.file_paths[first:last + 1])
+            del self.file_paths[first:last + 1]
+            self.endRemoveRows()
+        self.rebuild_index()
+        return removed
+
+    def rebuild_index(self):
+        # rows below a removed one moved up, one pass over the list is cheaper than fixing them per range
+        self.path_index = {path: row for row, path in enumerate(self.file_paths)}
+
+    def clear(self):
+        self.beginResetModel()
+        self.file_paths = []
+        self.path_index = {}
+        self.details = {}
+        self.endResetModel()
+
+
+def iter_media_files(directory: str, extensions: list = constants.SUPPORT_FILE_FORMAT):
+    """Yield the supported media files below directory, sorted by name within each folder"""
+    suffixes = tuple(f".{extension.lower()}" for extension in extensions)
+    pending = [directory]
+    while pending:
+        current = pending.pop()
+        try:
+            with os.scandir(current) as iterator:
+                entries = sorted(iterator, key=lambda entry: entry.name)
+        except OSError:
+            continue
+        subdirectories = []
+        for entry in entries:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    subdirectories.append(entry.path)
+                elif entry.name.lower().endswith(suffixes) and entry.is_file():
+                    yield entry.path
+            except OSError:
+                continue
+        pending.extend(reversed(subdirectories))
+
+
+class DirectoryScanner(QThread):
+    """Find media files below a directory off the GUI thread, reporting them in batches"""
+    found = Signal(list)
+
+    def __init__(self, directory: str, batch_size: int = constants.SCAN_BATCH_SIZE, parent=None):
+        super().__init__(parent)
+        self.directory = directory
+        self.batch_size = batch_size
+        self.is_cancelled = False
+        self.count = 0
+
+    def cancel(self):
+        self.is_cancelled = True
+
+    def run(self):
+        batch = []
+        last_emit = time.monotonic()
+        for path in iter_media_files(self.directory):
+            if self.is_cancelled:
+                return
+            batch.append(path)
+            # hand over a batch when it is full or waited long enough, so the list fills in while scanning
+            if len(batch) >= self.batch_size or time.monotonic() - last_emit > 0.1:
+                self.count += len(batch)
+                self.found.emit(batch)
+                batch = []
+                last_emit = time.monotonic()
+        if batch and not self.is_cancelled:
+            self.count += len(batch)
+            self.found.emit(batch)
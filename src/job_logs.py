@@ -0,0 +1,87 @@
+import datetime
+import os
+import shutil
+
+import src.constants as constants
+
+
+class RotatingLogFile:
+    """Append-only text file that rolls over to name.1, name.2, ... when it gets too big"""
+
+    def __init__(self, path: str, max_bytes: int = constants.JOB_LOG_MAX_BYTES,
+                 backup_count: int = constants.JOB_LOG_BACKUP_COUNT):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.file = open(path, "a", encoding="utf-8")
+        self.size = self.file.tell()
+
+    def write(self, data: str):
+        if self.size + len(data) > self.max_bytes and self.size > 0:
+            self.rotate()
+        self.file.write(data)
+        self.size += len(data)
+
+    def rotate(self):
+        self.file.close()
+        for i in range(self.backup_count - 1, 0, -1):
+            source = f"{self.path}.{i}"
+            if os.path.exists(source):
+                os.replace(source, f"{self.path}.{i + 1}")
+        if self.backup_count > 0:
+            os.replace(self.path, f"{self.path}.1")
+        self.file = open(self.path, "w", encoding="utf-8")
+        self.size = 0
+
+    def close(self):
+        self.file.close()
+
+
+class JobLogWriter:
+    """Stream the full output of each job of a batch into its own log file"""
+
+    def __init__(self, root_directory: str = None):
+        root_directory = root_directory or constants.LOG_DIRECTORY
+        batch_name = datetime.datetime.now().strftime("%Y%m%d-%H%M%S-%f")
+        self.directory = os.path.join(root_directory, batch_name)
+        os.makedirs(self.directory, exist_ok=True)
+        prune_batch_logs(root_directory)
+        self.files = {}
+
+    def job_log_path(self, index: int):
+        return os.path.join(self.directory, f"job-{index + 1:05d}.log")
+
+    def metrics_path(self):
+        """JSON lines of the batch metrics, next to the job logs"""
+        return os.path.join(self.directory, "metrics.jsonl")
+
+    def open(self, index: int, header: str = ""):
+        self.close(index)
+        self.files[index] = RotatingLogFile(self.job_log_path(index))
+        if header:
+            self.files[index].write(f"{header}\n")
+
+    def write(self, index: int, data: str):
+        log_file = self.files.get(index)
+        if log_file is not None:
+            log_file.write(data)
+
+    def close(self, index: int):
+        log_file = self.files.pop(index, None)
+        if log_file is not None:
+            log_file.close()
+
+    def close_all(self):
+        for index in list(self.files):
+            self.close(index)
+
+
+def prune_batch_logs(root_directory: str, keep: int = constants.LOG_KEEP_BATCHES):
+    """Delete the oldest batch log directories, keeping the newest ones"""
+    try:
+        names = sorted(name for name in os.listdir(root_directory)
+                       if os.path.isdir(os.path.join(root_directory, name)))
+    except OSError:
+        return
+    for name in names[:-keep] if keep > 0 else names:
+        shutil.rmtree(os.path.join(root_directory, name), ignore_errors=True)
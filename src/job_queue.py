@@ -0,0 +1,141 @@
+import json
+import os
+
+import src.constants as constants
+from src.jobs import JobState, skip_feeding_jobs
+from src.probe import file_identity
+from src.settings import EncodeSettings
+
+
+class JobQueue:
+    """A batch and the state of its jobs, saved as JSON while it runs so it can be resumed
+
+    The whole queue is written when the batch starts and ends, in between every change of
+    a job is appended to a journal next to it, one JSON line each, which load replays.
+    """
+
+    def __init__(self, path: str, settings: EncodeSettings, input_files: list, arguments: list = None,
+                 trims: dict = None):
+        self.path = path
+        self.settings = settings
+        self.input_files = input_files
+        self.arguments = arguments
+        # (start, end or None) seconds kept of an input, by path
+        self.trims = trims or {}
+        # keyed by output file, a resumed batch may need fewer jobs so indices change
+        self.records = {}
+
+    @staticmethod
+    def default_path():
+        return os.path.join(constants.CACHE_DIRECTORY, "queue.json")
+
+    @staticmethod
+    def load(path: str):
+        """Read a saved queue, or None if there is none or it can't be read"""
+        try:
+            with open(path, "r", encoding="utf-8") as file:
+                data = json.load(file)
+            queue = JobQueue(path, EncodeSettings.from_dict(data["settings"]), list(data["inputs"]), data["arguments"],
+                             {input_file: tuple(trim) for input_file, trim in data.get("trims", {}).items()})
+            queue.records = dict(data["jobs"])
+        except (OSError, KeyError, TypeError, ValueError):
+            return None
+        try:
+            with open(queue.journal_path(), "r", encoding="utf-8") as file:
+                for line in file:
+                    try:
+                        output_file, record = json.loads(line)
+                    except (TypeError, ValueError):
+                        # the last line of a crash may be cut off
+                        continue
+                    queue.records[output_file] = record
+        except OSError:
+            pass
+        return queue
+
+    def journal_path(self):
+        return f"{self.path}.journal"
+
+    def save(self):
+        """Write the queue, replacing the old file atomically so a crash never leaves half of it"""
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as file:
+            json.dump({"settings": self.settings.to_dict(), "inputs": self.input_files,
+                       "arguments": self.arguments, "trims": self.trims, "jobs": self.records}, file)
+        os.replace(temp_path, self.path)
+        # the saved queue contains everything the journal did
+        try:
+            os.remove(self.journal_path())
+        except FileNotFoundError:
+            pass
+
+    def remove(self):
+        for path in [self.path, self.journal_path()]:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def is_finished(self):
+        return all(record["state"] == JobState.DONE.name for record in self.records.values())
+
+    def track(self, jobs: list):
+        """Start recording jobs, marking the ones finished by an earlier run as DONE
+
+        A job counts as finished only if it was recorded as done and its outputs are still
+        the files it wrote. Jobs that only fed finished ones, e.g. segments whose files the
+        concat removed, are finished too. Return the number of jobs restored this way, jobs
+        that are already done, e.g. from the output cache, are recorded as they are.
+        """
+        restored = 0
+        for job in jobs:
+            record = self.records.get(job.output_file)
+            if (job.state != JobState.DONE and record is not None and record["state"] == JobState.DONE.name
+                    and [record.get("identity")] + record.get("extra_identities", []) == output_identities(job)):
+                job.state = JobState.DONE
+                restored += 1
+        restored += skip_feeding_jobs(jobs)
+
+        self.records = {}
+        for job in jobs:
+            # checks write nothing, they run again with the job they check
+            if job.output_file:
+                self.records[job.output_file] = self.record(job)
+        self.save()
+        return restored
+
+    def update(self, job):
+        """Record the state of a job, appending it to the journal instead of writing the whole queue"""
+        if not job.output_file:
+            return
+        record = self.record(job)
+        self.records[job.output_file] = record
+        try:
+            with open(self.journal_path(), "a", encoding="utf-8") as file:
+                file.write(json.dumps([job.output_file, record]) + "\n")
+        except OSError:
+            # losing the queue only costs the ability to resume, never the batch itself
+            pass
+
+    def compact(self):
+        """Write the whole queue and drop the journal, done when the batch ends"""
+        try:
+            self.save()
+        except OSError:
+            pass
+
+    def record(self, job):
+        record = {"input": job.input_file, "state": job.state.name}
+        if job.state == JobState.DONE:
+            identities = output_identities(job)
+            record["identity"] = identities[0]
+            if job.extra_outputs:
+                record["extra_identities"] = identities[1:]
+            if job.degraded is not None:
+                record["degraded"] = job.degraded
+        return record
+
+
+def output_identities(job):
+    return [list(file_identity(output) or []) for output in [job.output_file] + job.extra_outputs]
@@ -0,0 +1,645 @@
+import heapq
+import os
+import signal
+import time
+
+from PySide6.QtCore import QObject, QProcess, QTimer, Signal
+
+import src.constants as constants
+from src.failures import classify_failure, faster_preset, preset_of, retry_delay
+from src.jobs import Job, JobState, SkipJob, dependents_of, temp_output_path
+from src.progress import PROGRESS_ARGUMENTS
+from src.remote import AgentConnection, RemoteProcess, default_token
+from src.system_load import LoadController, thread_count
+from src.throughput import critical_paths
+
+
+class JobRunner(QObject):
+    """Run a list of ffmpeg jobs with a bounded number of concurrent QProcess workers
+
+    Ready jobs start by priority, then in queue order, which is longest estimated chain
+    first, see estimate_jobs, until jobs are moved. A ready job of higher priority than a
+    local job that is running pauses it with SIGSTOP to take its worker, the paused job
+    continues where it stopped once a worker is free. Worker agents on other machines add
+    their capacity to the local workers. A job whose agent goes away runs again on another
+    worker, up to MAX_AGENT_RETRIES times. A job that failed for a reason that may pass, see
+    classify_failure, runs again after a backoff, up to MAX_JOB_RETRIES times.
+    """
+    job_started = Signal(int)
+    # the process of the job is running, some time after job_started
+    job_spawned = Signal(int)
+    job_stdout = Signal(int, str)
+    job_stderr = Signal(int, str)
+    job_finished = Signal(int, int)
+    all_finished = Signal()
+    # new worker count and why, only emitted when a load controller changes it
+    workers_changed = Signal(int, str)
+    # an agent connected, disconnected or refused the connection
+    agent_message = Signal(str)
+    # a running job was paused and why, and continued
+    job_paused = Signal(int, str)
+    job_resumed = Signal(int)
+    # a failed job runs again after a delay, and why
+    job_retrying = Signal(int, str)
+
+    def __init__(self, program: str, parent=None):
+        super().__init__(parent)
+        self.program = program
+        self.jobs = []
+        # estimated time left on the longest chain starting at each job
+        self.paths = {}
+        # job indices in the order ready jobs of the same priority start, and the
+        # (priority, -position) of each job, raised to that of the jobs waiting for it
+        self.queue_order = []
+        self.ranks = {}
+        # jobs waiting for each job, dependencies not done yet of every job, and the pending jobs
+        # whose dependencies are done as heaps of (-priority, position, index) by READY_KINDS
+        self.dependents = {}
+        self.waiting_for = {}
+        self.ready = {kind: [] for kind in READY_KINDS}
+        # paused jobs, True if the user paused it, False if a job of higher priority took its worker
+        self.paused = {}
+        # analysis jobs running in the slots besides the workers
+        self.analysis_slots = set()
+        self.max_workers = 1
+        self.processes = {}
+        self.is_running = False
+        self.report_progress = True
+        # give every ffmpeg job its share of the cores with -threads unless its arguments set one
+        self.limit_threads = True
+        self.cpu_count = os.cpu_count() or 1
+
+        self.load_controller = None
+        self.load_timer = QTimer(self)
+        self.load_timer.setInterval(constants.LOAD_SAMPLE_INTERVAL)
+        self.load_timer.timeout.connect(self.adjust_workers)
+
+        self.agents = []
+        # times each job lost its agent
+        self.lost_counts = {}
+        # end of the stderr of running jobs, times each failed job ran again, when the jobs waiting
+        # for their retry may start and the thread limit of jobs that ran out of resources
+        self.stderr_tails = {}
+        self.failure_counts = {}
+        self.retrying = {}
+        self.thread_limits = {}
+        self.retry_timer = QTimer(self)
+        self.retry_timer.setSingleShot(True)
+        self.retry_timer.timeout.connect(self.end_backoff)
+
+    def start(self, jobs: list, max_workers: int, load_controller: LoadController = None):
+        """Start running jobs, keeping at most max_workers processes alive
+
+        With a load controller max_workers is only the starting point, the controller
+        raises or lowers it while the batch runs.
+        """
+        self.jobs = jobs
+        self.paths = critical_paths(jobs)
+        self.queue_order = sorted((job.index for job in jobs), key=lambda index: (-self.paths.get(index, 0.0), index))
+        self.dependents = dependents_of(jobs)
+        self.waiting_for = {job.index: sum(1 for index in set(job.depends_on) if jobs[index].state != JobState.DONE)
+                            for job in jobs}
+        self.update_ranks()
+        self.max_workers = max(1, max_workers)
+        self.processes = {}
+        self.paused = {}
+        self.analysis_slots = set()
+        self.lost_counts = {}
+        self.stderr_tails = {}
+        self.failure_counts = {}
+        self.retrying = {}
+        self.thread_limits = {}
+        self.is_running = True
+        self.set_load_controller(load_controller)
+        for job in jobs:
+            if job.state in (JobState.FAILED, JobState.CANCELLED):
+                self.cancel_dependents(job)
+        self.fill_workers()
+
+    def set_max_workers(self, max_workers: int):
+        self.max_workers = max(1, max_workers)
+        if self.is_running:
+            self.fill_workers()
+
+    def set_load_controller(self, load_controller: LoadController = None):
+        """Let load_controller adjust the worker count, or keep it fixed if None or /proc can't be read"""
+        if load_controller is not None and not load_controller.is_supported():
+            load_controller = None
+        self.load_controller = load_controller
+        if self.is_running and load_controller is not None:
+            self.load_timer.start()
+        else:
+            self.load_timer.stop()
+
+    def set_agents(self, addresses: list, token: str = None):
+        """Dispatch jobs to the agents at addresses too, keeping the connections that stay
+
+        Raise ValueError for an invalid address.
+        """
+        token = default_token() if token is None else token
+        agents = []
+        for address in addresses:
+            agent = next((agent for agent in self.agents if agent.address == address and agent.token == token), None)
+            if agent is None:
+                agent = AgentConnection(address, token, self)
+                agent.connected.connect(lambda name, capacity, agent=agent: self.agent_message.emit(
+                    f"Agent {agent.address} ({name}) connected, running up to {capacity} jobs"))
+                agent.disconnected.connect(lambda reason, agent=agent: self.agent_message.emit(
+                    f"Agent {agent.address} disconnected: {reason}"))
+                agent.available.connect(self.handle_agent_available)
+                agent.open()
+            agents.append(agent)
+        for agent in self.agents:
+            if agent not in agents:
+                agent.close()
+                agent.deleteLater()
+        self.agents = agents
+
+    def handle_agent_available(self):
+        if self.is_running:
+            self.fill_workers()
+
+    def adjust_workers(self):
+        if not self.is_running or self.load_controller is None:
+            self.load_timer.stop()
+            return
+        workers, reason = self.load_controller.adjust(self.max_workers, self.local_count(),
+                                                      self.next_job() is not None)
+        if reason is not None:
+            self.set_max_workers(workers)
+            self.workers_changed.emit(workers, reason)
+
+    def cancel_all(self):
+        """Stop all running processes and drop the jobs still waiting"""
+        self.is_running = False
+        self.load_timer.stop()
+        self.retry_timer.stop()
+        for job in self.jobs:
+            if job.state in (JobState.PENDING, JobState.RUNNING):
+                job.state = JobState.CANCELLED
+        for index, process in list(self.processes.items()):
+            process.terminate()
+            # a stopped process only acts on the terminate signal once it continues
+            if index in self.paused:
+                send_signal(process, signal.SIGCONT)
+
+    def completed_count(self):
+        return sum(1 for job in self.jobs if job.is_finished())
+
+    def running_count(self):
+        return len(self.processes)
+
+    def local_count(self):
+        """Local workers in use, paused jobs leave theirs to others and analyses run besides them"""
+        return sum(1 for index, process in self.processes.items()
+                   if not isinstance(process, RemoteProcess) and index not in self.paused
+                   and index not in self.analysis_slots)
+
+    def update_ranks(self):
+        """Rank every job by priority and queue position, a job ranks at least as high as the jobs waiting for it"""
+        positions = {index: position for position, index in enumerate(self.queue_order)}
+        ranks = {job.index: (job.priority, -positions.get(job.index, job.index)) for job in self.jobs}
+        # dependencies always have smaller indices, so one pass from the end reaches every chain
+        for job in reversed(self.jobs):
+            for index in job.depends_on:
+                ranks[index] = max(ranks[index], ranks[job.index])
+        self.ranks = ranks
+
+        self.ready = {kind: [] for kind in READY_KINDS}
+        for job in self.jobs:
+            if job.state == JobState.PENDING and self.waiting_for.get(job.index, 0) == 0:
+                self.push_ready(job)
+
+    def push_ready(self, job: Job):
+        priority, position = self.ranks.get(job.index, (job.priority, -job.index))
+        heapq.heappush(self.ready[ready_kind(job)], (-priority, -position, job.index))
+
+    def next_job(self, is_remote: bool = False, is_analysis: bool = False):
+        """The ready job of the highest priority that comes first in the queue"""
+        kinds = ["analysis"] if is_analysis else ["remote"] if is_remote else READY_KINDS
+        best = None
+        for kind in kinds:
+            ready = self.ready[kind]
+            # jobs that started since they were pushed, or wait for their retry, leave the heap
+            while ready and (self.jobs[ready[0][2]].state != JobState.PENDING or ready[0][2] in self.retrying):
+                heapq.heappop(ready)
+            if ready and (best is None or ready[0] < best):
+                best = ready[0]
+        return self.jobs[best[2]] if best is not None else None
+
+    def complete_dependency(self, job: Job):
+        """Count job as done for the jobs waiting for it, the ones waiting for nothing else get ready"""
+        for index in self.dependents.get(job.index, []):
+            self.waiting_for[index] -= 1
+            if self.waiting_for[index] == 0 and self.jobs[index].state == JobState.PENDING:
+                self.push_ready(self.jobs[index])
+
+    def cancel_dependents(self, job: Job):
+        """Cancel the waiting jobs that depend on a failed or cancelled job, following chains of dependencies"""
+        blocked = list(self.dependents.get(job.index, []))
+        while blocked:
+            dependent = self.jobs[blocked.pop()]
+            if dependent.state == JobState.PENDING:
+                dependent.state = JobState.CANCELLED
+                self.job_finished.emit(dependent.index, -1)
+                blocked += self.dependents.get(dependent.index, [])
+
+    def next_waiting(self):
+        """The job a free local worker takes, a ready one or one paused for a job of higher priority
+
+        Of the same priority a paused job continues before a new one starts.
+        """
+        candidates = [self.jobs[index] for index, by_user in self.paused.items() if not by_user]
+        job = self.next_job()
+        if job is not None:
+            candidates.append(job)
+        return max(candidates, key=self.waiting_key, default=None)
+
+    def waiting_key(self, job: Job):
+        priority, position = self.ranks.get(job.index, (job.priority, -job.index))
+        return priority, job.index in self.paused, position
+
+    def is_pause_supported(self):
+        return hasattr(signal, "SIGSTOP")
+
+    def preempt_worker(self):
+        """Pause the local job of the lowest priority if a waiting job has a higher one, return True if paused"""
+        waiting = self.next_waiting()
+        if waiting is None or not self.is_pause_supported():
+            return False
+        running = [self.jobs[index] for index, process in self.processes.items()
+                   if index not in self.paused and index not in self.analysis_slots
+                   and not isinstance(process, RemoteProcess) and process.processId()]
+        victim = min(running, key=self.waiting_key, default=None)
+        if victim is None or self.ranks[victim.index][0] >= self.ranks[waiting.index][0]:
+            return False
+        return self.pause_job(victim.index, False, f"preempted by job {waiting.index + 1} of higher priority")
+
+    def pause_job(self, index: int, by_user: bool, reason: str):
+        process = self.processes.get(index)
+        if (process is None or isinstance(process, RemoteProcess) or not process.processId()
+                or not send_signal(process, signal.SIGSTOP)):
+            return False
+        self.paused[index] = by_user
+        self.job_paused.emit(index, reason)
+        return True
+
+    def resume_job(self, index: int):
+        process = self.processes.get(index)
+        if self.paused.pop(index, None) is not None and process is not None:
+            send_signal(process, signal.SIGCONT)
+            self.job_resumed.emit(index)
+
+    def set_priority(self, indices: list, priority: int):
+        """Change the priority of jobs, ready jobs of a higher one than a running job take its worker"""
+        for index in indices:
+            self.jobs[index].priority = priority
+        self.update_ranks()
+        if self.is_running:
+            self.fill_workers()
+
+    def move_jobs(self, indices: list, to_front: bool = True):
+        """Move jobs to the front or the back of the queue, keeping their order among themselves"""
+        indices = set(indices)
+        moved = [index for index in self.queue_order if index in indices]
+        rest = [index for index in self.queue_order if index not in indices]
+        self.queue_order = moved + rest if to_front else rest + moved
+        self.update_ranks()
+        if self.is_running:
+            self.fill_workers()
+
+    def pause_jobs(self, indices: list):
+        """Pause the running local jobs among indices until resume_jobs, return how many were paused"""
+        count = 0
+        for index in indices:
+            if index in self.paused:
+                # a preempted job stays paused until the user continues it
+                if not self.paused[index]:
+                    self.paused[index] = True
+                    count += 1
+            elif index in self.processes:
+                count += self.pause_job(index, True, "paused by the user")
+        if count and self.is_running:
+            self.fill_workers()
+        return count
+
+    def resume_jobs(self, indices: list):
+        """Let paused jobs continue once a worker is free for them, return how many there were"""
+        count = 0
+        for index in indices:
+            if self.paused.get(index):
+                self.paused[index] = False
+                count += 1
+        if count and self.is_running:
+            self.fill_workers()
+        return count
+
+    def job_node(self, index: int):
+        """Where a running job runs, "local" or the name of its agent"""
+        process = self.processes.get(index)
+        return process.connection.name if isinstance(process, RemoteProcess) else "local"
+
+    def retry_count(self, index: int):
+        return self.lost_counts.get(index, 0) + self.failure_counts.get(index, 0)
+
+    def free_agent(self):
+        """The connected agent with the most free slots, or None"""
+        agent = max(self.agents, key=lambda agent: agent.free_slots(), default=None)
+        return agent if agent is not None and agent.free_slots() > 0 else None
+
+    def fill_workers(self):
+        while self.is_running:
+            # analysis slots, then local workers, agents take the rest
+            job, agent = None, None
+            if len(self.analysis_slots) < constants.MAX_PARALLEL_ANALYSES:
+                job = self.next_job(is_analysis=True)
+                if job is not None:
+                    self.analysis_slots.add(job.index)
+            if job is None and self.local_count() >= self.max_workers:
+                self.preempt_worker()
+            if job is None and self.local_count() < self.max_workers:
+                job = self.next_waiting()
+            if job is None:
+                agent = self.free_agent()
+                job = self.next_job(is_remote=True) if agent is not None else None
+            if job is None:
+                break
+            if job.index in self.paused:
+                self.resume_job(job.index)
+            else:
+                self.start_job(job, agent)
+
+        if self.is_running and not self.processes and not self.retrying and self.next_job() is None:
+            self.is_running = False
+            self.load_timer.stop()
+            self.all_finished.emit()
+
+    def start_job(self, job: Job, agent: AgentConnection = None):
+        if job.prepare is not None:
+            try:
+                job.prepare(job)
+            except SkipJob:
+                self.analysis_slots.discard(job.index)
+                job.state = JobState.DONE
+                job.exit_code = 0
+                self.job_finished.emit(job.index, 0)
+                self.complete_dependency(job)
+                return
+            except (OSError, ValueError) as error:
+                self.job_stderr.emit(job.index, f"Failed to prepare job: {error}\n")
+                self.analysis_slots.discard(job.index)
+                job.state = JobState.FAILED
+                job.failure = f"failed to prepare: {error}"
+                job.exit_code = -1
+                self.job_finished.emit(job.index, -1)
+                self.cancel_dependents(job)
+                return
+
+        process = QProcess(self) if agent is None else RemoteProcess(agent, self)
+        process.readyReadStandardOutput.connect(lambda: self.handle_stdout(job, process))
+        process.readyReadStandardError.connect(lambda: self.handle_stderr(job, process))
+        process.finished.connect(lambda exit_code, exit_status: self.handle_finish(job, exit_code, exit_status))
+        process.errorOccurred.connect(lambda error: self.handle_error(job, error))
+        process.started.connect(lambda: self.job_spawned.emit(job.index))
+        if agent is not None:
+            process.lost.connect(lambda reason: self.handle_lost(job, process, reason))
+
+        job.state = JobState.RUNNING
+        self.processes[job.index] = process
+        self.job_started.emit(job.index)
+        if job.stdout_file is not None:
+            process.setStandardOutputFile(job.stdout_file)
+        if job.stderr_file is not None:
+            process.setStandardErrorFile(job.stderr_file)
+
+        if job.program is None:
+            # ffmpeg must never wait for an answer on stdin, e.g. to overwrite a file
+            arguments = (["-nostdin"] + (PROGRESS_ARGUMENTS if self.report_progress else [])
+                         + self.thread_arguments(self.temp_arguments(job), agent,
+                                                 {temp_output_path(output) for output in job.outputs()},
+                                                 self.thread_limits.get(job.index)))
+            process.start(self.program, arguments)
+        else:
+            process.start(job.program, job.arguments)
+
+    def temp_arguments(self, job: Job):
+        """Arguments writing to a temp file that is renamed once ffmpeg succeeded
+
+        An output name only appears when the file is complete, so a crashed or stopped
+        batch never leaves a truncated file that looks finished.
+        """
+        if not job.output_file or not job.arguments or job.arguments[-1] not in job.outputs():
+            return job.arguments
+        temp_paths = {output: temp_output_path(output) for output in job.outputs()}
+        for temp_path in temp_paths.values():
+            # a leftover of an interrupted run would make ffmpeg refuse to write
+            remove_file(temp_path)
+        return [temp_paths.get(argument, argument) for argument in job.arguments]
+
+    def thread_arguments(self, arguments: list, agent: AgentConnection = None, outputs: set = None,
+                         limit: int = None):
+        """Arguments with -threads for the outputs, so parallel encoders don't each take every core
+
+        The encoders of all outputs in the arguments, or of the last argument if none is
+        found, share the threads of the job, at most limit if given.
+        """
+        if not self.limit_threads or not arguments or "-threads" in arguments:
+            return arguments
+        if agent is not None:
+            threads = thread_count(agent.cpu_count, agent.capacity)
+        else:
+            # the last jobs of a batch run alone and get the cores the finished ones left
+            remaining = sum(1 for job in self.jobs if job.state in (JobState.PENDING, JobState.RUNNING))
+            threads = thread_count(self.cpu_count, min(self.max_workers, remaining))
+        if limit is not None:
+            threads = min(threads, limit)
+        positions = [i for i, argument in enumerate(arguments) if argument in (outputs or ())] or [len(arguments) - 1]
+        threads = max(1, threads // len(positions))
+        result = list(arguments)
+        for i in reversed(positions):
+            result[i:i] = ["-threads", str(threads)]
+        return result
+
+    def handle_stdout(self, job: Job, process: QProcess):
+        data = process.readAllStandardOutput().data().decode("utf-8", errors="replace")
+        self.job_stdout.emit(job.index, data)
+
+    def handle_stderr(self, job: Job, process: QProcess):
+        data = process.readAllStandardError().data().decode("utf-8", errors="replace")
+        self.stderr_tails[job.index] = (self.stderr_tails.get(job.index, "") + data)[-constants.MAX_STDERR_TAIL:]
+        self.job_stderr.emit(job.index, data)
+
+    def handle_finish(self, job: Job, exit_code: int, exit_status: QProcess.ExitStatus):
+        if exit_status != QProcess.NormalExit:
+            exit_code = -1
+        self.finish_job(job, exit_code)
+
+    def handle_error(self, job: Job, error: QProcess.ProcessError):
+        # finished is never emitted for a process that could not be started
+        if error == QProcess.FailedToStart:
+            job.failure = f"{job.program or self.program} could not be started"
+            self.finish_job(job, -1)
+
+    def handle_lost(self, job: Job, process: RemoteProcess, reason: str):
+        if self.processes.get(job.index) is not process:
+            return
+        self.lost_counts[job.index] = self.lost_counts.get(job.index, 0) + 1
+        is_retried = (self.is_running and job.state == JobState.RUNNING
+                      and self.lost_counts[job.index] <= constants.MAX_AGENT_RETRIES)
+        if not is_retried:
+            self.job_stderr.emit(job.index, f"Lost {reason}\n")
+            self.finish_job(job, -1)
+            return
+
+        # ffmpeg was stopped with its connection, the temp output is replaced when the job starts again
+        del self.processes[job.index]
+        process.deleteLater()
+        job.state = JobState.PENDING
+        self.push_ready(job)
+        self.job_stderr.emit(job.index, f"Lost {reason}, the job runs again\n")
+        self.fill_workers()
+
+    def finish_job(self, job: Job, exit_code: int):
+        process = self.processes.pop(job.index, None)
+        if process is None:
+            return
+        process.deleteLater()
+        self.paused.pop(job.index, None)
+        self.analysis_slots.discard(job.index)
+
+        job.exit_code = exit_code
+        if job.state == JobState.RUNNING:
+            job.state = JobState.DONE if exit_code == 0 else JobState.FAILED
+        for output in job.outputs() if job.program is None else []:
+            temp_path = temp_output_path(output)
+            if job.state != JobState.DONE:
+                remove_file(temp_path)
+            elif os.path.exists(temp_path):
+                try:
+                    os.replace(temp_path, output)
+                except OSError as error:
+                    self.job_stderr.emit(job.index, f"Failed to rename output: {error}\n")
+                    job.state = JobState.FAILED
+                    job.failure = f"failed to rename output: {error}"
+        stderr_tail = self.stderr_tails.pop(job.index, "")
+        if job.state != JobState.DONE and job.stderr_file is not None:
+            # the log of the job never saw this output, show why it failed
+            stderr_tail = read_tail(job.stderr_file)
+            self.job_stderr.emit(job.index, stderr_tail)
+        if job.state == JobState.DONE and job.on_done is not None:
+            try:
+                job.on_done(job)
+            except (OSError, ValueError) as error:
+                self.job_stderr.emit(job.index, f"Failed to finish job: {error}\n")
+                job.state = JobState.FAILED
+                job.failure = job.failure or str(error)
+        if job.state == JobState.FAILED and job.failure is None and self.retry_failed(job, stderr_tail):
+            return
+        self.job_finished.emit(job.index, exit_code)
+        if job.state == JobState.DONE:
+            self.complete_dependency(job)
+        else:
+            self.cancel_dependents(job)
+        self.fill_workers()
+
+    def retry_failed(self, job: Job, stderr_tail: str):
+        """Queue a job that failed for a reason that may pass again after a delay, return True if it was
+
+        A job that ran out of resources gets half the threads and a faster preset, job.degraded
+        tells which, its output is then not what the settings asked for. Once the retries are
+        used up, or for a fatal failure, job.failure tells why it failed.
+        """
+        failure = classify_failure(stderr_tail, job.exit_code)
+        attempt = self.failure_counts.get(job.index, 0) + 1
+        if not failure.is_retryable or attempt > constants.MAX_JOB_RETRIES or not self.is_running:
+            retries = f" after {attempt - 1} retries" if attempt > 1 else ""
+            job.failure = f"{failure.reason}{retries}"
+            return False
+
+        self.failure_counts[job.index] = attempt
+        changes = ""
+        if failure.needs_fewer_resources:
+            self.thread_limits[job.index] = max(1, self.job_threads(job) // 2)
+            changes = f" with {self.thread_limits[job.index]} threads"
+            preset, job.arguments = preset_of(job.arguments), faster_preset(job.arguments)
+            if preset_of(job.arguments) != preset:
+                job.degraded = f"preset lowered from {preset} to {preset_of(job.arguments)}"
+                changes += f" and the {preset_of(job.arguments)} preset"
+        delay = retry_delay(attempt)
+        job.state = JobState.PENDING
+        job.exit_code = None
+        self.retrying[job.index] = time.monotonic() + delay / 1000
+        self.job_retrying.emit(job.index, f"{failure.reason}, retry {attempt} of {constants.MAX_JOB_RETRIES} "
+                                          f"in {delay / 1000:g} s{changes}")
+        self.end_backoff()
+        return True
+
+    def end_backoff(self):
+        """Let the jobs whose backoff is over run again, and wake up for the next one"""
+        now = time.monotonic()
+        for index, due in self.retrying.items():
+            if due <= now and self.jobs[index].state == JobState.PENDING:
+                self.push_ready(self.jobs[index])
+        self.retrying = {index: due for index, due in self.retrying.items() if due > now}
+        if self.retrying:
+            self.retry_timer.start(max(1, int((min(self.retrying.values()) - now) * 1000)))
+        if self.is_running:
+            self.fill_workers()
+
+    def job_threads(self, job: Job):
+        """Threads the last run of a local job had"""
+        if job.index in self.thread_limits:
+            return self.thread_limits[job.index]
+        remaining = sum(1 for other in self.jobs if other.state in (JobState.PENDING, JobState.RUNNING)) + 1
+        return thread_count(self.cpu_count, min(self.max_workers, remaining))
+
+
+def remove_file(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def read_tail(path: str):
+    """Last MAX_STDERR_TAIL characters of a file, empty if it can't be read"""
+    try:
+        with open(path, "r", encoding="utf-8", errors="replace") as file:
+            return file.read()[-constants.MAX_STDERR_TAIL:]
+    except OSError:
+        return ""
+
+
+def send_signal(process: QProcess, signum: int):
+    """Send signum to a local process, return False if it is gone"""
+    pid = process.processId()
+    # pid 0 would signal our own process group
+    if pid <= 0:
+        return False
+    try:
+        os.kill(pid, signum)
+    except OSError:
+        return False
+    return True
+
+
+# ready jobs are kept apart by where they can run, analyses take their own slots
+READY_KINDS = ["analysis", "remote", "local"]
+
+
+def ready_kind(job: Job):
+    if job.is_analysis:
+        return "analysis"
+    return "remote" if is_remote_job(job) else "local"
+
+
+def is_remote_job(job: Job):
+    """Agents run ffmpeg only, other programs and captured output stay on this machine
+
+    So do jobs reading or writing files in the cache directory, e.g. two-pass statistics, an
+    agent only shares the inputs and outputs, not the home directory of this machine.
+    """
+    cache_directory = os.path.join(constants.CACHE_DIRECTORY, "")
+    return (job.program is None and job.stdout_file is None and job.stderr_file is None
+            and "-passlogfile" not in job.arguments
+            and not any(argument.startswith(cache_directory) for argument in job.arguments))
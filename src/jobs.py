@@ -0,0 +1,131 @@
+import os
+from dataclasses import dataclass, field
+from enum import Enum
+
+import src.constants as constants
+
+
+class SkipJob(Exception):
+    """Raised by the prepare of a job that turns out to have nothing to do"""
+
+
+class JobState(Enum):
+    PENDING = 1
+    RUNNING = 2
+    DONE = 3
+    FAILED = 4
+    CANCELLED = 5
+
+
+@dataclass
+class Job:
+    """One ffmpeg invocation in a batch"""
+    index: int
+    arguments: list
+    input_file: str = ""
+    output_file: str = ""
+    # further files written by the same invocation, e.g. the renditions of a ladder
+    extra_outputs: list = field(default_factory=list)
+    state: JobState = JobState.PENDING
+    exit_code: int = None
+    # expected media seconds written by the job and its share of the batch progress
+    duration: float = None
+    weight: float = None
+    # predicted wall seconds from the throughput history, longer jobs start first
+    estimated_time: float = None
+    # higher runs first, a ready job pauses running local jobs of a lower priority
+    priority: int = 0
+    # (start, end or None) seconds of the input a final job writes, None for all of it
+    trim: tuple = None
+    # indices of jobs that must be done before this one starts
+    depends_on: list = field(default_factory=list)
+    # program other than ffmpeg, e.g. ffprobe, and files that receive its stdout and stderr
+    program: str = None
+    stdout_file: str = None
+    stderr_file: str = None
+    # a cheap analysis writing no output, runs in one of the MAX_PARALLEL_ANALYSES slots besides the workers
+    is_analysis: bool = False
+    # index of the job whose output this one checks
+    verifies: int = None
+    # called with the job right before it starts and after it exited successfully,
+    # raising OSError or ValueError fails the job, SkipJob from prepare counts it as done
+    prepare: object = None
+    on_done: object = None
+    # decisions made while building the job, shown in the log when it starts
+    notes: list = field(default_factory=list)
+    # why the job failed when ffmpeg's exit code doesn't tell, e.g. its output failed verification
+    failure: str = None
+    # how a retry changed the options, e.g. a faster preset, the output isn't what the settings asked for
+    degraded: str = None
+
+    def outputs(self):
+        return [self.output_file] + self.extra_outputs if self.output_file else []
+
+    def is_finished(self):
+        return self.state in (JobState.DONE, JobState.FAILED, JobState.CANCELLED)
+
+    def is_ready(self, jobs: list):
+        return all(jobs[index].state == JobState.DONE for index in self.depends_on)
+
+
+def set_priorities(jobs: list, priorities: dict):
+    """Give every job of an input the priority of its path in priorities, 0 if not listed"""
+    for job in jobs:
+        job.priority = priorities.get(job.input_file, 0)
+
+
+def dependents_of(jobs: list):
+    """Map the index of every job to the indices of the jobs depending on it"""
+    dependents = {job.index: [] for job in jobs}
+    for job in jobs:
+        for index in set(job.depends_on):
+            dependents[index].append(job.index)
+    return dependents
+
+
+def skip_feeding_jobs(jobs: list):
+    """Mark pending jobs whose dependents are all done as DONE, return how many
+
+    Follows chains such as keyframe index -> segments -> concat, so the intermediate jobs of
+    an output that is already in place don't run again.
+    """
+    dependents = dependents_of(jobs)
+    # dependents not done yet of every job something depends on
+    remaining = {index: sum(1 for other in others if jobs[other].state != JobState.DONE)
+                 for index, others in dependents.items() if others}
+    ready = [index for index, count in remaining.items() if count == 0]
+    skipped = 0
+    while ready:
+        job = jobs[ready.pop()]
+        if job.state != JobState.PENDING:
+            continue
+        job.state = JobState.DONE
+        skipped += 1
+        for index in set(job.depends_on):
+            remaining[index] -= 1
+            if remaining[index] == 0:
+                ready.append(index)
+    return skipped
+
+
+def temp_output_path(output_file: str):
+    """Name a job writes to until it succeeded, keeping the extension that picks the muxer"""
+    root, extension = os.path.splitext(output_file)
+    return f"{root}.part{extension}"
+
+
+def video_encoder_from_arguments(arguments: list):
+    """Return the value of the last -c:v/-vcodec option, or None if not given"""
+    encoder = None
+    for i, argument in enumerate(arguments[:-1]):
+        if argument in ("-c:v", "-vcodec", "-codec:v"):
+            encoder = arguments[i + 1]
+    return encoder
+
+
+def default_worker_count(encoder: str = None, cpu_count: int = None):
+    """Pick how many ffmpeg processes to run at once for the given encoder"""
+    if cpu_count is None:
+        cpu_count = os.cpu_count() or 1
+    threads = constants.ENCODER_THREAD_USAGE.get(encoder, constants.DEFAULT_ENCODER_THREAD_USAGE)
+    return max(1, min(cpu_count // threads, constants.MAX_PARALLEL_JOBS))
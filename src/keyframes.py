@@ -0,0 +1,130 @@
+import bisect
+import hashlib
+import os
+
+import src.constants as constants
+from src.jobs import Job
+from src.probe import file_identity
+
+
+# the layout of the cached index, entries of another version are indexed again
+INDEX_VERSION = 2
+
+
+def keyframe_arguments(path: str):
+    """ffprobe arguments listing the timestamp and flags of every video packet and the start time, without decoding"""
+    return ["-v", "error", "-select_streams", "v:0", "-show_entries", "packet=pts_time,flags:format=start_time",
+            "-of", "csv=print_section=1", path]
+
+
+def parse_keyframes(output: str):
+    """Return the sorted keyframe timestamps in ffprobe's csv output, relative to the start of the input
+
+    An input -ss counts from the start time of the container, e.g. 1.4s for many MPEG-TS files,
+    so the packet timestamps are shifted by it to be usable as seek positions.
+    """
+    keyframes = []
+    start_time = 0.0
+    for line in output.splitlines():
+        section, _, values = line.partition(",")
+        try:
+            if section == "format":
+                start_time = float(values)
+            elif section == "packet":
+                pts_time, _, flags = values.partition(",")
+                if "K" in flags:
+                    keyframes.append(float(pts_time))
+        except ValueError:
+            # packets or inputs without timestamp are written as N/A
+            continue
+    keyframes.sort()
+    return [keyframe - start_time for keyframe in keyframes]
+
+
+def nearest_keyframe(keyframes: list, position: float):
+    """Return the keyframe closest to position, or position itself without keyframes"""
+    if not keyframes:
+        return position
+    i = bisect.bisect_left(keyframes, position)
+    candidates = keyframes[max(0, i - 1):i + 1]
+    return min(candidates, key=lambda keyframe: abs(keyframe - position))
+
+
+class KeyframeCache:
+    """On-disk keyframe index per input, one csv file per path, size and mtime"""
+
+    def __init__(self, directory: str = None, max_entries: int = constants.KEYFRAME_CACHE_SIZE):
+        self.directory = directory or os.path.join(constants.CACHE_DIRECTORY, "keyframes")
+        self.max_entries = max_entries
+        self.loaded = {}
+
+    def entry_path(self, path: str):
+        """Cache file of the current version of path, or None if it can't be read"""
+        identity = file_identity(path)
+        if identity is None:
+            return None
+        key = hashlib.sha1(f"{path}|{identity[0]}|{identity[1]}|{INDEX_VERSION}".encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, f"{key}.csv")
+
+    def get(self, path: str):
+        """Return the cached keyframe list of path, or None if it was not indexed yet"""
+        entry_path = self.entry_path(path)
+        if entry_path is None:
+            return None
+        if entry_path not in self.loaded:
+            try:
+                with open(entry_path, "r", encoding="utf-8") as file:
+                    self.loaded[entry_path] = parse_keyframes(file.read())
+            except OSError:
+                return None
+            os.utime(entry_path)
+        return self.loaded[entry_path]
+
+    def build_index_job(self, index: int, path: str, ffprobe: str = constants.DEFAULT_FFPROBE_PATH):
+        """Job that runs ffprobe into a temp file and moves it into the cache when done"""
+        entry_path = self.entry_path(path)
+        if entry_path is None:
+            raise ValueError(f"Can't read {path}")
+        os.makedirs(self.directory, exist_ok=True)
+        temp_path = f"{entry_path}.tmp"
+
+        def on_done(job: Job):
+            os.replace(temp_path, entry_path)
+            self.prune()
+
+        return Job(index=index, arguments=keyframe_arguments(path), input_file=path, output_file=entry_path,
+                   weight=0.0, program=ffprobe, stdout_file=temp_path, on_done=on_done)
+
+    def prune(self):
+        """Remove the least recently used index files above the size limit"""
+        try:
+            entries = [os.path.join(self.directory, name) for name in os.listdir(self.directory)
+                       if name.endswith(".csv")]
+        except OSError:
+            return
+        if len(entries) <= self.max_entries:
+            return
+        entries.sort(key=lambda entry: os.path.getmtime(entry))
+        for entry in entries[:len(entries) - self.max_entries]:
+            self.loaded.pop(entry, None)
+            try:
+                os.remove(entry)
+            except OSError:
+                pass
+
+
+def scan_keyframes(path: str, cache: KeyframeCache, ffprobe: str = constants.DEFAULT_FFPROBE_PATH):
+    """Index the keyframes of path synchronously unless they are cached, raise RuntimeError on failure"""
+    keyframes = cache.get(path)
+    if keyframes is not None:
+        return keyframes
+
+    import subprocess
+
+    job = cache.build_index_job(0, path, ffprobe)
+    with open(job.stdout_file, "w", encoding="utf-8") as file:
+        result = subprocess.run([ffprobe] + job.arguments, stdout=file, stderr=subprocess.PIPE, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip() or f"ffprobe exited with code {result.returncode}")
+    job.on_done(job)
+    return cache.get(path)
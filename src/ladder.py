@@ -0,0 +1,91 @@
+import os
+from dataclasses import dataclass
+
+from src.jobs import Job
+
+
+@dataclass
+class Rendition:
+    """One output of an encoding ladder"""
+    # appended to the output name, e.g. movie-720p.mp4
+    name: str
+    # scale filter size, e.g. -2:720
+    scale: str
+    # video bit rate in kb/s, None keeps the rate control of the settings
+    bitrate: str = None
+
+
+def parse_renditions(text: str):
+    """Parse "720p=-2:720@2800, 480p=-2:480" into renditions, raise ValueError if it's invalid"""
+    renditions = []
+    for entry in text.split(","):
+        entry = entry.strip()
+        if not entry:
+            continue
+        name, separator, rest = entry.partition("=")
+        scale, _, bitrate = rest.partition("@")
+        name, scale, bitrate = name.strip(), scale.strip(), bitrate.strip()
+        if not separator or not name or any(character in name for character in "/\\:"):
+            raise ValueError(f"Invalid rendition {entry}, expected NAME=WIDTH:HEIGHT[@KBPS]")
+        width, _, height = scale.partition(":")
+        try:
+            int(width), int(height)
+            if bitrate and int(bitrate) <= 0:
+                raise ValueError
+        except ValueError:
+            raise ValueError(f"Invalid rendition {entry}, expected NAME=WIDTH:HEIGHT[@KBPS]")
+        if any(rendition.name == name for rendition in renditions):
+            raise ValueError(f"Rendition {name} is listed twice")
+        renditions.append(Rendition(name, scale, bitrate or None))
+    if not renditions:
+        raise ValueError("An encoding ladder needs at least one rendition")
+    return renditions
+
+
+def rendition_output_path(output_file: str, name: str):
+    root, extension = os.path.splitext(output_file)
+    return f"{root}-{name}{extension}"
+
+
+def rendition_video_arguments(video_arguments: list, rendition: Rendition):
+    """Video options of one rendition, its own bit rate replaces the CRF or bit rate of the settings"""
+    if rendition.bitrate is None:
+        return list(video_arguments)
+    result = []
+    skip = False
+    for argument in video_arguments:
+        if skip:
+            skip = False
+        elif argument in ("-crf", "-b:v"):
+            skip = True
+        else:
+            result.append(argument)
+    return result + ["-b:v", f"{rendition.bitrate}k"]
+
+
+def build_ladder_job(index: int, input_file: str, output_file: str, renditions: list, video_arguments: list,
+                     audio_arguments: list, container_arguments: list, duration: float = None):
+    """One job writing every rendition of an input, the input is read and decoded only once
+
+    The decoded video is split into a scaled branch per rendition, each encoded into its
+    own output. video_arguments must not scale, the branches do that.
+    """
+    count = len(renditions)
+    if count == 1:
+        graph = f"[0:v:0]scale={renditions[0].scale}[v0]"
+    else:
+        graph = (f"[0:v:0]split={count}" + "".join(f"[s{i}]" for i in range(count)) + ";"
+                 + ";".join(f"[s{i}]scale={rendition.scale}[v{i}]" for i, rendition in enumerate(renditions)))
+
+    arguments = ["-i", input_file, "-filter_complex", graph]
+    outputs = []
+    for i, rendition in enumerate(renditions):
+        path = rendition_output_path(output_file, rendition.name)
+        outputs.append(path)
+        arguments += (["-map", f"[v{i}]", "-map", "0:a:0?"] + rendition_video_arguments(video_arguments, rendition)
+                      + container_arguments + audio_arguments + [path])
+
+    # the first rendition names the job, the runner writes and renames the others with it
+    return Job(index=index, arguments=arguments, input_file=input_file, output_file=outputs[0],
+               extra_outputs=outputs[1:], duration=duration,
+               notes=[f"Ladder: {', '.join(rendition.name for rendition in renditions)} from one decode"])
@@ -0,0 +1,63 @@
+import datetime
+from collections import deque
+
+from PySide6.QtCore import QObject, QTimer
+from PySide6.QtWidgets import QPlainTextEdit
+
+import src.constants as constants
+from src.utils import LOG_LEVEL
+
+
+class LogSink(QObject):
+    """Buffer log lines and flush them in batches into a QPlainTextEdit with a line limit"""
+
+    def __init__(self, editor: QPlainTextEdit, max_lines: int = constants.LOG_MAX_LINES,
+                 flush_interval: int = constants.LOG_FLUSH_INTERVAL, parent=None):
+        super().__init__(parent)
+        self.editor = editor
+        self.min_level = LOG_LEVEL.DEBUG
+        # lines older than what the editor can hold are never shown, so don't keep them
+        self.pending = deque(maxlen=max_lines)
+        self.set_max_lines(max_lines)
+
+        self.flush_timer = QTimer(self)
+        self.flush_timer.setSingleShot(True)
+        self.flush_timer.setInterval(flush_interval)
+        self.flush_timer.timeout.connect(self.flush)
+
+    def set_max_lines(self, max_lines: int):
+        self.editor.setMaximumBlockCount(max_lines)
+        self.pending = deque(self.pending, maxlen=max_lines)
+
+    def set_min_level(self, level: LOG_LEVEL):
+        self.min_level = level
+
+    def write(self, level: LOG_LEVEL, message: str):
+        """Queue a timestamped message if its level passes the filter"""
+        if level.value < self.min_level.value:
+            return
+        self.pending.append(f"{datetime.datetime.now()}  [{level.name}]  \t{message}")
+        self.schedule_flush()
+
+    def write_raw(self, level: LOG_LEVEL, data: str):
+        """Queue raw process output as is, dropping empty lines"""
+        if level.value < self.min_level.value:
+            return
+        for line in data.splitlines():
+            if line.strip():
+                self.pending.append(line)
+        self.schedule_flush()
+
+    def schedule_flush(self):
+        if not self.flush_timer.isActive():
+            self.flush_timer.start()
+
+    def flush(self):
+        if not self.pending:
+            return
+        self.editor.appendPlainText("\n".join(self.pending))
+        self.pending.clear()
+
+    def clear(self):
+        self.pending.clear()
+        self.editor.clear()
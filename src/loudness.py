@@ -0,0 +1,159 @@
+import hashlib
+import json
+import math
+import os
+import re
+
+import src.constants as constants
+from src.jobs import Job
+from src.probe import file_identity
+from src.trim import trim_input_arguments, trimmed_duration
+
+# options of the second loudnorm pass and the values of the first one they take
+MEASURED_OPTIONS = {"measured_I": "input_i", "measured_TP": "input_tp", "measured_LRA": "input_lra",
+                    "measured_thresh": "input_thresh", "offset": "target_offset"}
+
+
+def loudnorm_filter(target: str):
+    """loudnorm towards target LUFS, on its own it normalizes dynamically in one pass"""
+    return f"loudnorm=I={target}:TP={constants.LOUDNORM_TRUE_PEAK}:LRA={constants.LOUDNORM_RANGE}"
+
+
+def parse_measurement(text: str):
+    """Values of the json loudnorm prints when it's done, None for a silent input
+
+    Raise ValueError if the text contains no measurement.
+    """
+    matches = re.findall(r"\{[^{}]*\"input_i\"[^{}]*\}", text)
+    if not matches:
+        raise ValueError("ffmpeg printed no loudness measurement")
+    try:
+        data = json.loads(matches[-1])
+        measurement = {option: data[name] for option, name in MEASURED_OPTIONS.items()}
+        # silence measures -inf, there is nothing to normalize
+        if not all(math.isfinite(float(value)) for value in measurement.values()):
+            return None
+    except (KeyError, TypeError, ValueError):
+        raise ValueError("ffmpeg printed an incomplete loudness measurement")
+    return measurement
+
+
+def apply_measurement(arguments: list, measurement: dict):
+    """arguments with every loudnorm filter turned into a linear second pass over measurement"""
+    options = "".join(f":{option}={value}" for option, value in measurement.items()) + ":linear=true"
+    return [f"{argument.split(':measured_I=')[0]}{options}"
+            if i > 0 and arguments[i - 1] == "-af" and argument.startswith("loudnorm=") else argument
+            for i, argument in enumerate(arguments)]
+
+
+def has_loudnorm(arguments: list):
+    return any(argument.startswith("loudnorm=") for argument in arguments)
+
+
+def measured_stream_map(stream: int = None):
+    """-map value of the audio stream the first pass measures, the first one unless a probe picked another"""
+    return f"0:{stream}" if stream is not None else "0:a:0"
+
+
+def map_measured_stream(arguments: list, input_file: str, stream: int = None):
+    """arguments encoding the audio stream the first pass measured, unchanged if they map streams already"""
+    if "-map" in arguments:
+        return arguments
+    position = next((i + 2 for i, argument in enumerate(arguments[:-1])
+                     if argument == "-i" and arguments[i + 1] == input_file), None)
+    if position is None:
+        return arguments
+    return arguments[:position] + ["-map", "0:v:0?", "-map", measured_stream_map(stream)] + arguments[position:]
+
+
+class LoudnessCache:
+    """First pass loudnorm measurements per input, target and trim, one JSON file each"""
+
+    def __init__(self, directory: str = None, max_entries: int = constants.LOUDNESS_CACHE_SIZE):
+        self.directory = directory or os.path.join(constants.CACHE_DIRECTORY, "loudness")
+        self.max_entries = max_entries
+
+    def entry_path(self, path: str, target: str, trim: tuple = None, stream: int = None):
+        """File of the measurement of path, or None if it can't be read"""
+        identity = file_identity(path)
+        if identity is None:
+            return None
+        key = "|".join([path, str(identity[0]), str(identity[1]), loudnorm_filter(target),
+                        repr(trim) if trim is not None else "", measured_stream_map(stream)])
+        return os.path.join(self.directory, f"{hashlib.sha1(key.encode('utf-8')).hexdigest()}.json")
+
+    def has(self, entry: str):
+        return os.path.exists(entry)
+
+    def build_measure_job(self, index: int, input_file: str, entry: str, target: str, trim: tuple = None,
+                          duration: float = None, stream: int = None):
+        """Analysis job running the first loudnorm pass over the audio only, its result is cached"""
+        os.makedirs(self.directory, exist_ok=True)
+        log_path = f"{entry}.log"
+
+        def on_done(job: Job):
+            with open(log_path, "r", encoding="utf-8", errors="replace") as file:
+                measurement = parse_measurement(file.read())
+            os.remove(log_path)
+            temp_path = f"{entry}.tmp"
+            with open(temp_path, "w", encoding="utf-8") as file:
+                json.dump(measurement or {}, file)
+            os.replace(temp_path, entry)
+            self.prune()
+
+        if trim is not None:
+            duration = trimmed_duration(trim, duration)
+        arguments = ((trim_input_arguments(*trim) if trim is not None else [])
+                     + ["-i", input_file, "-map", measured_stream_map(stream),
+                        "-af", f"{loudnorm_filter(target)}:print_format=json", "-f", "null", os.devnull])
+        # decoding the audio alone is a small share of the work
+        return Job(index=index, arguments=["-y"] + arguments, input_file=input_file, output_file=entry,
+                   duration=duration, weight=duration * 0.05 if duration else None, stderr_file=log_path,
+                   is_analysis=True, on_done=on_done,
+                   notes=["Loudness: measuring the audio, the result is cached for later runs"])
+
+    def apply(self, job: Job, entry: str):
+        """Give the loudnorm filters of job the cached measurement, raise OSError if it was removed"""
+        with open(entry, "r", encoding="utf-8") as file:
+            measurement = json.load(file)
+        os.utime(entry)
+        if measurement:
+            job.arguments = apply_measurement(job.arguments, measurement)
+
+    def prune(self):
+        """Remove the least recently used measurements above the size limit"""
+        try:
+            entries = [os.path.join(self.directory, name) for name in os.listdir(self.directory)
+                       if name.endswith(".json")]
+            if len(entries) <= self.max_entries:
+                return
+            entries.sort(key=os.path.getmtime)
+        except OSError:
+            return
+        for entry in entries[:len(entries) - self.max_entries]:
+            try:
+                os.remove(entry)
+            except OSError:
+                pass
+
+
+def add_loudness_measurements(jobs: list, entries: dict, cache: LoudnessCache):
+    """Make the jobs normalizing an input in entries wait for its measurement and apply it when they start
+
+    entries maps input paths to (measurement file, indices of the jobs measuring it, measured
+    stream). Jobs that leave the choice of streams to ffmpeg get the measured audio stream mapped.
+    """
+    for job in jobs:
+        if job.is_analysis or job.input_file not in entries or not has_loudnorm(job.arguments):
+            continue
+        entry, depends_on, stream = entries[job.input_file]
+        job.depends_on = job.depends_on + depends_on
+        job.arguments = map_measured_stream(job.arguments, job.input_file, stream)
+        if not depends_on:
+            job.notes = job.notes + ["Loudness: reusing the cached measurement"]
+
+        def prepare(job: Job, entry=entry, prepare=job.prepare):
+            if prepare is not None:
+                prepare(job)
+            cache.apply(job, entry)
+        job.prepare = prepare
@@ -1,21 +1,35 @@
-import datetime
-from src.utils import *
+from src.utils import LOG_LEVEL, support_crf
 import src.constants as constants
-from PySide6.QtCore import (QDateTime, QDir, QLibraryInfo, QSysInfo, Qt,
-                            QTimer, Slot, qVersion, QProcess)
-from PySide6.QtGui import (QCursor, QDesktopServices, QGuiApplication, QIcon,
-                           QKeySequence, QShortcut, QStandardItem,
-                           QStandardItemModel, QIntValidator, QDoubleValidator)
-from PySide6.QtWidgets import (QApplication, QCheckBox, QComboBox,
-                               QCommandLinkButton, QDateTimeEdit, QDial,
-                               QDialog, QDialogButtonBox, QFileSystemModel,
-                               QGridLayout, QGroupBox, QHBoxLayout, QLabel,
-                               QLineEdit, QListView, QMenu, QPlainTextEdit,
-                               QProgressBar, QPushButton, QRadioButton,
-                               QScrollBar, QSizePolicy, QSlider, QSpinBox,
-                               QStyleFactory, QTableWidget, QTabWidget,
-                               QTextBrowser, QTextEdit, QToolBox, QToolButton,
-                               QTreeView, QVBoxLayout, QWidget, QFileDialog, QFrame, QMessageBox)
+from src.jobs import JobState, default_worker_count, set_priorities, video_encoder_from_arguments
+from src.settings import (EncodeSettings, build_arguments, build_command_line, build_jobs, ignored_by_edited_command,
+                          parse_command_line)
+from src.job_runner import JobRunner
+from src.system_load import LoadController
+from src.remote import parse_addresses
+from src.progress import BatchProgress, format_seconds
+from src.probe_service import ProbeService
+from src.keyframes import KeyframeCache
+from src.output_cache import OutputCache, output_key_arguments, reuse_outputs
+from src.verify import add_verify_jobs, reject_unverified
+from src.log_sink import LogSink
+from src.job_logs import JobLogWriter
+from src.job_queue import JobQueue
+from src.metrics import BatchMetrics, MetricsRegistry, MetricsServer
+from src.throughput import ThroughputHistory, estimate_jobs, estimate_makespan
+from src.file_list_model import DirectoryScanner, FileListModel
+from src.sample_service import SampleEstimator
+from src.thumbnail_service import CONTACT_SHEET_LAYOUT, THUMBNAIL_LAYOUT, ThumbnailService
+from src.trim import format_trim, parse_trim
+from PySide6.QtCore import QObject, QSize, QTimer, Signal, Slot
+from PySide6.QtGui import QIntValidator, QDoubleValidator, QPixmap
+from PySide6.QtWidgets import (QCheckBox, QComboBox, QGridLayout, QGroupBox, QHBoxLayout,
+                               QLabel, QLineEdit, QListView, QPlainTextEdit, QProgressBar,
+                               QPushButton, QSpinBox, QTabWidget, QVBoxLayout, QWidget,
+                               QFileDialog, QFrame, QMessageBox)
+
+
+class MySignal(QObject):
+    update_signal = Signal(int)
 
 
 class MainWindow(QWidget):
@@ -28,6 +42,16 @@ class MainWindow(QWidget):
         self.is_started = False
         self.jobs = -1
         self.completed_jobs = -1
+        self.job_logs = None
+        self.job_queue = None
+        self.batch_media = {}
+        # priority of the jobs of each file, files not listed are Normal
+        self.file_priorities = {}
+        # (start, end or None) seconds kept of each trimmed file
+        self.file_trims = {}
+        self.directory_scanner = None
+        # the command editor was changed by hand, its options then replace the settings
+        self.command_edited = False
         self.signal = MySignal()
 
         input_files_groupbox = self.create_input_files_groupbox()
@@ -46,6 +70,20 @@ class MainWindow(QWidget):
 
         # use signal to update ui
         self.signal.update_signal.connect(self.update_ui)
+        self.update_command_line()
+
+        # started once the log exists to report a port that is taken
+        if constants.METRICS_HTTP_PORT:
+            try:
+                self.metrics_server = MetricsServer(self.metrics_registry, constants.METRICS_HTTP_PORT)
+            except OSError as error:
+                self.print_log(LOG_LEVEL.WARNING.name, f"Metrics endpoint disabled: {error}")
+
+        # offer to continue a batch that was stopped or crashed
+        saved_queue = JobQueue.load(JobQueue.default_path())
+        if saved_queue is not None and not saved_queue.is_finished():
+            self.resume_button.setEnabled(True)
+            self.print_log(LOG_LEVEL.INFO.name, f"An unfinished batch of {len(saved_queue.input_files)} files can be resumed")
 
     @Slot()
     def update_ui(self):
@@ -53,7 +91,9 @@ class MainWindow(QWidget):
         if self.is_started and self.completed_jobs == self.jobs:
             self.is_started = False
             self.start_button.setEnabled(self.file_model.rowCount() > 0)
+            self.estimate_button.setEnabled(self.file_model.rowCount() > 0)
             self.stop_button.setEnabled(False)
+            self.set_queue_controls_enabled(False)
             self.update_progress_bar()
             self.print_log(LOG_LEVEL.INFO.name, "Work done")
             return
@@ -64,15 +104,21 @@ class MainWindow(QWidget):
         else:
             # if work is not start yet, enable button if there are files as input
             self.start_button.setEnabled(self.file_model.rowCount() > 0)
+            self.estimate_button.setEnabled(self.file_model.rowCount() > 0 or self.sample_estimator.is_running())
 
     def create_input_files_groupbox(self):
         """Create input files Groupbox"""
         result = QGroupBox("Input Files")
 
-        self.file_model = QStandardItemModel()
+        self.file_model = FileListModel(self)
+        self.file_model.decoration_provider = self.file_thumbnail
 
-        # create file list view
+        # create file list view, uniform rows let it skip measuring every path and
+        # only ask the visible rows for their thumbnails
         self.file_list_view = QListView()
+        self.file_list_view.setUniformItemSizes(True)
+        self.file_list_view.setIconSize(QSize(constants.THUMBNAIL_WIDTH, constants.THUMBNAIL_HEIGHT))
+        self.file_list_view.setSelectionMode(QListView.ExtendedSelection)
         self.file_list_view.setModel(self.file_model)
         self.file_list_view.selectionModel().selectionChanged.connect(self.handle_selection)
 
@@ -80,6 +126,10 @@ class MainWindow(QWidget):
         add_file_button = QPushButton("Add File")
         add_file_button.clicked.connect(self.add_files)
 
+        # create add folder button, scans subfolders too
+        self.add_folder_button = QPushButton("Add Folder")
+        self.add_folder_button.clicked.connect(self.add_folder)
+
         # create delete button
         delete_file_button = QPushButton("Delete File")
         delete_file_button.clicked.connect(self.delete_files)
@@ -88,10 +138,25 @@ class MainWindow(QWidget):
         self.file_info_button.setEnabled(False)
         self.file_info_button.clicked.connect(self.show_file_info)
 
-        self.file_info_process = QProcess()
-        self.file_info_process.readyReadStandardOutput.connect(self.handle_file_info_stdout)
-        self.file_info_process.readyReadStandardError.connect(self.handle_file_info_stderr)
-        self.file_info_process.finished.connect(self.handle_file_info_finish)
+        self.contact_sheet_button = QPushButton("Contact Sheet")
+        self.contact_sheet_button.setEnabled(False)
+        self.contact_sheet_button.clicked.connect(self.show_contact_sheet)
+
+        # probe added files in background, File Info reads from the same cache
+        self.file_info_requests = set()
+        self.probe_service = ProbeService(parent=self)
+        self.keyframe_cache = KeyframeCache()
+        self.output_cache = OutputCache()
+        self.throughput_history = ThroughputHistory()
+        self.probe_service.probed.connect(self.handle_probe_finish)
+        self.probe_service.failed.connect(self.handle_probe_fail)
+
+        # thumbnails of the visible rows and contact sheets, rendered in background
+        self.contact_sheet_requests = set()
+        self.contact_sheet_window = None
+        self.thumbnail_service = ThumbnailService(constants.DEFAULT_FFMPEG_PATH, parent=self)
+        self.thumbnail_service.ready.connect(self.handle_thumbnail_ready)
+        self.thumbnail_service.failed.connect(self.handle_thumbnail_fail)
 
         # create clear All button
         clear_file_button = QPushButton("Clear All Files")
@@ -100,105 +165,296 @@ class MainWindow(QWidget):
         # create bottom button layout
         bottom_layout = QHBoxLayout()
         bottom_layout.addWidget(add_file_button)
+        bottom_layout.addWidget(self.add_folder_button)
         bottom_layout.addWidget(delete_file_button)
         bottom_layout.addWidget(self.file_info_button)
+        bottom_layout.addWidget(self.contact_sheet_button)
         bottom_layout.addStretch(1)
         bottom_layout.addWidget(clear_file_button)
 
+        # create trim boxes, the in and out points of the selected files
+        self.trim_start = QLineEdit()
+        self.trim_start.setPlaceholderText("0:00:00")
+        trim_start_label = QLabel("Trim In:")
+        trim_start_label.setBuddy(self.trim_start)
+        self.trim_end = QLineEdit()
+        self.trim_end.setPlaceholderText("end")
+        trim_end_label = QLabel("Out:")
+        trim_end_label.setBuddy(self.trim_end)
+        set_trim_button = QPushButton("Set Trim")
+        set_trim_button.setToolTip("Keep only this range of the selected files, in seconds or HH:MM:SS. When the "
+                                   "video is copied only the partial groups of pictures at the cuts are encoded")
+        set_trim_button.clicked.connect(self.set_trim)
+        clear_trim_button = QPushButton("Clear Trim")
+        clear_trim_button.clicked.connect(self.clear_trim)
+
+        # trim layout
+        trim_layout = QHBoxLayout()
+        trim_layout.addWidget(trim_start_label)
+        trim_layout.addWidget(self.trim_start)
+        trim_layout.addWidget(trim_end_label)
+        trim_layout.addWidget(self.trim_end)
+        trim_layout.addWidget(set_trim_button)
+        trim_layout.addWidget(clear_trim_button)
+        trim_layout.addStretch(1)
+
         # create main layout
         main_layout = QVBoxLayout(result)
         main_layout.addWidget(self.file_list_view)
         main_layout.addLayout(bottom_layout)
+        main_layout.addLayout(trim_layout)
 
         return result
 
     @Slot()
     def handle_selection(self):
         self.file_info_button.setEnabled(True)
+        self.contact_sheet_button.setEnabled(True)
 
     @Slot()
     def add_files(self):
         """Add new files into file list"""
         file_filter = "Video Files (*.mp4 *.avi *.mkv *.mov *.flv *.wmv)"
         file_paths, _ = QFileDialog.getOpenFileNames(self, 'Select file', '', file_filter)
+        self.add_file_paths(file_paths)
 
-        # Create set for exists files
-        item_set = set()
-        for row in range(self.file_model.rowCount()):
-            item_text = self.file_model.item(row, 0).text()
-            item_set.add(item_text)
+    def add_file_paths(self, file_paths: list):
+        new_file_paths = self.file_model.add_paths(file_paths)
+        if len(new_file_paths) == 1:
+            self.print_log(LOG_LEVEL.INFO.name, f"Add file {new_file_paths[0]}")
+        elif new_file_paths:
+            self.print_log(LOG_LEVEL.INFO.name, f"Add {len(new_file_paths)} files")
 
-        for file_path in file_paths:
-            if file_path not in item_set:
-                item = QStandardItem(file_path)
-                self.file_model.appendRow(item)
-                self.print_log(LOG_LEVEL.INFO.name, f"Add file {file_path}")
+        # probe new files, cached ones cost nothing
+        probe_count = self.probe_service.request(new_file_paths)
+        if probe_count > 0:
+            self.print_log(LOG_LEVEL.DEBUG.name, f"Probe {probe_count} of {len(new_file_paths)} new files")
 
         # update ui
         self.signal.update_signal.emit(1)
 
+    @Slot()
+    def add_folder(self):
+        """Add every supported file below a folder, scanned in the background"""
+        directory = QFileDialog.getExistingDirectory(self, 'Select folder')
+        if not directory:
+            return
+
+        self.add_folder_button.setEnabled(False)
+        self.print_log(LOG_LEVEL.INFO.name, f"Scan folder {directory}")
+        self.directory_scanner = DirectoryScanner(directory, parent=self)
+        self.directory_scanner.found.connect(self.add_file_paths)
+        self.directory_scanner.finished.connect(self.handle_scan_finish)
+        self.directory_scanner.start()
+
+    @Slot()
+    def handle_scan_finish(self):
+        scanner = self.directory_scanner
+        self.directory_scanner = None
+        self.add_folder_button.setEnabled(True)
+        self.print_log(LOG_LEVEL.INFO.name, f"Found {scanner.count} files in {scanner.directory}")
+        scanner.deleteLater()
+
+    def closeEvent(self, event):
+        # a running thread must not be destroyed with the window
+        if self.directory_scanner is not None:
+            self.directory_scanner.cancel()
+            self.directory_scanner.wait()
+        self.runner.set_agents([])
+        if self.batch_metrics is not None:
+            self.batch_metrics.finish()
+        if self.metrics_server is not None:
+            self.metrics_server.close()
+        super().closeEvent(event)
+
     @Slot()
     def delete_files(self):
         """Delete files from file list"""
-        selected_indexes = self.file_list_view.selectedIndexes()
-        for index in selected_indexes:
-            item = self.file_model.item(index.row(), 0)
-            self.print_log(LOG_LEVEL.INFO.name, f"Delete file {item.text()}")
-            self.file_model.removeRow(index.row())
+        rows = [index.row() for index in self.file_list_view.selectedIndexes()]
+        removed = self.file_model.remove_rows(rows)
+        for path in removed:
+            self.file_priorities.pop(path, None)
+            self.file_trims.pop(path, None)
+        if len(removed) == 1:
+            self.print_log(LOG_LEVEL.INFO.name, f"Delete file {removed[0]}")
+        elif removed:
+            self.print_log(LOG_LEVEL.INFO.name, f"Delete {len(removed)} files")
 
         # update ui
         self.signal.update_signal.emit(1)
         self.file_info_button.setEnabled(False)
+        self.contact_sheet_button.setEnabled(False)
 
     @Slot()
     def show_file_info(self):
         self.print_log(LOG_LEVEL.DEBUG.name, f"File Info")
-        command = constants.DEFAULT_FFMPEG_PATH
-        item = self.file_model.item(self.file_list_view.currentIndex().row(), 0)
-        arguments = ["-i", f"{item.text()}"]
+        row = self.file_list_view.currentIndex().row()
+        if row < 0:
+            return
+        path = self.file_model.path(row)
+        info = self.probe_service.get(path)
+        if info is not None:
+            self.print_file_info(info)
+            return
+
+        self.file_info_requests.add(path)
+        self.probe_service.request([path], priority=True)
 
-        self.file_info_process.start(command, arguments)
+    @Slot(str, object)
+    def handle_probe_finish(self, path, info):
+        if path in self.file_info_requests:
+            self.file_info_requests.discard(path)
+            self.print_file_info(info)
+        # the thumbnail waits for the duration to take a frame from the middle
+        self.file_model.update_path(path)
+        self.estimate_timer.start()
+
+    @Slot(str, str)
+    def handle_probe_fail(self, path, error):
+        self.file_info_requests.discard(path)
+        self.print_log(LOG_LEVEL.WARNING.name, f"Failed to probe {path}: {error}")
+        self.thumbnail_service.request(path, THUMBNAIL_LAYOUT)
+
+    def file_thumbnail(self, path):
+        image = self.thumbnail_service.get(path, THUMBNAIL_LAYOUT)
+        if image is None:
+            info = self.probe_service.get(path)
+            if info is not None:
+                self.thumbnail_service.request(path, THUMBNAIL_LAYOUT, info.duration)
+        return image
 
     @Slot()
-    def handle_file_info_stdout(self):
-        data = self.file_info_process.readAllStandardOutput().data().decode("utf-8")
-        self.log_editor.append(data)
+    def show_contact_sheet(self):
+        row = self.file_list_view.currentIndex().row()
+        if row < 0:
+            return
+        path = self.file_model.path(row)
+        image = self.thumbnail_service.get(path, CONTACT_SHEET_LAYOUT)
+        if image is not None:
+            self.open_contact_sheet(path, image)
+            return
+
+        info = self.probe_service.get(path)
+        if info is None or info.duration <= 0:
+            self.print_log(LOG_LEVEL.WARNING.name, f"Contact sheet needs the duration of {path}, probing it first")
+            self.probe_service.request([path], priority=True)
+            return
+        self.contact_sheet_requests.add(path)
+        self.thumbnail_service.request(path, CONTACT_SHEET_LAYOUT, info.duration)
+        self.print_log(LOG_LEVEL.DEBUG.name, f"Render contact sheet of {path}")
+
+    def open_contact_sheet(self, path, image):
+        if self.contact_sheet_window is None:
+            self.contact_sheet_window = QLabel()
+        self.contact_sheet_window.setWindowTitle(path.split("/")[-1])
+        self.contact_sheet_window.setPixmap(QPixmap.fromImage(image))
+        self.contact_sheet_window.show()
+        self.contact_sheet_window.raise_()
+
+    @Slot(str, object)
+    def handle_thumbnail_ready(self, path, layout):
+        if layout == THUMBNAIL_LAYOUT:
+            self.file_model.update_path(path)
+        elif path in self.contact_sheet_requests:
+            self.contact_sheet_requests.discard(path)
+            self.open_contact_sheet(path, self.thumbnail_service.get(path, layout))
+
+    @Slot(str, object, str)
+    def handle_thumbnail_fail(self, path, layout, error):
+        if layout == CONTACT_SHEET_LAYOUT:
+            self.contact_sheet_requests.discard(path)
+            self.print_log(LOG_LEVEL.WARNING.name, f"Failed to render contact sheet of {path}: {error}")
+        else:
+            self.print_log(LOG_LEVEL.DEBUG.name, f"Failed to render thumbnail of {path}: {error}")
 
     @Slot()
-    def handle_file_info_stderr(self):
-        data = self.file_info_process.readAllStandardError().data().decode("utf-8")
-        self.log_editor.append(data)
+    def set_trim(self):
+        paths = self.selected_paths()
+        if not paths:
+            self.print_log(LOG_LEVEL.WARNING.name, "Select the files to trim")
+            return
+        try:
+            trim = parse_trim(self.trim_start.text() or "0", self.trim_end.text())
+        except ValueError as error:
+            self.print_log(LOG_LEVEL.ERROR.name, f"Invalid trim: {error}")
+            return
+        for path in paths:
+            self.file_trims[path] = trim
+        self.print_log(LOG_LEVEL.INFO.name, f"Trim {len(paths)} files to {format_trim(trim)}")
+        self.estimate_timer.start()
 
     @Slot()
-    def handle_file_info_finish(self):
+    def clear_trim(self):
+        paths = [path for path in self.selected_paths() if path in self.file_trims]
+        for path in paths:
+            del self.file_trims[path]
+        self.print_log(LOG_LEVEL.INFO.name, f"Clear the trim of {len(paths)} files")
+        self.estimate_timer.start()
+
+    def print_file_info(self, info):
+        for line in info.summary():
+            self.print_log(LOG_LEVEL.INFO.name, line)
         self.print_log(LOG_LEVEL.INFO.name, f"Finish File Info")
 
     @Slot()
     def clear_files_list(self):
         """Clear all items in file list"""
         self.file_model.clear()
+        self.file_priorities = {}
+        self.file_trims = {}
+        self.thumbnail_service.cancel()
         self.print_log(LOG_LEVEL.INFO.name, "Clear all items in file list")
 
         # update ui
         self.signal.update_signal.emit(1)
         self.file_info_button.setEnabled(False)
+        self.contact_sheet_button.setEnabled(False)
 
     def create_config_toolbox(self):
         """Create config Groupbox"""
         result = QTabWidget()
+        self.config_toolbox = result
+
+        # only the first tab is visible at startup, the others are built when first shown
+        self.audio_config_groupbox = None
+        self.file_format_config_groupbox = None
+        self.output_config_groupbox = None
+        self.lazy_config_tabs = {
+            1: ("Audio", self.create_audio_config_groupbox),
+            2: ("Format", self.create_file_format_config_groupbox),
+            3: ("Output", self.create_output_config_groupbox)
+        }
 
         video_config_groupbox = self.create_video_config_groupbox()
-        audio_config_groupbox = self.create_audio_config_groupbox()
-        file_format_config_groupbox = self.create_file_format_config_groupbox()
-        output_config_groupbox = self.create_output_config_groupbox()
-
         result.addTab(video_config_groupbox, "Video")
-        result.addTab(audio_config_groupbox, "Audio")
-        result.addTab(file_format_config_groupbox, "Format")
-        result.addTab(output_config_groupbox, "Output")
+        for name, _ in self.lazy_config_tabs.values():
+            result.addTab(QWidget(), name)
+        result.currentChanged.connect(self.build_config_tab)
 
         return result
 
+    @Slot(int)
+    def build_config_tab(self, index):
+        """Replace the placeholder of a config tab by its widgets"""
+        if index not in self.lazy_config_tabs:
+            return
+        name, create_groupbox = self.lazy_config_tabs.pop(index)
+        groupbox = create_groupbox()
+
+        self.config_toolbox.blockSignals(True)
+        placeholder = self.config_toolbox.widget(index)
+        self.config_toolbox.removeTab(index)
+        self.config_toolbox.insertTab(index, groupbox, name)
+        self.config_toolbox.setCurrentIndex(index)
+        self.config_toolbox.blockSignals(False)
+        placeholder.deleteLater()
+
+    def build_all_config_tabs(self):
+        current_index = self.config_toolbox.currentIndex()
+        for index in list(self.lazy_config_tabs):
+            self.build_config_tab(index)
+        self.config_toolbox.setCurrentIndex(current_index)
+
     def create_video_config_groupbox(self):
         result = QGroupBox()
 
@@ -289,6 +545,76 @@ class MainWindow(QWidget):
         video_quality_layout.addWidget(video_quality_label)
         video_quality_layout.addWidget(self.video_quality)
 
+        # enable video bit rate, replaces the constant rate factor
+        self.enable_video_bitrate = QCheckBox("Specifying Video Bit Rate")
+        self.enable_video_bitrate.clicked.connect(self.enable_change_video_bitrate)
+
+        # video bit rate
+        self.video_bitrate = QLineEdit()
+        self.video_bitrate.setEnabled(False)
+        self.video_bitrate.setValidator(QIntValidator(1, 500000))
+        self.video_bitrate.setText("4000")
+        self.video_bitrate.textChanged.connect(self.update_command_line)
+        video_k_label = QLabel("k")
+        video_bitrate_label = QLabel("Video Bit Rate:")
+        video_bitrate_label.setBuddy(self.video_bitrate)
+
+        # two pass encoding
+        self.two_pass = QCheckBox("Two-Pass")
+        self.two_pass.setToolTip("Pass 1 statistics are cached, encoding the same input again skips pass 1")
+        self.two_pass.setEnabled(False)
+
+        # video bit rate layout
+        video_bitrate_layout = QHBoxLayout()
+        video_bitrate_layout.addWidget(self.enable_video_bitrate)
+        video_bitrate_layout.addWidget(self.two_pass)
+        video_bitrate_layout.addStretch(6)
+        video_bitrate_layout.addWidget(video_bitrate_label)
+        video_bitrate_layout.addWidget(self.video_bitrate, 1)
+        video_bitrate_layout.addWidget(video_k_label)
+
+        # skip encoding of streams that already match the settings
+        self.auto_stream_copy = QCheckBox("Copy Streams That Already Match the Settings")
+        self.auto_stream_copy.setToolTip("Decided per file from its probed codec, size and framerate, never with a CRF")
+        self.auto_stream_copy.setChecked(False)
+
+        # segmented encoding of long inputs
+        self.segmented_encoding = QCheckBox("Encode Long Inputs in Parallel Segments")
+        self.segmented_encoding.setToolTip("Needs a specified encoding format and probed durations")
+        self.segment_count = QSpinBox()
+        self.segment_count.setRange(0, constants.MAX_PARALLEL_JOBS)
+        self.segment_count.setSpecialValueText("Auto")
+        self.segment_count.setEnabled(False)
+        self.segmented_encoding.clicked.connect(self.enable_segmented_encoding)
+        segment_count_label = QLabel("Segments:")
+        segment_count_label.setBuddy(self.segment_count)
+
+        # segmented encoding layout
+        segmented_encoding_layout = QHBoxLayout()
+        segmented_encoding_layout.addWidget(self.segmented_encoding)
+        segmented_encoding_layout.addStretch(1)
+        segmented_encoding_layout.addWidget(segment_count_label)
+        segmented_encoding_layout.addWidget(self.segment_count)
+
+        # encoding ladder, several sizes of every input from one decode
+        self.encoding_ladder = QCheckBox("Encoding Ladder")
+        self.encoding_ladder.setToolTip("Every input is decoded once and written in each rendition, "
+                                        "the rendition name is appended to the output name")
+        self.encoding_ladder.clicked.connect(self.enable_encoding_ladder)
+        self.ladder_renditions = QLineEdit()
+        self.ladder_renditions.setEnabled(False)
+        self.ladder_renditions.setText(constants.DEFAULT_LADDER_RENDITIONS)
+        self.ladder_renditions.setToolTip("NAME=WIDTH:HEIGHT with an optional @ video bit rate in kb/s, "
+                                          "separated by commas")
+        ladder_renditions_label = QLabel("Renditions:")
+        ladder_renditions_label.setBuddy(self.ladder_renditions)
+
+        # encoding ladder layout
+        encoding_ladder_layout = QHBoxLayout()
+        encoding_ladder_layout.addWidget(self.encoding_ladder)
+        encoding_ladder_layout.addWidget(ladder_renditions_label)
+        encoding_ladder_layout.addWidget(self.ladder_renditions, 1)
+
         # main layout
         main_layout = QVBoxLayout(result)
         main_layout.addLayout(encode_format_layout)
@@ -296,6 +622,10 @@ class MainWindow(QWidget):
         main_layout.addLayout(video_framerate_layout)
         main_layout.addLayout(video_scale_layout)
         main_layout.addLayout(video_quality_layout)
+        main_layout.addLayout(video_bitrate_layout)
+        main_layout.addWidget(self.auto_stream_copy)
+        main_layout.addLayout(segmented_encoding_layout)
+        main_layout.addLayout(encoding_ladder_layout)
 
         return result
 
@@ -303,7 +633,8 @@ class MainWindow(QWidget):
     def enable_change_encode(self):
         if self.enable_encode_format.isChecked():
             self.encode_format.setEnabled(True)
-            self.video_quality.setEnabled(support_crf(self.encode_format.currentText()))
+            self.video_quality.setEnabled(support_crf(self.encode_format.currentText())
+                                          and not self.enable_video_bitrate.isChecked())
         else:
             self.encode_format.setEnabled(False)
             self.video_quality.setEnabled(False)
@@ -312,7 +643,19 @@ class MainWindow(QWidget):
 
     @Slot()
     def change_encode_format(self):
-        self.video_quality.setEnabled(support_crf(self.encode_format.currentText()))
+        self.video_quality.setEnabled(self.enable_encode_format.isChecked()
+                                      and support_crf(self.encode_format.currentText())
+                                      and not self.enable_video_bitrate.isChecked())
+        self.update_command_line()
+
+    @Slot()
+    def enable_change_video_bitrate(self):
+        is_checked = self.enable_video_bitrate.isChecked()
+        self.video_bitrate.setEnabled(is_checked)
+        self.two_pass.setEnabled(is_checked)
+        self.video_quality.setEnabled(self.enable_encode_format.isChecked()
+                                      and support_crf(self.encode_format.currentText())
+                                      and not is_checked)
         self.update_command_line()
 
     @Slot()
@@ -328,6 +671,15 @@ class MainWindow(QWidget):
 
         self.update_command_line()
 
+    @Slot()
+    def enable_segmented_encoding(self):
+        self.segment_count.setEnabled(self.segmented_encoding.isChecked())
+
+    @Slot()
+    def enable_encoding_ladder(self):
+        self.ladder_renditions.setEnabled(self.encoding_ladder.isChecked())
+        self.update_command_line()
+
     @Slot()
     def enable_change_scale(self):
         if self.enable_video_scale.isChecked():
@@ -339,6 +691,7 @@ class MainWindow(QWidget):
 
     def create_audio_config_groupbox(self):
         result = QGroupBox()
+        self.audio_config_groupbox = result
 
         # create audio copy button
         self.audio_copy_button = QCheckBox("Copy All Audio")
@@ -393,6 +746,29 @@ class MainWindow(QWidget):
         audio_compress_layout.addWidget(self.audio_compress, 1)
         audio_compress_layout.addWidget(audio_k_label)
 
+        # enable loudness normalization
+        self.enable_loudness = QCheckBox("EBU R128 Loudness Normalization")
+        self.enable_loudness.setEnabled(False)
+        self.enable_loudness.clicked.connect(self.enable_change_loudness)
+
+        # loudness target
+        self.loudness_target = QLineEdit()
+        self.loudness_target.setEnabled(False)
+        self.loudness_target.setText(constants.DEFAULT_LOUDNESS_TARGET)
+        self.loudness_target.setValidator(QDoubleValidator(-70.0, -5.0, 1, self))
+        self.loudness_target.textChanged.connect(self.update_command_line)
+        loudness_unit_label = QLabel("LUFS")
+        loudness_target_label = QLabel("Target Loudness:")
+        loudness_target_label.setBuddy(self.loudness_target)
+
+        # loudness layout
+        loudness_layout = QHBoxLayout()
+        loudness_layout.addWidget(self.enable_loudness)
+        loudness_layout.addStretch(6)
+        loudness_layout.addWidget(loudness_target_label)
+        loudness_layout.addWidget(self.loudness_target, 1)
+        loudness_layout.addWidget(loudness_unit_label)
+
         # line
         line = QFrame()
         line.setFrameShape(QFrame.HLine)
@@ -404,6 +780,7 @@ class MainWindow(QWidget):
         main_layout.addWidget(line)
         main_layout.addLayout(audio_format_layout)
         main_layout.addLayout(audio_compress_layout)
+        main_layout.addLayout(loudness_layout)
         main_layout.addStretch(1)
 
         return result
@@ -415,11 +792,15 @@ class MainWindow(QWidget):
             self.audio_format.setEnabled(False)
             self.enable_audio_compress.setEnabled(False)
             self.audio_compress.setEnabled(False)
+            self.enable_loudness.setEnabled(False)
+            self.loudness_target.setEnabled(False)
         else:
             self.enable_audio_format.setEnabled(True)
             self.audio_format.setEnabled(True)
             self.enable_audio_compress.setEnabled(True)
             self.audio_compress.setEnabled(True)
+            self.enable_loudness.setEnabled(True)
+            self.loudness_target.setEnabled(self.enable_loudness.isChecked())
 
         self.update_command_line()
 
@@ -452,8 +833,14 @@ class MainWindow(QWidget):
 
         self.update_command_line()
 
+    @Slot()
+    def enable_change_loudness(self):
+        self.loudness_target.setEnabled(self.enable_loudness.isChecked())
+        self.update_command_line()
+
     def create_file_format_config_groupbox(self):
         result = QGroupBox()
+        self.file_format_config_groupbox = result
 
         self.file_format = QComboBox()
         self.file_format.addItems(constants.SUPPORT_FILE_FORMAT)
@@ -496,6 +883,7 @@ class MainWindow(QWidget):
 
     def create_output_config_groupbox(self):
         result = QGroupBox()
+        self.output_config_groupbox = result
 
         # output directory
         output_directory_label = QLabel("Output Directory:")
@@ -510,6 +898,27 @@ class MainWindow(QWidget):
         output_directory_layout.addWidget(self.output_directory)
         output_directory_layout.addWidget(output_directory_button)
 
+        # reuse outputs of identical earlier jobs
+        self.reuse_outputs = QCheckBox("Reuse Outputs of Identical Earlier Jobs")
+        self.reuse_outputs.setToolTip("A job with the same input content and options is skipped, "
+                                      "its earlier output is linked or copied to the new name")
+        self.reuse_outputs.setChecked(True)
+
+        # verify outputs
+        self.verify_outputs = QCheckBox("Verify Outputs")
+        self.verify_outputs.setToolTip("Every output is probed once it is written, its duration and streams "
+                                       "must match the input, a failed one is renamed to NAME.invalid")
+        self.verify_outputs.setChecked(True)
+        self.verify_outputs.clicked.connect(lambda: self.verify_decode.setEnabled(self.verify_outputs.isChecked()))
+        self.verify_decode = QCheckBox("Decode to Verify")
+        self.verify_decode.setToolTip("Decode every output as well, long ones in a few samples")
+
+        # verify layout
+        verify_layout = QHBoxLayout()
+        verify_layout.addWidget(self.verify_outputs)
+        verify_layout.addWidget(self.verify_decode)
+        verify_layout.addStretch(1)
+
         # enable rename
         self.enable_rename = QCheckBox("Rename Output File")
         self.enable_rename.clicked.connect(self.enable_rename_file)
@@ -532,7 +941,7 @@ class MainWindow(QWidget):
         self.rename_suffix_label.setVisible(False)
         self.rename_index_label = QLabel("-XX")
         self.rename_index_label.setVisible(False)
-        rename_file_format_label = QLabel(f".{self.file_format.currentText()}")
+        rename_file_format_label = QLabel(f".{self.current_settings().file_format}")
 
         # rename layout
         rename_layout = QHBoxLayout()
@@ -553,6 +962,8 @@ class MainWindow(QWidget):
         # main layout
         main_layout = QVBoxLayout(result)
         main_layout.addLayout(output_directory_layout)
+        main_layout.addWidget(self.reuse_outputs)
+        main_layout.addLayout(verify_layout)
         main_layout.addWidget(line)
         main_layout.addWidget(self.enable_rename)
         main_layout.addLayout(rename_layout)
@@ -597,10 +1008,11 @@ class MainWindow(QWidget):
 
         # create labels
         prefix = QLabel("ffmpeg -i $INPUT$")
-        self.output_label = QLabel(f"$OUTPUT$.{self.file_format.currentText()}")
+        self.output_label = QLabel(f"$OUTPUT$.{self.current_settings().file_format}")
 
         # create a command text editor
         self.command_editor = QLineEdit()
+        self.command_editor.textEdited.connect(self.handle_command_edited)
 
         # create reset button
         reset_button = QPushButton("Reset")
@@ -616,39 +1028,70 @@ class MainWindow(QWidget):
 
         return result
 
+    def current_settings(self):
+        """Collect config widgets into an EncodeSettings, tabs not built yet keep the defaults"""
+        settings = EncodeSettings(enable_encode_format=self.enable_encode_format.isChecked(),
+                                  encode_format=self.encode_format.currentText(),
+                                  encode_speed=self.encode_speed.currentText(),
+                                  video_quality=self.video_quality.text(),
+                                  enable_video_framerate=self.enable_video_framerate.isChecked(),
+                                  video_framerate=self.video_framerate.text(),
+                                  enable_video_scale=self.enable_video_scale.isChecked(),
+                                  video_scale=self.video_scale.text(),
+                                  enable_video_bitrate=self.enable_video_bitrate.isChecked(),
+                                  video_bitrate=self.video_bitrate.text(),
+                                  two_pass=self.two_pass.isChecked(),
+                                  segmented_encoding=self.segmented_encoding.isChecked(),
+                                  segment_count=self.segment_count.value(),
+                                  auto_stream_copy=self.auto_stream_copy.isChecked(),
+                                  encoding_ladder=self.encoding_ladder.isChecked(),
+                                  ladder_renditions=self.ladder_renditions.text())
+
+        if self.audio_config_groupbox is not None:
+            settings.audio_copy = self.audio_copy_button.isChecked()
+            settings.enable_audio_format = self.enable_audio_format.isChecked()
+            settings.audio_format = self.audio_format.currentText()
+            settings.enable_audio_compress = self.enable_audio_compress.isChecked()
+            settings.audio_compress = self.audio_compress.text()
+            settings.loudness_normalization = self.enable_loudness.isChecked()
+            settings.loudness_target = self.loudness_target.text()
+
+        if self.file_format_config_groupbox is not None:
+            settings.file_format = self.file_format.currentText()
+            settings.faststart = self.movflag.isChecked()
+
+        if self.output_config_groupbox is not None:
+            settings.output_directory = self.output_directory.text()
+            settings.enable_rename = self.enable_rename.isChecked()
+            settings.rename_mode = self.rename_mode.currentText()
+            settings.rename_content = self.rename.text()
+            settings.reuse_outputs = self.reuse_outputs.isChecked()
+            settings.verify_outputs = self.verify_outputs.isChecked()
+            settings.verify_decode = self.verify_decode.isChecked()
+
+        return settings
+
     @Slot()
     def update_command_line(self):
-        cmd = ""
-        if self.enable_encode_format.isChecked():
-            cmd += f" -c:v {constants.SUPPORT_VIDEO_ENCODE_FORMAT[self.encode_format.currentText()]}"
+        self.command_editor.setText(build_command_line(self.current_settings()))
+        self.command_edited = False
 
-        if self.video_quality.isEnabled():
-            cmd += f" -crf {self.video_quality.text()}"
-
-        cmd += f" -preset {self.encode_speed.currentText()}"
-
-        if self.enable_video_framerate.isChecked():
-            cmd += f" -r {self.video_framerate.text()}"
-
-        if self.enable_video_scale.isChecked():
-            cmd += f" -vf scale=\"{self.video_scale.text()}\""
-
-        if self.movflag.isEnabled() and self.movflag.isChecked():
-            cmd += " -movflags faststart"
+    @Slot()
+    def reset_command_line(self):
+        self.update_command_line()
 
-        if self.audio_copy_button.isChecked():
-            cmd += " -c:a copy"
-        else:
-            if self.enable_audio_format.isChecked():
-                cmd += f" -c:a {constants.SUPPORT_AUDIO_ENCODE_FORMAT[self.audio_format.currentText()]}"
-            if self.audio_compress.isEnabled() and self.enable_audio_compress.isChecked():
-                cmd += f" -b:a {self.audio_compress.text()}k"
+    @Slot()
+    def handle_command_edited(self):
+        self.command_edited = True
 
-        self.command_editor.setText(cmd)
+    def edited_arguments(self):
+        """Options of the command editor if it was changed by hand, else None
 
-    @Slot()
-    def reset_command_line(self):
-        self.command_editor.clear()
+        Raise ValueError if the command can't be parsed.
+        """
+        if not self.command_edited:
+            return None
+        return parse_command_line(self.command_editor.text())
 
     def create_progress_groupbox(self):
         """Create progress Groupbox"""
@@ -659,6 +1102,21 @@ class MainWindow(QWidget):
         self.start_button.clicked.connect(self.prepare_start)
         self.start_button.setEnabled(False)
 
+        # create resume button for a stopped or crashed batch
+        self.resume_button = QPushButton("Resume")
+        self.resume_button.setToolTip("Continue the last unfinished batch, skipping finished outputs")
+        self.resume_button.clicked.connect(self.resume_batch)
+        self.resume_button.setEnabled(False)
+
+        # create estimate button, encodes a few samples of every file with the current options
+        self.estimate_button = QPushButton("Estimate")
+        self.estimate_button.setToolTip("Encode short samples of the selected files, or all files, to estimate "
+                                        "output size and encode time")
+        self.estimate_button.clicked.connect(self.toggle_estimate)
+        self.estimate_button.setEnabled(False)
+        self.estimate_quality = QCheckBox("PSNR/SSIM")
+        self.estimate_quality.setToolTip("Also compare the samples with their source, takes about as long again")
+
         # create stop button
         self.stop_button = QPushButton("Stop")
         self.stop_button.clicked.connect(self.handle_terminate)
@@ -669,47 +1127,394 @@ class MainWindow(QWidget):
         self.progress_bar.setRange(0, 100)
         self.progress_bar.setEnabled(False)
 
-        # main layout
-        main_layout = QHBoxLayout(result)
-        main_layout.addWidget(self.start_button)
-        main_layout.addWidget(self.progress_bar)
-        main_layout.addWidget(self.stop_button)
+        # create parallel jobs box, 0 means choosing by core count and encoder
+        self.parallel_jobs = QSpinBox()
+        self.parallel_jobs.setRange(0, constants.MAX_PARALLEL_JOBS)
+        self.parallel_jobs.setSpecialValueText("Auto")
+        self.parallel_jobs.valueChanged.connect(self.change_parallel_jobs)
+        parallel_jobs_label = QLabel("Parallel Jobs:")
+        parallel_jobs_label.setBuddy(self.parallel_jobs)
+
+        # create worker agents box, agents on other machines run jobs besides the local workers
+        self.agents = QLineEdit()
+        self.agents.setPlaceholderText("host:port, unix:/path")
+        self.agents.setToolTip("Worker agents started with `python main.py --agent`, they need the same file paths")
+        self.agents.editingFinished.connect(self.change_agents)
+        agents_label = QLabel("Worker Agents:")
+        agents_label.setBuddy(self.agents)
+
+        # agents layout
+        agents_layout = QHBoxLayout()
+        agents_layout.addWidget(agents_label)
+        agents_layout.addWidget(self.agents)
+
+        # create queue controls, they act on the jobs of the selected files
+        self.job_priority = QComboBox()
+        self.job_priority.addItems(constants.JOB_PRIORITIES.keys())
+        self.job_priority.setCurrentText("Normal")
+        self.job_priority.setToolTip("Priority of the selected files, a ready job of a higher priority "
+                                     "pauses a running one of a lower priority")
+        self.job_priority.activated.connect(self.change_priority)
+        job_priority_label = QLabel("Priority:")
+        job_priority_label.setBuddy(self.job_priority)
+
+        self.run_first_button = QPushButton("Run First")
+        self.run_first_button.clicked.connect(lambda: self.move_jobs(True))
+        self.run_last_button = QPushButton("Run Last")
+        self.run_last_button.clicked.connect(lambda: self.move_jobs(False))
+        self.pause_button = QPushButton("Pause")
+        self.pause_button.setToolTip("Suspend the running jobs of the selected files, their workers take other jobs")
+        self.pause_button.clicked.connect(self.pause_jobs)
+        self.continue_button = QPushButton("Continue")
+        self.continue_button.setToolTip("Continue the paused jobs of the selected files once a worker is free")
+        self.continue_button.clicked.connect(self.continue_jobs)
+        self.set_queue_controls_enabled(False)
+
+        # queue layout
+        queue_layout = QHBoxLayout()
+        queue_layout.addWidget(job_priority_label)
+        queue_layout.addWidget(self.job_priority)
+        queue_layout.addStretch(1)
+        queue_layout.addWidget(self.run_first_button)
+        queue_layout.addWidget(self.run_last_button)
+        queue_layout.addWidget(self.pause_button)
+        queue_layout.addWidget(self.continue_button)
+
+        # create progress detail label
+        self.progress_label = QLabel()
+
+        # control layout
+        control_layout = QHBoxLayout()
+        control_layout.addWidget(self.start_button)
+        control_layout.addWidget(self.resume_button)
+        control_layout.addWidget(self.estimate_button)
+        control_layout.addWidget(self.estimate_quality)
+        control_layout.addWidget(self.progress_bar)
+        control_layout.addWidget(parallel_jobs_label)
+        control_layout.addWidget(self.parallel_jobs)
+        control_layout.addWidget(self.stop_button)
 
-        self.process = QProcess(self)
-        self.process.readyReadStandardOutput.connect(self.handle_process_stdout)
-        self.process.readyReadStandardError.connect(self.handle_process_stderr)
-        self.process.finished.connect(self.handle_process_finish)
+        # main layout
+        main_layout = QVBoxLayout(result)
+        main_layout.addLayout(control_layout)
+        main_layout.addLayout(queue_layout)
+        main_layout.addLayout(agents_layout)
+        main_layout.addWidget(self.progress_label)
+
+        self.runner = JobRunner(constants.DEFAULT_FFMPEG_PATH, self)
+        self.runner.job_started.connect(self.handle_process_start)
+        self.runner.job_stdout.connect(self.handle_process_stdout)
+        self.runner.job_stderr.connect(self.handle_process_stderr)
+        self.runner.job_finished.connect(self.handle_process_finish)
+        self.runner.all_finished.connect(self.handle_all_finished)
+        self.runner.workers_changed.connect(self.handle_workers_change)
+        self.runner.agent_message.connect(lambda message: self.print_log(LOG_LEVEL.INFO.name, message))
+        self.runner.job_paused.connect(self.handle_process_pause)
+        self.runner.job_resumed.connect(self.handle_process_resume)
+        self.runner.job_retrying.connect(self.handle_process_retry)
+
+        # estimate of the batch shown before Start, made again once files, probes or options change
+        self.estimate_timer = QTimer(self)
+        self.estimate_timer.setSingleShot(True)
+        self.estimate_timer.setInterval(constants.ESTIMATE_DELAY)
+        self.estimate_timer.timeout.connect(self.update_estimate)
+        self.file_model.rowsInserted.connect(self.estimate_timer.start)
+        self.file_model.rowsRemoved.connect(self.estimate_timer.start)
+        self.file_model.modelReset.connect(self.estimate_timer.start)
+        self.command_editor.textChanged.connect(self.estimate_timer.start)
+        self.parallel_jobs.valueChanged.connect(self.estimate_timer.start)
+
+        self.sample_estimator = SampleEstimator(constants.DEFAULT_FFMPEG_PATH, self.throughput_history, self)
+        self.sample_estimator.estimated.connect(self.handle_sample_estimate)
+        self.sample_estimator.finished.connect(self.handle_estimate_finished)
+
+        # counters of every batch since startup, optionally published for Prometheus
+        self.metrics_registry = MetricsRegistry()
+        self.batch_metrics = None
+        self.metrics_server = None
 
         return result
 
+    def get_worker_count(self, arguments: list):
+        if self.parallel_jobs.value() > 0:
+            return self.parallel_jobs.value()
+        return default_worker_count(video_encoder_from_arguments(arguments))
+
+    def get_load_controller(self):
+        # "Auto" starts from the encoder's worker count and follows the system load from there
+        return LoadController() if self.parallel_jobs.value() == 0 else None
+
+    @Slot()
+    def change_parallel_jobs(self):
+        if self.is_started:
+            self.runner.set_max_workers(self.get_worker_count(self.processes[0].arguments))
+            self.runner.set_load_controller(self.get_load_controller())
+
+    def probed_media(self, input_files: list):
+        """MediaInfo of the inputs probed so far, durations of the others are read from ffmpeg's stderr"""
+        media = {}
+        for input_file in input_files:
+            info = self.probe_service.get(input_file)
+            if info is not None:
+                media[input_file] = info
+        return media
+
+    @Slot()
+    def update_estimate(self):
+        """Show how long the files would take with the current options, from the throughput history"""
+        if self.is_started:
+            return
+        input_files = self.file_model.paths()
+        if not input_files:
+            self.progress_label.clear()
+            return
+        try:
+            arguments = self.edited_arguments()
+            settings = self.current_settings()
+            settings.validate()
+        except ValueError:
+            self.progress_label.clear()
+            return
+        media = self.probed_media(input_files)
+        jobs = build_jobs(settings, input_files, arguments, media, keyframe_cache=self.keyframe_cache,
+                          ffprobe=self.probe_service.program, trims=self.file_trims)
+        guessed = estimate_jobs(jobs, media, self.throughput_history)
+        makespan = estimate_makespan(jobs, self.get_worker_count(jobs[0].arguments if jobs else []))
+        details = [f"Estimated time {format_seconds(makespan)} for {len(jobs)} jobs"]
+        unknown = sum(1 for job in jobs if job.program is None and not job.duration)
+        if unknown:
+            details.append(f"{unknown} not probed yet")
+        if guessed:
+            details.append(f"{guessed} without speed history")
+        self.progress_label.setText("  |  ".join(details))
+
+    @Slot()
+    def toggle_estimate(self):
+        if self.sample_estimator.is_running():
+            self.stop_estimate()
+            return
+        try:
+            arguments = self.edited_arguments()
+            settings = self.current_settings()
+            settings.validate()
+        except ValueError as error:
+            self.print_log(LOG_LEVEL.ERROR.name, f"Invalid options: {error}")
+            return
+        if arguments is None:
+            arguments = build_arguments(settings)
+
+        paths = self.selected_paths() or self.file_model.paths()
+        media = {path: info for path, info in self.probed_media(paths).items() if info.duration > 0}
+        if len(media) < len(paths):
+            self.print_log(LOG_LEVEL.WARNING.name, f"Skip {len(paths) - len(media)} files without a probed duration")
+        if not media:
+            return
+        for path in media:
+            self.file_model.set_detail(path, "estimating...")
+        self.estimate_button.setText("Stop Estimate")
+        self.print_log(LOG_LEVEL.INFO.name, f"Estimate {len(media)} files from samples")
+        self.sample_estimator.start(media, arguments, settings.file_format, self.get_worker_count(arguments),
+                                    self.estimate_quality.isChecked())
+
+    def stop_estimate(self):
+        self.sample_estimator.cancel()
+        for path, detail in list(self.file_model.details.items()):
+            if detail == "estimating...":
+                self.file_model.set_detail(path)
+        self.handle_estimate_finished()
+        self.print_log(LOG_LEVEL.INFO.name, "Estimate stopped")
+
+    @Slot(str, object)
+    def handle_sample_estimate(self, path, estimate):
+        self.file_model.set_detail(path, estimate.summary())
+        self.print_log(LOG_LEVEL.INFO.name, f"Estimate {path}: {estimate.summary()}")
+
+    @Slot()
+    def handle_estimate_finished(self):
+        self.estimate_button.setText("Estimate")
+        self.estimate_button.setEnabled(self.file_model.rowCount() > 0 and not self.is_started)
+        # the samples added to the speed history
+        self.estimate_timer.start()
+
     def start_new_process(self):
-        if self.completed_jobs < len(self.processes):
-            command = constants.DEFAULT_FFMPEG_PATH
-            arguments = self.processes[self.completed_jobs]
-            cmdline = " ".join(arguments)
-
-            self.print_log(LOG_LEVEL.INFO.name, f"Start Process {self.completed_jobs + 1}/{len(self.processes)}")
-            self.print_log(LOG_LEVEL.DEBUG.name, f"{command} {cmdline}")
-            self.process.start(command, arguments)
-        else:
-            self.print_log(LOG_LEVEL.INFO.name, f"Work Finished")
+        workers = self.get_worker_count(self.processes[0].arguments if self.processes else [])
+        load_controller = self.get_load_controller()
+        adaptive = ", adjusted to the system load" if load_controller is not None and load_controller.is_supported() else ""
+        self.print_log(LOG_LEVEL.INFO.name, f"Run {len(self.processes)} jobs with {workers} parallel workers{adaptive}")
+        if self.batch_metrics is not None:
+            self.batch_metrics.finish()
+        self.batch_metrics = BatchMetrics(self.processes, self.runner, self.metrics_registry,
+                                          self.job_logs.metrics_path() if self.job_logs is not None else None,
+                                          constants.METRICS_PROMETHEUS_FILE, self.throughput_history, self.batch_media)
+        self.runner.start(self.processes, workers, load_controller)
 
     @Slot()
-    def handle_process_stdout(self):
-        data = self.process.readAllStandardOutput().data().decode("utf-8")
-        self.log_editor.append(data)
+    def change_agents(self):
+        try:
+            self.runner.set_agents(parse_addresses(self.agents.text()))
+        except ValueError as error:
+            self.print_log(LOG_LEVEL.ERROR.name, str(error))
+
+    @Slot(int, str)
+    def handle_workers_change(self, workers, reason):
+        self.print_log(LOG_LEVEL.INFO.name, f"Parallel workers changed to {workers}: {reason}")
+
+    def selected_paths(self):
+        rows = sorted({index.row() for index in self.file_list_view.selectedIndexes()})
+        return [self.file_model.path(row) for row in rows]
+
+    def selected_job_indices(self):
+        """Indices of the jobs of the selected files in the running batch"""
+        paths = set(self.selected_paths())
+        if not paths:
+            self.print_log(LOG_LEVEL.WARNING.name, "Select the files whose jobs to change")
+        return [job.index for job in self.processes if job.input_file in paths]
+
+    def set_queue_controls_enabled(self, is_enabled):
+        self.run_first_button.setEnabled(is_enabled)
+        self.run_last_button.setEnabled(is_enabled)
+        # pausing needs SIGSTOP, which Windows doesn't have
+        is_pausable = is_enabled and self.runner.is_pause_supported()
+        self.pause_button.setEnabled(is_pausable)
+        self.continue_button.setEnabled(is_pausable)
 
     @Slot()
-    def handle_process_stderr(self):
-        data = self.process.readAllStandardError().data().decode("utf-8")
-        self.log_editor.append(data)
+    def change_priority(self):
+        paths = self.selected_paths()
+        if not paths:
+            self.print_log(LOG_LEVEL.WARNING.name, "Select the files to change the priority of")
+            return
+        name = self.job_priority.currentText()
+        priority = constants.JOB_PRIORITIES[name]
+        for path in paths:
+            if priority:
+                self.file_priorities[path] = priority
+            else:
+                self.file_priorities.pop(path, None)
+        if self.is_started:
+            paths = set(paths)
+            self.runner.set_priority([job.index for job in self.processes if job.input_file in paths], priority)
+        self.print_log(LOG_LEVEL.INFO.name, f"Set priority {name} for {len(paths)} files")
+
+    def move_jobs(self, to_front):
+        indices = self.selected_job_indices()
+        if indices:
+            self.runner.move_jobs(indices, to_front)
+            self.print_log(LOG_LEVEL.INFO.name, f"Move {len(indices)} jobs to the {'front' if to_front else 'back'} "
+                                                f"of the queue")
 
     @Slot()
-    def handle_process_finish(self):
-        self.print_log(LOG_LEVEL.INFO.name, f"Finish Process {self.completed_jobs + 1}/{len(self.processes)}")
-        self.completed_jobs += 1
+    def pause_jobs(self):
+        indices = self.selected_job_indices()
+        if indices and self.runner.pause_jobs(indices) == 0:
+            self.print_log(LOG_LEVEL.WARNING.name, "No running local job of the selected files to pause")
+
+    @Slot()
+    def continue_jobs(self):
+        indices = self.selected_job_indices()
+        if indices:
+            count = self.runner.resume_jobs(indices)
+            self.print_log(LOG_LEVEL.INFO.name, f"{count} paused jobs continue once a worker is free")
+
+    @Slot(int, str)
+    def handle_process_pause(self, index, reason):
+        self.batch_progress.set_paused(index, True)
+        self.print_log(LOG_LEVEL.INFO.name, f"Pause Process {index + 1}/{len(self.processes)}: {reason}")
+
+    @Slot(int)
+    def handle_process_resume(self, index):
+        self.batch_progress.set_paused(index, False)
+        self.print_log(LOG_LEVEL.INFO.name, f"Continue Process {index + 1}/{len(self.processes)}")
+
+    @Slot(int, str)
+    def handle_process_retry(self, index, reason):
+        self.batch_progress.reset_job(index)
+        if self.job_logs is not None:
+            self.job_logs.close(index)
+        self.print_log(LOG_LEVEL.WARNING.name, f"Process {index + 1}/{len(self.processes)} failed: {reason}")
+
+    @Slot(int)
+    def handle_process_start(self, index):
+        job = self.processes[index]
+        self.batch_progress.start_job(index)
+        if job.duration:
+            self.batch_progress.set_duration(index, job.duration)
+        cmdline = " ".join(job.arguments)
+
+        self.job_queue.update(job)
+        self.print_log(LOG_LEVEL.INFO.name, f"Start Process {index + 1}/{len(self.processes)}")
+        for note in job.notes:
+            self.print_log(LOG_LEVEL.INFO.name, note)
+        self.print_log(LOG_LEVEL.DEBUG.name, f"{self.runner.program} {cmdline}")
+        if self.job_logs is not None:
+            self.job_logs.open(index, f"{job.program or self.runner.program} {cmdline}")
+
+    @Slot(int, str)
+    def handle_process_stdout(self, index, data):
+        # stdout only carries the -progress stream
+        if self.batch_progress.feed_stdout(index, data):
+            self.update_progress_bar()
+
+    @Slot(int, str)
+    def handle_process_stderr(self, index, data):
+        self.batch_progress.feed_stderr(index, data)
+        if self.job_logs is not None:
+            self.job_logs.write(index, data)
+        self.log_sink.write_raw(LOG_LEVEL.DEBUG, data)
+
+    @Slot(int, int)
+    def handle_process_finish(self, index, exit_code):
+        job = self.processes[index]
+        if job.state == JobState.DONE:
+            if job.degraded is not None:
+                self.print_log(LOG_LEVEL.WARNING.name, f"Finish Process {index + 1}/{len(self.processes)} "
+                                                       f"with the {job.degraded}, its output isn't reused later")
+            else:
+                self.print_log(LOG_LEVEL.INFO.name, f"Finish Process {index + 1}/{len(self.processes)}")
+        elif job.state == JobState.CANCELLED:
+            # stopped by Stop, a check that didn't finish says nothing about its output
+            self.print_log(LOG_LEVEL.INFO.name, f"Process {index + 1}/{len(self.processes)} cancelled")
+        elif job.verifies is not None and job.state == JobState.FAILED:
+            # the output is what failed, not the check
+            reject_unverified(self.processes, job)
+            verified = self.processes[job.verifies]
+            self.print_log(LOG_LEVEL.ERROR.name, f"Process {job.verifies + 1}/{len(self.processes)}: "
+                                                 f"{verified.failure or 'its output failed verification'}")
+            self.file_model.set_detail(verified.input_file, "verification failed")
+            self.job_queue.update(verified)
+        else:
+            self.print_log(LOG_LEVEL.ERROR.name, f"Process {index + 1}/{len(self.processes)} failed with exit code {exit_code}")
+        self.job_queue.update(job)
+        self.batch_progress.finish_job(index)
+        if self.job_logs is not None:
+            self.job_logs.close(index)
+        self.completed_jobs = self.runner.completed_count()
+        self.signal.update_signal.emit(self.completed_jobs)
+
+    @Slot()
+    def handle_all_finished(self):
+        if self.job_logs is not None:
+            self.job_logs.close_all()
+        # a failed check shows up as the failure of the job it checked
+        failed = [job for job in self.processes if job.state == JobState.FAILED and job.verifies is None]
+        if failed:
+            self.print_log(LOG_LEVEL.ERROR.name, f"{len(failed)} of {len(self.processes)} jobs failed:")
+            for job in failed:
+                self.print_log(LOG_LEVEL.ERROR.name, f"  Process {job.index + 1} {job.input_file}: "
+                                                     f"{job.failure or f'exit code {job.exit_code}'}")
+        if self.batch_metrics is not None:
+            summary = self.batch_metrics.summary()
+            if summary["verify_jobs"]:
+                self.print_log(LOG_LEVEL.INFO.name, f"Verified the outputs in {format_seconds(summary['verify_time'])}"
+                                                    f" of checks, {summary['verify_failed']} failed")
+        # failed jobs stay in the queue so they can be resumed
+        if self.job_queue.is_finished():
+            self.job_queue.remove()
+        else:
+            self.job_queue.compact()
+            self.resume_button.setEnabled(True)
+        self.completed_jobs = self.jobs
         self.signal.update_signal.emit(self.completed_jobs)
-        self.start_new_process()
 
     @Slot()
     def handle_terminate(self):
@@ -720,17 +1525,25 @@ class MainWindow(QWidget):
 
         # update ui
         self.start_button.setEnabled(self.file_model.rowCount() > 0)
+        self.estimate_button.setEnabled(self.file_model.rowCount() > 0)
         self.stop_button.setEnabled(False)
+        self.set_queue_controls_enabled(False)
         self.progress_bar.setEnabled(False)
-
-        # print log
-        self.process.terminate()
+        self.progress_label.clear()
+
+        # stop every running worker and drop the waiting jobs
+        self.runner.cancel_all()
+        if self.job_logs is not None:
+            self.job_logs.close_all()
+        if self.batch_metrics is not None:
+            self.batch_metrics.finish()
+        self.resume_button.setEnabled(True)
         self.print_log(LOG_LEVEL.INFO.name, "Terminate work")
 
     @Slot()
     def prepare_start(self):
         # Pop a message to notice user to choose output directory
-        if self.output_directory.text() == "":
+        if self.current_settings().output_directory == "":
             msg_box = QMessageBox()
             msg_box.setWindowTitle("Notice")
             msg_box.setText("You didn't select output directory!\nIf you selected confirm, the output directory will be input file's directory.")
@@ -742,38 +1555,136 @@ class MainWindow(QWidget):
             if result == QMessageBox.Cancel:
                 return
 
+        try:
+            arguments = self.edited_arguments()
+        except ValueError as error:
+            self.print_log(LOG_LEVEL.ERROR.name, f"Invalid command: {error}")
+            return
+        settings = self.current_settings()
+        try:
+            settings.validate()
+        except ValueError as error:
+            self.print_log(LOG_LEVEL.ERROR.name, f"Invalid settings: {error}")
+            return
+        ignored = ignored_by_edited_command(settings) if arguments is not None else []
+        if ignored:
+            self.print_log(LOG_LEVEL.WARNING.name, f"The edited command runs as it is, without {', '.join(ignored)}; "
+                                                   f"Reset the command to use them")
+
+        input_files = self.file_model.paths()
+        self.start_batch(JobQueue(JobQueue.default_path(), settings, input_files, arguments, dict(self.file_trims)))
+
+    @Slot()
+    def resume_batch(self):
+        job_queue = JobQueue.load(JobQueue.default_path())
+        if job_queue is None:
+            self.resume_button.setEnabled(False)
+            self.print_log(LOG_LEVEL.WARNING.name, "No batch to resume")
+            return
+
+        # show the files of the resumed batch
+        self.file_model.clear()
+        self.file_model.add_paths(job_queue.input_files)
+        self.file_trims = dict(job_queue.trims)
+        self.probe_service.request(job_queue.input_files)
+        self.print_log(LOG_LEVEL.INFO.name, f"Resume batch of {len(job_queue.input_files)} files")
+        self.start_batch(job_queue)
+
+    def start_batch(self, job_queue: JobQueue):
+        # the samples would only slow the batch down
+        if self.sample_estimator.is_running():
+            self.stop_estimate()
+
         # reset variables
         self.is_started = True
         self.completed_jobs = 0
-        self.jobs = self.file_model.rowCount()
-
-        # create job list
-        self.processes = []
-        for i in range(self.jobs):
-            input_file = self.file_model.item(i, 0).text()
-            output_file = get_output_file_path(enable_rename=self.enable_rename.isChecked(),
-                                                    rename_mode=self.rename_mode.currentText(),
-                                                    rename_content=self.rename.text(),
-                                                    index= i,
-                                                    format=self.file_format.currentText(),
-                                                    original_file_path=input_file,
-                                                    output_directory=self.output_directory.text())
-            cmd = ["-i", input_file] + self.command_editor.text().split() + [output_file]
-            self.processes.append(cmd)
+        self.job_queue = job_queue
+
+        # create job list from the probed media, durations of files not probed yet are read from ffmpeg's stderr
+        input_files = job_queue.input_files
+        media = self.probed_media(input_files)
+        self.batch_media = media
+        self.processes = build_jobs(job_queue.settings, input_files, job_queue.arguments, media,
+                                    keyframe_cache=self.keyframe_cache, ffprobe=self.probe_service.program,
+                                    trims=job_queue.trims)
+        self.jobs = len(self.processes)
+        if self.jobs > len(input_files):
+            self.print_log(LOG_LEVEL.INFO.name, f"Split long inputs into segments, {self.jobs} jobs for {len(input_files)} files")
+
+        # jobs an identical earlier job already did are skipped, their outputs linked into place
+        if job_queue.settings.reuse_outputs:
+            reused = reuse_outputs(self.processes, self.output_cache,
+                                   output_key_arguments(job_queue.settings, job_queue.arguments))
+            try:
+                self.output_cache.save()
+            except OSError as error:
+                self.print_log(LOG_LEVEL.WARNING.name, f"Failed to save the output cache: {error}")
+            if reused > 0:
+                self.print_log(LOG_LEVEL.INFO.name, f"Skip {reused} jobs whose output an identical earlier job wrote")
+
+        # every new output is checked once it is written, while the next ones are encoded
+        if job_queue.settings.verify_outputs:
+            add_verify_jobs(self.processes, media, job_queue.settings.verify_decode, ffprobe=self.probe_service.program)
+            self.jobs = len(self.processes)
+        set_priorities(self.processes, self.file_priorities)
+        self.batch_progress = BatchProgress.from_jobs(self.processes)
+
+        # jobs finished by an earlier run of the same batch are skipped
+        try:
+            skipped = job_queue.track(self.processes)
+        except OSError as error:
+            skipped = 0
+            self.print_log(LOG_LEVEL.WARNING.name, f"Failed to save the job queue: {error}")
+        for job in self.processes:
+            if job.state == JobState.DONE:
+                self.batch_progress.finish_job(job.index)
+        if skipped > 0:
+            self.print_log(LOG_LEVEL.INFO.name, f"Skip {skipped} jobs finished before")
+
+        # the longest jobs start first so none of them is left running alone at the end
+        estimate_jobs(self.processes, media, self.throughput_history)
+        makespan = estimate_makespan(self.processes, self.get_worker_count(self.processes[0].arguments
+                                                                           if self.processes else []))
+        self.print_log(LOG_LEVEL.INFO.name, f"Estimated time {format_seconds(makespan)}, longest jobs first")
+
+        # full ffmpeg output of each job goes to its own log file
+        try:
+            self.job_logs = JobLogWriter()
+        except OSError as error:
+            self.job_logs = None
+            self.print_log(LOG_LEVEL.WARNING.name, f"Job logs disabled: {error}")
 
         # update ui
         self.start_button.setEnabled(False)
+        self.estimate_button.setEnabled(False)
+        self.resume_button.setEnabled(False)
         self.stop_button.setEnabled(True)
+        self.set_queue_controls_enabled(True)
         self.progress_bar.setEnabled(True)
         self.update_progress_bar()
 
         # print log
         self.print_log(LOG_LEVEL.INFO.name, "Start working")
+        if self.job_logs is not None:
+            self.print_log(LOG_LEVEL.INFO.name, f"Job logs are written to {self.job_logs.directory}")
         self.start_new_process()
 
     @Slot()
     def update_progress_bar(self):
-        self.progress_bar.setValue(round((self.completed_jobs / self.jobs) * 100))
+        self.progress_bar.setValue(round(self.batch_progress.overall_fraction() * 100))
+
+        # show per file percent of running jobs, throughput and ETA
+        details = []
+        for index in self.batch_progress.running():
+            file_name = self.processes[index].input_file.split("/")[-1]
+            paused = " paused" if self.batch_progress.is_paused(index) else ""
+            details.append(f"{file_name} {round(self.batch_progress.job_fraction(index) * 100)}%{paused}")
+        details.append(f"{self.batch_progress.speed():.2f}x")
+        details.append(f"{self.batch_progress.fps():.1f} fps")
+        eta = self.batch_progress.eta()
+        if eta is not None and self.is_started:
+            details.append(f"ETA {format_seconds(eta)}")
+        self.progress_label.setText("  |  ".join(details))
 
     def create_log_groupbox(self):
         """Create Log Browser Groupbox"""
@@ -787,15 +1698,36 @@ class MainWindow(QWidget):
         clear_pushbutton.clicked.connect(self.clear_log)
         clear_pushbutton.setDefault(True)
 
+        # create log level filter
+        self.log_level = QComboBox()
+        self.log_level.addItems([level.name for level in LOG_LEVEL])
+        self.log_level.currentIndexChanged.connect(self.change_log_level)
+        log_level_label = QLabel("Level:")
+        log_level_label.setBuddy(self.log_level)
+
+        # create max lines box
+        self.log_max_lines = QSpinBox()
+        self.log_max_lines.setRange(100, 1000000)
+        self.log_max_lines.setSingleStep(1000)
+        self.log_max_lines.setValue(constants.LOG_MAX_LINES)
+        self.log_max_lines.valueChanged.connect(self.change_log_max_lines)
+        log_max_lines_label = QLabel("Max Lines:")
+        log_max_lines_label.setBuddy(self.log_max_lines)
+
         # define top layout
         top_layout = QHBoxLayout()
         top_layout.addWidget(log_label)
         top_layout.addStretch(1)
+        top_layout.addWidget(log_level_label)
+        top_layout.addWidget(self.log_level)
+        top_layout.addWidget(log_max_lines_label)
+        top_layout.addWidget(self.log_max_lines)
         top_layout.addWidget(clear_pushbutton)
 
-        # create log browser
-        self.log_editor = QTextEdit()
+        # create log browser, lines are flushed in batches and old ones dropped
+        self.log_editor = QPlainTextEdit()
         self.log_editor.setReadOnly(True)
+        self.log_sink = LogSink(self.log_editor, parent=self)
 
         # overall layout
         main_layout = QVBoxLayout(result)
@@ -807,9 +1739,17 @@ class MainWindow(QWidget):
     @Slot(str, str)
     def print_log(self, log_level, log):
         """Print log message"""
-        self.log_editor.append(f"{datetime.datetime.now()}  [{log_level}]  \t{log}")
+        self.log_sink.write(LOG_LEVEL[log_level], log)
+
+    @Slot()
+    def change_log_level(self):
+        self.log_sink.set_min_level(LOG_LEVEL[self.log_level.currentText()])
+
+    @Slot()
+    def change_log_max_lines(self):
+        self.log_sink.set_max_lines(self.log_max_lines.value())
 
     @Slot()
     def clear_log(self):
         """Clear log browser"""
-        self.log_editor.clear()
\ No newline at end of file
+        self.log_sink.clear()
\ No newline at end of file
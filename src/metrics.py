@@ -0,0 +1,346 @@
+import json
+import os
+import time
+from dataclasses import asdict, dataclass
+
+import src.constants as constants
+from src.jobs import JobState, video_encoder_from_arguments
+from src.probe import file_identity
+from src.progress import ProgressParser
+from src.throughput import ThroughputHistory, throughput_key
+
+
+class Histogram:
+    """Prometheus style histogram, counts per upper bound plus sum and count"""
+
+    def __init__(self, buckets: list):
+        self.buckets = sorted(buckets)
+        self.counts = [0] * len(self.buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.sum += value
+        self.count += 1
+
+    def lines(self, name: str):
+        lines = []
+        total = 0
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            lines.append(f'{name}_bucket{{le="{bound:g}"}} {total}')
+        lines.append(f'{name}_bucket{{le="+Inf"}} {self.count}')
+        lines.append(f"{name}_sum {self.sum:g}")
+        lines.append(f"{name}_count {self.count}")
+        return lines
+
+
+@dataclass
+class JobMetrics:
+    """What one job cost, times are seconds"""
+    index: int
+    input_file: str
+    output_file: str
+    encoder: str = None
+    # "local" or the agent the job ran on last
+    node: str = "local"
+    state: str = JobState.PENDING.name
+    exit_code: int = None
+    queue_wait: float = None
+    spawn_latency: float = None
+    wall_time: float = None
+    media_seconds: float = None
+    frames: int = None
+    fps: float = None
+    speed: float = None
+    bytes_in: int = None
+    bytes_out: int = None
+    retries: int = 0
+    # index of the job whose output this job checked, verification is reported on its own
+    verifies: int = None
+    # why the job failed, see classify_failure, and how a retry lowered its options
+    failure: str = None
+    degraded: str = None
+
+    def to_dict(self):
+        return {key: value for key, value in asdict(self).items() if value is not None}
+
+
+class MetricsRegistry:
+    """Counters and histograms of every batch since the program started, in Prometheus text format"""
+
+    def __init__(self):
+        self.jobs = {}
+        self.retries = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.media_seconds = 0.0
+        self.verify_seconds = 0.0
+        self.batches = 0
+        self.running = 0
+        self.pending = 0
+        self.wall_time = Histogram(constants.METRICS_TIME_BUCKETS)
+        self.queue_wait = Histogram(constants.METRICS_TIME_BUCKETS)
+        self.spawn_latency = Histogram(constants.METRICS_LATENCY_BUCKETS)
+        self.speed = Histogram(constants.METRICS_SPEED_BUCKETS)
+        # the HTTP endpoint reads this from its own thread, it is only ever replaced as a whole
+        self.text = self.render()
+
+    def add_job(self, metrics: JobMetrics):
+        key = (metrics.state.lower(), metrics.encoder or "")
+        self.jobs[key] = self.jobs.get(key, 0) + 1
+        if metrics.verifies is not None:
+            self.verify_seconds += metrics.wall_time or 0.0
+            return
+        self.retries += metrics.retries
+        self.bytes_in += metrics.bytes_in or 0
+        self.bytes_out += metrics.bytes_out or 0
+        if metrics.state == JobState.DONE.name:
+            self.media_seconds += metrics.media_seconds or 0.0
+            if metrics.speed is not None:
+                self.speed.observe(metrics.speed)
+        if metrics.wall_time is not None:
+            self.wall_time.observe(metrics.wall_time)
+        if metrics.queue_wait is not None:
+            self.queue_wait.observe(metrics.queue_wait)
+        if metrics.spawn_latency is not None:
+            self.spawn_latency.observe(metrics.spawn_latency)
+
+    def render(self):
+        prefix = "ffmpeg_gui"
+        lines = [f"# HELP {prefix}_jobs_total Finished jobs by final state and video encoder",
+                 f"# TYPE {prefix}_jobs_total counter"]
+        for (state, encoder), count in sorted(self.jobs.items()):
+            lines.append(f'{prefix}_jobs_total{{state="{state}",encoder="{encoder}"}} {count}')
+        for name, kind, value, help_text in [
+                ("batches_total", "counter", self.batches, "Batches started"),
+                ("job_retries_total", "counter", self.retries, "Times a job ran again"),
+                ("input_bytes_total", "counter", self.bytes_in, "Bytes of the inputs of finished jobs"),
+                ("output_bytes_total", "counter", self.bytes_out, "Bytes written by finished jobs"),
+                ("media_seconds_total", "counter", self.media_seconds, "Seconds of media written by done jobs"),
+                ("verify_seconds_total", "counter", self.verify_seconds, "Wall seconds spent checking outputs"),
+                ("jobs_running", "gauge", self.running, "Jobs running now"),
+                ("jobs_pending", "gauge", self.pending, "Jobs waiting to run")]:
+            lines += [f"# HELP {prefix}_{name} {help_text}", f"# TYPE {prefix}_{name} {kind}",
+                      f"{prefix}_{name} {value:g}"]
+        for name, histogram, help_text in [
+                ("job_wall_seconds", self.wall_time, "Time from starting a job to its exit"),
+                ("job_queue_wait_seconds", self.queue_wait, "Time a job was ready before it started"),
+                ("job_spawn_latency_seconds", self.spawn_latency, "Time from starting a job to its process running"),
+                ("job_speed", self.speed, "Media seconds encoded per wall second of done jobs")]:
+            lines += [f"# HELP {prefix}_{name} {help_text}", f"# TYPE {prefix}_{name} histogram"]
+            lines += histogram.lines(f"{prefix}_{name}")
+        return "\n".join(lines) + "\n"
+
+    def update(self, prometheus_file: str = None):
+        """Render the text again and write it to prometheus_file if given, atomically for scrapers"""
+        self.text = self.render()
+        if prometheus_file:
+            temp_path = f"{prometheus_file}.tmp"
+            with open(temp_path, "w", encoding="utf-8") as file:
+                file.write(self.text)
+            os.replace(temp_path, prometheus_file)
+
+
+class MetricsServer:
+    """Serve the text of a registry at http://host:port/metrics from a background thread"""
+
+    def __init__(self, registry: MetricsRegistry, port: int, host: str = "127.0.0.1"):
+        # only needed when the endpoint is enabled, keep it out of the GUI startup
+        import threading
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] not in ("/", "/metrics"):
+                    self.send_error(404)
+                    return
+                body = registry.text.encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        # raises OSError if the port is taken
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def port(self):
+        return self.server.server_address[1]
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class BatchMetrics:
+    """Measure every job of a batch from the runner's signals
+
+    One JSON line per finished job and one for the whole batch are appended to
+    jsonl_path, and the registry is updated as jobs finish. The speed of done ffmpeg jobs
+    goes into history, media maps inputs to their MediaInfo for its keys.
+    """
+
+    def __init__(self, jobs: list, runner, registry: MetricsRegistry = None, jsonl_path: str = None,
+                 prometheus_file: str = None, history: ThroughputHistory = None, media: dict = None):
+        self.jobs = jobs
+        self.runner = runner
+        self.history = history
+        self.media = media or {}
+        self.registry = registry or MetricsRegistry()
+        self.jsonl_path = jsonl_path
+        self.prometheus_file = prometheus_file
+        self.start_time = time.monotonic()
+        self.job_metrics = {}
+        self.parsers = {}
+        self.ready_times = {}
+        self.start_times = {}
+        self.is_finished = False
+
+        runner.job_started.connect(self.handle_start)
+        runner.job_spawned.connect(self.handle_spawn)
+        runner.job_stdout.connect(self.handle_stdout)
+        runner.job_finished.connect(self.handle_finish)
+        runner.all_finished.connect(self.finish)
+
+        for job in jobs:
+            if job.state == JobState.PENDING and not job.depends_on:
+                self.ready_times[job.index] = self.start_time
+        self.registry.batches += 1
+        self.update_gauges()
+        self.write({"event": "batch_start", "time": time.time(), "jobs": len(jobs),
+                    "pending": sum(1 for job in jobs if job.state == JobState.PENDING)})
+
+    def job(self, index: int):
+        job = self.jobs[index]
+        metrics = self.job_metrics.get(index)
+        if metrics is None:
+            metrics = JobMetrics(index=index, input_file=job.input_file, output_file=job.output_file,
+                                 encoder=video_encoder_from_arguments(job.arguments), verifies=job.verifies)
+            self.job_metrics[index] = metrics
+        return metrics
+
+    def handle_start(self, index: int):
+        now = time.monotonic()
+        metrics = self.job(index)
+        if metrics.queue_wait is None:
+            metrics.queue_wait = now - self.ready_times.get(index, now)
+        self.start_times[index] = now
+        self.parsers[index] = ProgressParser()
+        metrics.node = self.runner.job_node(index)
+        self.update_gauges()
+
+    def handle_spawn(self, index: int):
+        if index in self.start_times:
+            self.job(index).spawn_latency = time.monotonic() - self.start_times[index]
+
+    def handle_stdout(self, index: int, data: str):
+        parser = self.parsers.get(index)
+        if parser is not None:
+            parser.feed(data)
+
+    def handle_finish(self, index: int, exit_code: int):
+        now = time.monotonic()
+        job = self.jobs[index]
+        metrics = self.job(index)
+        metrics.state = job.state.name
+        metrics.exit_code = exit_code
+        metrics.retries = self.runner.retry_count(index)
+        metrics.failure = job.failure
+        metrics.degraded = job.degraded
+        if index in self.start_times:
+            metrics.wall_time = now - self.start_times[index]
+        parser = self.parsers.pop(index, None)
+        if parser is not None and parser.out_time_us > 0:
+            metrics.media_seconds = parser.out_time()
+            metrics.frames = parser.frame
+            if metrics.wall_time:
+                metrics.speed = metrics.media_seconds / metrics.wall_time
+                metrics.fps = parser.frame / metrics.wall_time if parser.frame else None
+                if (self.history is not None and job.state == JobState.DONE and job.program is None
+                        and not job.is_analysis):
+                    self.history.record(throughput_key(job.arguments, self.media.get(job.input_file)),
+                                        metrics.media_seconds, metrics.wall_time)
+        if index in self.start_times and job.verifies is None:
+            metrics.bytes_in = (file_identity(job.input_file) or (None,))[0] if job.input_file else None
+            sizes = [identity[0] for identity in map(file_identity, job.outputs()) if identity is not None]
+            metrics.bytes_out = sum(sizes) if sizes else None
+
+        # jobs waiting for this one are ready from now on
+        if job.state == JobState.DONE:
+            for other in self.runner.dependents.get(index, []):
+                if self.jobs[other].is_ready(self.jobs):
+                    self.ready_times.setdefault(other, now)
+
+        self.registry.add_job(metrics)
+        self.update_gauges()
+        self.write(dict(event="job", time=time.time(), **metrics.to_dict()))
+
+    def update_gauges(self):
+        self.registry.running = sum(1 for job in self.jobs if job.state == JobState.RUNNING)
+        self.registry.pending = sum(1 for job in self.jobs if job.state == JobState.PENDING)
+        try:
+            self.registry.update(self.prometheus_file)
+        except OSError:
+            # a scraper reading a stale file is better than a failing batch
+            pass
+
+    def summary(self):
+        finished = [metrics for metrics in self.job_metrics.values() if metrics.state != JobState.PENDING.name]
+        wall_time = time.monotonic() - self.start_time
+        media_seconds = sum(metrics.media_seconds or 0.0 for metrics in finished
+                            if metrics.state == JobState.DONE.name and metrics.verifies is None)
+        verified = {job.verifies for job in self.jobs if job.verifies is not None}
+        return {"wall_time": wall_time,
+                "jobs": len(self.jobs),
+                "done": sum(1 for job in self.jobs if job.state == JobState.DONE),
+                "failed": sum(1 for job in self.jobs if job.state == JobState.FAILED),
+                "cancelled": sum(1 for job in self.jobs if job.state == JobState.CANCELLED),
+                "retries": sum(metrics.retries for metrics in finished),
+                "media_seconds": media_seconds,
+                "speed": media_seconds / wall_time if wall_time > 0 else None,
+                "bytes_in": sum(metrics.bytes_in or 0 for metrics in finished),
+                "bytes_out": sum(metrics.bytes_out or 0 for metrics in finished),
+                "verify_jobs": sum(1 for metrics in finished if metrics.verifies is not None),
+                "verify_time": sum(metrics.wall_time or 0.0 for metrics in finished if metrics.verifies is not None),
+                # outputs ffmpeg wrote without an error that failed their checks
+                "verify_failed": sum(1 for index in verified
+                                     if self.jobs[index].state == JobState.FAILED and self.jobs[index].exit_code == 0)}
+
+    def finish(self):
+        """Write the batch summary line, also called when a batch is stopped"""
+        if self.is_finished:
+            return
+        self.is_finished = True
+        # the runner is reused by the next batch, which gets its own metrics
+        self.runner.job_started.disconnect(self.handle_start)
+        self.runner.job_spawned.disconnect(self.handle_spawn)
+        self.runner.job_stdout.disconnect(self.handle_stdout)
+        self.runner.job_finished.disconnect(self.handle_finish)
+        self.runner.all_finished.disconnect(self.finish)
+        self.update_gauges()
+        self.write(dict(event="batch", time=time.time(), **self.summary()))
+        if self.history is not None:
+            try:
+                self.history.save()
+            except OSError:
+                pass
+
+    def write(self, record: dict):
+        if not self.jsonl_path:
+            return
+        try:
+            with open(self.jsonl_path, "a", encoding="utf-8") as file:
+                file.write(json.dumps(record) + "\n")
+        except OSError:
+            pass
@@ -0,0 +1,229 @@
+import hashlib
+import json
+import os
+import shutil
+from collections import OrderedDict
+
+import src.constants as constants
+from src.jobs import JobState, skip_feeding_jobs
+from src.probe import file_identity
+from src.settings import EncodeSettings, build_arguments
+from src.trim import format_trim
+
+# options that change what ffmpeg prints or asks, never what it writes
+IGNORED_FLAGS = {"-y", "-n", "-nostdin", "-hide_banner", "-stats", "-nostats"}
+IGNORED_OPTIONS = {"-v", "-loglevel", "-progress", "-stats_period", "-threads"}
+
+
+def normalize_arguments(arguments: list):
+    """Arguments without the options that don't change the output"""
+    result = []
+    skip = False
+    for argument in arguments:
+        if skip:
+            skip = False
+        elif argument in IGNORED_OPTIONS:
+            skip = True
+        elif argument not in IGNORED_FLAGS:
+            result.append(argument)
+    return result
+
+
+def output_key_arguments(settings: EncodeSettings, arguments: list = None):
+    """Everything of a batch that decides the content of an output, besides the input itself
+
+    The options of the command editor plus the settings build_jobs turns into a different
+    plan per file, e.g. copying matching streams or two-pass.
+    """
+    if arguments is None:
+        arguments = build_arguments(settings)
+    return normalize_arguments(arguments) + [
+        f"auto_stream_copy={settings.auto_stream_copy}",
+        f"two_pass={settings.use_two_pass()}",
+        f"segments={settings.segment_count if settings.segmented_encoding else 1}",
+        f"ladder={settings.ladder_renditions if settings.encoding_ladder else ''}",
+    ]
+
+
+def sample_fingerprint(path: str, size: int):
+    """Hash of the size and a few blocks spread over the file, cheap even for huge inputs"""
+    block = constants.FINGERPRINT_BLOCK_SIZE
+    digest = hashlib.sha1(str(size).encode("utf-8"))
+    with open(path, "rb") as file:
+        for offset in sorted({0, max(0, size // 2 - block // 2), max(0, size - block)}):
+            file.seek(offset)
+            digest.update(file.read(block))
+    return digest.hexdigest()
+
+
+def link_or_copy(source: str, destination: str):
+    """Make destination a hard link of source, or a copy where linking isn't possible"""
+    temp_path = f"{destination}.tmp"
+    if os.path.lexists(temp_path):
+        os.remove(temp_path)
+    try:
+        os.link(source, temp_path)
+    except OSError:
+        # other file systems, or one that doesn't support hard links
+        shutil.copyfile(source, temp_path)
+    os.replace(temp_path, destination)
+
+
+class OutputCache:
+    """Outputs written by earlier jobs keyed by input content and options, persisted as JSON
+
+    An entry keeps the size and mtime every recorded output had when it was written, an
+    output that changed or disappeared since then is never reused.
+    """
+
+    def __init__(self, path: str = None, max_entries: int = constants.OUTPUT_CACHE_SIZE):
+        self.path = path or os.path.join(constants.CACHE_DIRECTORY, "outputs.json")
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        # input fingerprints keyed by path, reused while size and mtime stay the same
+        self.fingerprints = OrderedDict()
+        self.is_dirty = False
+        self.is_loaded = False
+
+    def load(self):
+        """Read the cache file, done on first use so creating a cache costs nothing at startup"""
+        if self.is_loaded:
+            return
+        self.is_loaded = True
+        try:
+            with open(self.path, "r", encoding="utf-8") as file:
+                data = json.load(file)
+            self.entries = OrderedDict(data["outputs"])
+            self.fingerprints = OrderedDict(data["fingerprints"])
+        except (OSError, KeyError, TypeError, ValueError):
+            return
+
+    def save(self):
+        """Write the cache to disk if it changed, replacing the old file atomically"""
+        if not self.is_dirty:
+            return
+        self.load()
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as file:
+            json.dump({"outputs": self.entries, "fingerprints": self.fingerprints}, file)
+        os.replace(temp_path, self.path)
+        self.is_dirty = False
+
+    def fingerprint(self, path: str):
+        """Fingerprint of the content of path, or None if it can't be read"""
+        self.load()
+        identity = file_identity(path)
+        if identity is None:
+            return None
+        entry = self.fingerprints.get(path)
+        if entry is not None and entry[:2] == list(identity):
+            self.fingerprints.move_to_end(path)
+            return entry[2]
+        try:
+            fingerprint = sample_fingerprint(path, identity[0])
+        except OSError:
+            return None
+        self.fingerprints[path] = [identity[0], identity[1], fingerprint]
+        while len(self.fingerprints) > self.max_entries:
+            self.fingerprints.popitem(last=False)
+        self.is_dirty = True
+        return fingerprint
+
+    def key(self, input_file: str, output_file: str, key_arguments: list):
+        """Key of writing output_file from input_file, or None if the input can't be read"""
+        fingerprint = self.fingerprint(input_file)
+        if fingerprint is None:
+            return None
+        # the extension picks the muxer, the rest of the output name doesn't matter
+        text = "\0".join([fingerprint, os.path.splitext(output_file)[1].lower()] + key_arguments)
+        return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+    def get(self, key: str):
+        """Return the recorded outputs of key that are still unchanged"""
+        self.load()
+        outputs = self.entries.get(key)
+        if outputs is None:
+            return []
+        valid = [output for output in outputs if list(file_identity(output[0]) or []) == output[1:]]
+        if len(valid) != len(outputs):
+            self.is_dirty = True
+            if valid:
+                self.entries[key] = valid
+            else:
+                del self.entries[key]
+                return []
+        self.entries.move_to_end(key)
+        return [output[0] for output in valid]
+
+    def put(self, key: str, output_file: str):
+        self.load()
+        identity = file_identity(output_file)
+        if identity is None:
+            return
+        outputs = [output for output in self.entries.get(key, []) if output[0] != output_file]
+        self.entries[key] = [[output_file, identity[0], identity[1]]] + outputs[:constants.OUTPUT_CACHE_COPIES - 1]
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+        self.is_dirty = True
+
+
+def reuse_outputs(jobs: list, cache: OutputCache, key_arguments: list):
+    """Skip the jobs whose output an earlier job already wrote, record the others when done
+
+    An output that is already in place marks its job done, one elsewhere is hard linked
+    or copied to the new name first. A job writing several outputs, e.g. a ladder, is only
+    skipped if all of them can be reused. Jobs that only feed a skipped job, e.g. segments
+    or pass 1, are skipped with it. Return the number of skipped jobs.
+    """
+    needed = {index for job in jobs for index in job.depends_on}
+    skipped = 0
+    for job in jobs:
+        # keyframe indexes, pass 1 and segments are intermediate, only final outputs are cached
+        if job.index in needed or job.program is not None or not job.output_file or job.state == JobState.DONE:
+            continue
+        outputs = job.outputs()
+        job_arguments = key_arguments + ([f"trim={format_trim(job.trim)}"] if job.trim is not None else [])
+        keys = [cache.key(job.input_file, output, job_arguments + ([f"output={i}"] if len(outputs) > 1 else []))
+                for i, output in enumerate(outputs)]
+        if None in keys:
+            continue
+        if all(restore_output(cache, key, output) for key, output in zip(keys, outputs)):
+            job.state = JobState.DONE
+            skipped += 1
+        else:
+            job.on_done = record_output(cache, keys, job.on_done)
+
+    # then whatever only fed the skipped jobs, following chains such as index -> segments -> concat
+    return skipped + skip_feeding_jobs(jobs)
+
+
+def restore_output(cache: OutputCache, key: str, output_file: str):
+    """Put a recorded output of key in place as output_file, return whether there was one"""
+    for output in cache.get(key):
+        try:
+            if not os.path.exists(output_file) or not os.path.samefile(output, output_file):
+                link_or_copy(output, output_file)
+                cache.put(key, output_file)
+        except OSError:
+            continue
+        return True
+    return False
+
+
+def record_output(cache: OutputCache, keys: list, on_done=None):
+    def on_done_and_record(job):
+        if on_done is not None:
+            on_done(job)
+        # the keys stand for the requested options, not those a retry fell back to
+        if job.degraded is not None:
+            return
+        for key, output in zip(keys, job.outputs()):
+            cache.put(key, output)
+        try:
+            cache.save()
+        except OSError:
+            # the output is fine, only a later batch can't reuse it
+            pass
+    return on_done_and_record
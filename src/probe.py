@@ -0,0 +1,220 @@
+import json
+import os
+from collections import OrderedDict
+from dataclasses import asdict, dataclass, field
+
+import src.constants as constants
+
+
+@dataclass(slots=True)
+class StreamInfo:
+    index: int
+    codec_type: str
+    codec_name: str = ""
+    width: int = 0
+    height: int = 0
+    fps: float = 0.0
+    bitrate: int = 0
+    channels: int = 0
+    sample_rate: int = 0
+    # ffmpeg prefers a default stream when it picks one of a kind without -map
+    is_default: bool = False
+    # what a smart cut matches when it encodes the edges of a copied video stream
+    profile: str = ""
+    level: int = 0
+    pix_fmt: str = ""
+
+
+@dataclass(slots=True)
+class MediaInfo:
+    """Compact summary of an ffprobe result"""
+    path: str
+    duration: float = 0.0
+    bitrate: int = 0
+    format_name: str = ""
+    streams: list = field(default_factory=list)
+
+    def video_stream(self):
+        for stream in self.streams:
+            if stream.codec_type == "video":
+                return stream
+        return None
+
+    def audio_streams(self):
+        return [stream for stream in self.streams if stream.codec_type == "audio"]
+
+    def default_audio_stream(self):
+        """The audio stream ffmpeg picks without -map, a default one first, then the most channels"""
+        return max(self.audio_streams(), key=lambda stream: (stream.is_default, stream.channels), default=None)
+
+    def subtitle_streams(self):
+        return [stream for stream in self.streams if stream.codec_type == "subtitle"]
+
+    def resolution(self):
+        stream = self.video_stream()
+        return (stream.width, stream.height) if stream else None
+
+    def fps(self):
+        stream = self.video_stream()
+        return stream.fps if stream else 0.0
+
+    def summary(self):
+        """Human readable lines for the log"""
+        lines = [f"{self.path}: {self.format_name}, {self.duration:.2f}s, {self.bitrate // 1000} kb/s"]
+        for stream in self.streams:
+            match stream.codec_type:
+                case "video":
+                    lines.append(f"  #{stream.index} video {stream.codec_name} {stream.width}x{stream.height} {stream.fps:.3g} fps")
+                case "audio":
+                    lines.append(f"  #{stream.index} audio {stream.codec_name} {stream.sample_rate} Hz {stream.channels} ch")
+                case _:
+                    lines.append(f"  #{stream.index} {stream.codec_type} {stream.codec_name}")
+        return lines
+
+    def to_dict(self):
+        return asdict(self)
+
+    @staticmethod
+    def from_dict(data: dict):
+        streams = [StreamInfo(**stream) for stream in data.get("streams", [])]
+        return MediaInfo(path=data["path"], duration=data["duration"], bitrate=data["bitrate"],
+                         format_name=data["format_name"], streams=streams)
+
+
+def probe_arguments(path: str):
+    return ["-v", "error", "-print_format", "json", "-show_format", "-show_streams", path]
+
+
+def parse_rate(rate: str):
+    """Convert an ffprobe rate such as 30000/1001 to a float"""
+    numerator, _, denominator = (rate or "0").partition("/")
+    try:
+        if denominator:
+            return float(numerator) / float(denominator) if float(denominator) else 0.0
+        return float(numerator)
+    except ValueError:
+        return 0.0
+
+
+def parse_number(value, default=0):
+    try:
+        return type(default)(float(value))
+    except (TypeError, ValueError):
+        return default
+
+
+def parse_probe_output(path: str, output: str):
+    """Turn ffprobe's JSON output into a MediaInfo"""
+    data = json.loads(output)
+    format_data = data.get("format", {})
+
+    streams = []
+    for stream in data.get("streams", []):
+        fps = parse_rate(stream.get("avg_frame_rate")) or parse_rate(stream.get("r_frame_rate"))
+        streams.append(StreamInfo(index=stream.get("index", len(streams)),
+                                  codec_type=stream.get("codec_type", ""),
+                                  codec_name=stream.get("codec_name", ""),
+                                  width=stream.get("width", 0),
+                                  height=stream.get("height", 0),
+                                  fps=fps,
+                                  bitrate=parse_number(stream.get("bit_rate")),
+                                  channels=stream.get("channels", 0),
+                                  sample_rate=parse_number(stream.get("sample_rate")),
+                                  is_default=bool(stream.get("disposition", {}).get("default")),
+                                  profile=stream.get("profile", ""),
+                                  level=parse_number(stream.get("level")),
+                                  pix_fmt=stream.get("pix_fmt", "")))
+
+    return MediaInfo(path=path,
+                     duration=parse_number(format_data.get("duration"), 0.0),
+                     bitrate=parse_number(format_data.get("bit_rate")),
+                     format_name=format_data.get("format_name", ""),
+                     streams=streams)
+
+
+def file_identity(path: str):
+    """Return (size, mtime) of a file, or None if it can't be read"""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_size, stat.st_mtime_ns
+
+
+class ProbeCache:
+    """LRU cache of MediaInfo keyed by path, size and mtime, persisted as JSON"""
+
+    def __init__(self, path: str = None, max_entries: int = constants.PROBE_CACHE_SIZE):
+        self.path = path or os.path.join(constants.CACHE_DIRECTORY, "probe_cache.json")
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.is_dirty = False
+        self.is_loaded = False
+
+    def load(self):
+        """Read the cache file, done on first use so creating a cache costs nothing at startup"""
+        if self.is_loaded:
+            return
+        self.is_loaded = True
+        try:
+            with open(self.path, "r", encoding="utf-8") as file:
+                data = json.load(file)
+        except (OSError, ValueError):
+            return
+        for path, entry in data.items():
+            self.entries[path] = entry
+
+    def save(self):
+        """Write the cache to disk if it changed, replacing the old file atomically"""
+        if not self.is_dirty:
+            return
+        self.load()
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as file:
+            json.dump(self.entries, file)
+        os.replace(temp_path, self.path)
+        self.is_dirty = False
+
+    def get(self, path: str):
+        """Return the cached MediaInfo if the file didn't change since it was probed"""
+        self.load()
+        entry = self.entries.get(path)
+        if entry is None:
+            return None
+        identity = file_identity(path)
+        if identity is None or [entry["size"], entry["mtime"]] != list(identity):
+            return None
+        self.entries.move_to_end(path)
+        return MediaInfo.from_dict(entry["info"])
+
+    def put(self, info: MediaInfo):
+        self.load()
+        identity = file_identity(info.path)
+        if identity is None:
+            return
+        self.entries[info.path] = {"size": identity[0], "mtime": identity[1], "info": info.to_dict()}
+        self.entries.move_to_end(info.path)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+        self.is_dirty = True
+
+
+def probe_file(path: str, cache: ProbeCache = None, ffprobe: str = constants.DEFAULT_FFPROBE_PATH):
+    """Probe a file synchronously, using the cache if given; raise RuntimeError on failure"""
+    # only the headless tools probe synchronously, keep subprocess out of the GUI startup
+    import subprocess
+
+    if cache is not None:
+        info = cache.get(path)
+        if info is not None:
+            return info
+
+    result = subprocess.run([ffprobe] + probe_arguments(path), capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip() or f"ffprobe exited with code {result.returncode}")
+    info = parse_probe_output(path, result.stdout)
+
+    if cache is not None:
+        cache.put(info)
+    return info
@@ -0,0 +1,96 @@
+from collections import deque
+
+from PySide6.QtCore import QObject, QProcess, QTimer, Signal
+
+import src.constants as constants
+from src.probe import ProbeCache, parse_probe_output, probe_arguments
+
+
+class ProbeService(QObject):
+    """Probe files in the background with a few ffprobe processes, answering from the cache first"""
+    probed = Signal(str, object)
+    failed = Signal(str, str)
+
+    def __init__(self, program: str = constants.DEFAULT_FFPROBE_PATH, cache: ProbeCache = None, parent=None):
+        super().__init__(parent)
+        self.program = program
+        self.cache = cache or ProbeCache()
+        self.queue = deque()
+        self.queued = set()
+        self.processes = {}
+
+        # write the cache every few seconds while probing and when the queue drains
+        self.save_timer = QTimer(self)
+        self.save_timer.setSingleShot(True)
+        self.save_timer.setInterval(5000)
+        self.save_timer.timeout.connect(self.cache.save)
+
+    def get(self, path: str):
+        """Return the cached MediaInfo of path, or None"""
+        return self.cache.get(path)
+
+    def request(self, paths: list, priority: bool = False):
+        """Probe every path that is not cached yet, return how many probes were queued"""
+        count = 0
+        for path in paths:
+            if path in self.queued or path in self.processes:
+                continue
+            info = self.cache.get(path)
+            if info is not None:
+                self.probed.emit(path, info)
+                continue
+            if priority:
+                self.queue.appendleft(path)
+            else:
+                self.queue.append(path)
+            self.queued.add(path)
+            count += 1
+        self.fill_workers()
+        return count
+
+    def cancel(self):
+        self.queue.clear()
+        self.queued.clear()
+
+    def fill_workers(self):
+        while self.queue and len(self.processes) < constants.MAX_PARALLEL_PROBES:
+            path = self.queue.popleft()
+            self.queued.discard(path)
+            self.start_probe(path)
+
+        if not self.queue and not self.processes:
+            self.save_timer.stop()
+            self.cache.save()
+
+    def start_probe(self, path: str):
+        process = QProcess(self)
+        process.finished.connect(lambda exit_code, exit_status: self.handle_finish(path, process, exit_code))
+        process.errorOccurred.connect(lambda error: self.handle_error(path, process, error))
+        self.processes[path] = process
+        process.start(self.program, probe_arguments(path))
+
+    def handle_finish(self, path: str, process: QProcess, exit_code: int):
+        if self.processes.pop(path, None) is None:
+            return
+        process.deleteLater()
+
+        if exit_code == 0:
+            try:
+                info = parse_probe_output(path, process.readAllStandardOutput().data().decode("utf-8"))
+            except ValueError as error:
+                self.failed.emit(path, str(error))
+            else:
+                self.cache.put(info)
+                if not self.save_timer.isActive():
+                    self.save_timer.start()
+                self.probed.emit(path, info)
+        else:
+            self.failed.emit(path, process.readAllStandardError().data().decode("utf-8", errors="replace").strip())
+        self.fill_workers()
+
+    def handle_error(self, path: str, process: QProcess, error: QProcess.ProcessError):
+        # finished is never emitted for a process that could not be started
+        if error == QProcess.FailedToStart and self.processes.pop(path, None) is not None:
+            process.deleteLater()
+            self.failed.emit(path, process.errorString())
+            self.fill_workers()
@@ -0,0 +1,199 @@
+import re
+import time
+
+# global options that make ffmpeg write machine readable progress to stdout
+PROGRESS_ARGUMENTS = ["-progress", "pipe:1", "-nostats"]
+
+DURATION_PATTERN = re.compile(r"Duration: (\d+):(\d\d):(\d\d(?:\.\d+)?)")
+
+
+class ProgressParser:
+    """Incremental parser for the key=value blocks written by ffmpeg -progress"""
+    __slots__ = ("remainder", "out_time_us", "frame", "fps", "speed", "total_size", "is_end")
+
+    def __init__(self):
+        self.remainder = ""
+        self.out_time_us = 0
+        self.frame = 0
+        self.fps = 0.0
+        self.speed = 0.0
+        self.total_size = 0
+        self.is_end = False
+
+    def feed(self, data: str):
+        """Consume a chunk of stdout, return True if at least one block was completed"""
+        if self.remainder:
+            data = self.remainder + data
+        completed = False
+        start = 0
+        while True:
+            end = data.find("\n", start)
+            if end < 0:
+                break
+            separator = data.find("=", start, end)
+            if separator > start:
+                key = data[start:separator]
+                if key == "out_time_us":
+                    self.out_time_us = parse_int(data[separator + 1:end], self.out_time_us)
+                elif key == "frame":
+                    self.frame = parse_int(data[separator + 1:end], self.frame)
+                elif key == "fps":
+                    self.fps = parse_float(data[separator + 1:end], self.fps)
+                elif key == "speed":
+                    self.speed = parse_float(data[separator + 1:end].rstrip("x \r"), self.speed)
+                elif key == "total_size":
+                    self.total_size = parse_int(data[separator + 1:end], self.total_size)
+                elif key == "progress":
+                    completed = True
+                    self.is_end = data.startswith("end", separator + 1)
+            start = end + 1
+        self.remainder = data[start:]
+        return completed
+
+    def out_time(self):
+        return self.out_time_us / 1000000
+
+
+def parse_int(value: str, default: int):
+    try:
+        return int(value)
+    except ValueError:
+        # ffmpeg writes N/A until the first frame is out
+        return default
+
+
+def parse_float(value: str, default: float):
+    try:
+        return float(value)
+    except ValueError:
+        return default
+
+
+def parse_duration(data: str):
+    """Find the input duration in seconds in ffmpeg's stderr banner, or None"""
+    match = DURATION_PATTERN.search(data)
+    if match is None:
+        return None
+    hours, minutes, seconds = match.groups()
+    return int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+
+
+def format_seconds(seconds: float):
+    seconds = max(0, int(seconds))
+    return f"{seconds // 3600}:{seconds // 60 % 60:02d}:{seconds % 60:02d}"
+
+
+def format_size(size: float):
+    for unit in ("B", "KB", "MB", "GB"):
+        if size < 1024:
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} TB"
+
+
+class JobProgress:
+    """Progress state of one job"""
+    __slots__ = ("parser", "duration", "weight", "is_running", "is_paused", "is_finished")
+
+    def __init__(self, duration: float = None, weight: float = None):
+        self.parser = ProgressParser()
+        self.duration = duration
+        self.weight = weight
+        self.is_running = False
+        self.is_paused = False
+        self.is_finished = False
+
+    def fraction(self):
+        if self.is_finished:
+            return 1.0
+        if not self.duration:
+            return 0.0
+        return min(self.parser.out_time() / self.duration, 1.0)
+
+
+class BatchProgress:
+    """Combine the progress of all jobs of a batch into overall percent, throughput and ETA"""
+
+    def __init__(self, job_count: int, durations: dict = None, weights: dict = None):
+        durations = durations or {}
+        weights = weights or {}
+        self.jobs = [JobProgress(durations.get(index), weights.get(index)) for index in range(job_count)]
+        self.start_time = time.monotonic()
+
+    @staticmethod
+    def from_jobs(jobs: list):
+        return BatchProgress(len(jobs),
+                             {job.index: job.duration for job in jobs if job.duration},
+                             {job.index: job.weight for job in jobs if job.weight is not None})
+
+    def set_duration(self, index: int, duration: float):
+        self.jobs[index].duration = duration
+
+    def start_job(self, index: int):
+        self.jobs[index].is_running = True
+
+    def reset_job(self, index: int):
+        """Forget the progress of a job that runs again from the start"""
+        job = self.jobs[index]
+        self.jobs[index] = JobProgress(job.duration, job.weight)
+
+    def finish_job(self, index: int):
+        job = self.jobs[index]
+        job.is_running = False
+        job.is_paused = False
+        job.is_finished = True
+
+    def set_paused(self, index: int, is_paused: bool):
+        self.jobs[index].is_paused = is_paused
+
+    def is_paused(self, index: int):
+        return self.jobs[index].is_paused
+
+    def feed_stdout(self, index: int, data: str):
+        return self.jobs[index].parser.feed(data)
+
+    def feed_stderr(self, index: int, data: str):
+        """Pick the input duration out of stderr until it is known"""
+        job = self.jobs[index]
+        if job.duration is None:
+            job.duration = parse_duration(data)
+
+    def job_fraction(self, index: int):
+        return self.jobs[index].fraction()
+
+    def weights(self):
+        # jobs with unknown duration weigh as much as an average known one
+        known = [job.duration for job in self.jobs if job.duration]
+        average = sum(known) / len(known) if known else 1.0
+        return [job.weight if job.weight is not None else job.duration or average for job in self.jobs]
+
+    def overall_fraction(self):
+        if not self.jobs:
+            return 1.0
+        weights = self.weights()
+        done = sum(job.fraction() * weight for job, weight in zip(self.jobs, weights))
+        total = sum(weights)
+        if total <= 0:
+            return sum(job.fraction() for job in self.jobs) / len(self.jobs)
+        return done / total
+
+    def running(self):
+        return [index for index, job in enumerate(self.jobs) if job.is_running]
+
+    def speed(self):
+        """Sum of the realtime multipliers of the running jobs, paused ones make no progress"""
+        return sum(job.parser.speed for job in self.jobs if job.is_running and not job.is_paused)
+
+    def fps(self):
+        return sum(job.parser.fps for job in self.jobs if job.is_running and not job.is_paused)
+
+    def output_size(self):
+        return sum(job.parser.total_size for job in self.jobs)
+
+    def eta(self):
+        """Seconds left for the whole batch, or None before anything was measured"""
+        fraction = self.overall_fraction()
+        if fraction <= 0:
+            return None
+        elapsed = time.monotonic() - self.start_time
+        return elapsed * (1 - fraction) / fraction
@@ -0,0 +1,277 @@
+"""Client side of the worker agent protocol, see src/agent.py for the agent
+
+Messages are JSON objects, one per line, with a "type":
+    hello     both ways first: version and token, the agent answers with its name, capacity and cores
+    run       start ffmpeg with "arguments" as job "id"
+    cancel    stop job "id"
+    started   the process of job "id" is running
+    stdout    output of job "id" in "data", stderr likewise
+    finished  job "id" exited with "exit_code", "crashed" if it was killed, "error" if it never started
+"""
+import json
+import os
+
+from PySide6.QtCore import QByteArray, QObject, QProcess, QTimer, Signal
+from PySide6.QtNetwork import QLocalSocket, QTcpSocket
+
+import src.constants as constants
+
+PROTOCOL_VERSION = 1
+
+
+def parse_address(address: str):
+    """Return ("unix", path) or ("tcp", host, port) of an agent address"""
+    address = address.strip()
+    if address.startswith("unix:"):
+        return "unix", address[len("unix:"):]
+    if address.startswith("/"):
+        return "unix", address
+    host, separator, port = address.rpartition(":")
+    if not separator:
+        return "tcp", address or "127.0.0.1", constants.DEFAULT_AGENT_PORT
+    try:
+        return "tcp", host or "127.0.0.1", int(port)
+    except ValueError:
+        raise ValueError(f"Invalid agent address {address}")
+
+
+def parse_addresses(text: str):
+    """Split a comma or whitespace separated list of agent addresses"""
+    return [address for address in text.replace(",", " ").split() if address]
+
+
+def default_token():
+    return os.environ.get(constants.AGENT_TOKEN_VARIABLE, "")
+
+
+def encode_message(message: dict):
+    return json.dumps(message).encode("utf-8") + b"\n"
+
+
+class MessageReader:
+    """Split the bytes read from a socket into messages, one JSON object per line"""
+
+    def __init__(self):
+        self.buffer = b""
+
+    def feed(self, data: bytes):
+        """Return the messages completed by data, raise ValueError on a broken stream"""
+        self.buffer += data
+        lines = self.buffer.split(b"\n")
+        self.buffer = lines.pop()
+        if len(self.buffer) > constants.MAX_AGENT_MESSAGE_BYTES:
+            raise ValueError("message too long")
+        messages = []
+        for line in lines:
+            if line.strip():
+                message = json.loads(line)
+                if not isinstance(message, dict):
+                    raise ValueError("message is not an object")
+                messages.append(message)
+        return messages
+
+
+def create_socket(kind: str, parent=None):
+    return QLocalSocket(parent) if kind == "unix" else QTcpSocket(parent)
+
+
+def connect_socket(socket, target: tuple):
+    if target[0] == "unix":
+        socket.connectToServer(target[1])
+    else:
+        socket.connectToHost(target[1], target[2])
+
+
+class AgentConnection(QObject):
+    """Connection to one worker agent, reconnecting while the agent is down
+
+    The agent takes up to capacity jobs at a time once it answered the hello.
+    """
+    # name and capacity reported by the agent
+    connected = Signal(str, int)
+    disconnected = Signal(str)
+    # a job slot became free, e.g. after connecting or a job finished
+    available = Signal()
+
+    def __init__(self, address: str, token: str = None, parent=None):
+        super().__init__(parent)
+        self.address = address
+        self.target = parse_address(address)
+        self.token = default_token() if token is None else token
+        self.name = address
+        self.capacity = 0
+        self.cpu_count = 1
+        self.is_ready = False
+        self.is_closed = False
+        self.processes = {}
+        self.next_id = 1
+        self.reader = MessageReader()
+
+        self.socket = create_socket(self.target[0], self)
+        self.socket.connected.connect(self.handle_connect)
+        self.socket.disconnected.connect(lambda: self.handle_disconnect("connection closed"))
+        self.socket.readyRead.connect(self.handle_read)
+        self.socket.errorOccurred.connect(lambda error: self.handle_disconnect(self.socket.errorString()))
+
+        self.reconnect_timer = QTimer(self)
+        self.reconnect_timer.setSingleShot(True)
+        self.reconnect_timer.setInterval(constants.AGENT_RECONNECT_INTERVAL)
+        self.reconnect_timer.timeout.connect(self.open)
+
+    def open(self):
+        if self.is_closed or self.is_ready:
+            return
+        self.socket.abort()
+        self.reader = MessageReader()
+        connect_socket(self.socket, self.target)
+
+    def close(self):
+        self.is_closed = True
+        self.reconnect_timer.stop()
+        # the socket may only be closed on the way out, its signals must not arrive any more
+        self.socket.blockSignals(True)
+        self.socket.abort()
+        self.is_ready = False
+        self.handle_disconnect("closed")
+
+    def free_slots(self):
+        return self.capacity - len(self.processes) if self.is_ready else 0
+
+    def send(self, message: dict):
+        self.socket.write(encode_message(message))
+
+    def start_process(self, process):
+        """Send the job of process to the agent, return its id"""
+        job_id = self.next_id
+        self.next_id += 1
+        self.processes[job_id] = process
+        self.send({"type": "run", "id": job_id, "arguments": process.arguments})
+        return job_id
+
+    def cancel_process(self, job_id: int):
+        self.send({"type": "cancel", "id": job_id})
+
+    def handle_connect(self):
+        self.send({"type": "hello", "version": PROTOCOL_VERSION, "token": self.token})
+
+    def handle_disconnect(self, reason: str):
+        was_ready = self.is_ready
+        self.is_ready = False
+        # the agent stops the jobs of a closed connection, they have to run somewhere else
+        processes, self.processes = self.processes, {}
+        for process in processes.values():
+            process.handle_lost(f"agent {self.name}: {reason}")
+        if was_ready:
+            self.disconnected.emit(reason)
+        if not self.is_closed and not self.reconnect_timer.isActive():
+            self.reconnect_timer.start()
+
+    def handle_read(self):
+        try:
+            messages = self.reader.feed(self.socket.readAll().data())
+        except ValueError as error:
+            self.socket.abort()
+            self.handle_disconnect(f"invalid message: {error}")
+            return
+        for message in messages:
+            self.handle_message(message)
+
+    def handle_message(self, message: dict):
+        message_type = message.get("type")
+        if message_type == "hello":
+            self.name = str(message.get("name") or self.address)
+            self.capacity = max(0, int(message.get("capacity", 1)))
+            self.cpu_count = max(1, int(message.get("cpu_count", 1)))
+            self.is_ready = True
+            self.connected.emit(self.name, self.capacity)
+            self.available.emit()
+            return
+        if message_type == "error":
+            # e.g. a wrong token, which trying again won't fix
+            reason = f"refused: {message.get('message', 'unknown error')}"
+            self.is_closed = True
+            self.disconnected.emit(reason)
+            self.handle_disconnect(reason)
+            return
+
+        process = self.processes.get(message.get("id"))
+        if process is None:
+            return
+        if message_type == "started":
+            process.started.emit()
+        elif message_type == "stdout":
+            process.append_output("stdout", message.get("data", ""))
+        elif message_type == "stderr":
+            process.append_output("stderr", message.get("data", ""))
+        elif message_type == "finished":
+            del self.processes[message["id"]]
+            if message.get("error"):
+                process.handle_lost(f"agent {self.name}: {message['error']}")
+            else:
+                process.handle_finish(int(message.get("exit_code", -1)), bool(message.get("crashed")))
+            self.available.emit()
+
+
+class RemoteProcess(QObject):
+    """A job running on an agent, with the part of the QProcess interface JobRunner uses"""
+    started = Signal()
+    readyReadStandardOutput = Signal()
+    readyReadStandardError = Signal()
+    finished = Signal(int, object)
+    errorOccurred = Signal(object)
+    # the agent went away before the job finished, it may run again elsewhere
+    lost = Signal(str)
+
+    def __init__(self, connection: AgentConnection, parent=None):
+        super().__init__(parent)
+        self.connection = connection
+        self.arguments = []
+        self.job_id = None
+        self.output = {"stdout": "", "stderr": ""}
+        self.is_finished = False
+
+    def start(self, program: str, arguments: list):
+        # the agent runs its own ffmpeg, only the arguments travel
+        self.arguments = list(arguments)
+        self.job_id = self.connection.start_process(self)
+
+    def terminate(self):
+        if self.is_finished:
+            return
+        if self.connection.is_ready:
+            self.connection.cancel_process(self.job_id)
+        else:
+            self.connection.processes.pop(self.job_id, None)
+            QTimer.singleShot(0, lambda: self.handle_lost("agent not connected"))
+
+    def errorString(self):
+        return ""
+
+    def readAllStandardOutput(self):
+        return self.take_output("stdout")
+
+    def readAllStandardError(self):
+        return self.take_output("stderr")
+
+    def take_output(self, channel: str):
+        data, self.output[channel] = self.output[channel], ""
+        return QByteArray(data.encode("utf-8"))
+
+    def append_output(self, channel: str, data: str):
+        self.output[channel] += data
+        if channel == "stdout":
+            self.readyReadStandardOutput.emit()
+        else:
+            self.readyReadStandardError.emit()
+
+    def handle_finish(self, exit_code: int, is_crashed: bool):
+        if self.is_finished:
+            return
+        self.is_finished = True
+        self.finished.emit(exit_code, QProcess.CrashExit if is_crashed else QProcess.NormalExit)
+
+    def handle_lost(self, reason: str):
+        if self.is_finished:
+            return
+        self.is_finished = True
+        self.lost.emit(reason)
@@ -0,0 +1,117 @@
+import os
+import shutil
+import tempfile
+import time
+
+from PySide6.QtCore import QObject, Signal
+
+import src.constants as constants
+from src.job_runner import JobRunner
+from src.jobs import JobState
+from src.sampling import SampleEstimate, build_sample_jobs, parse_quality
+from src.throughput import ThroughputHistory, throughput_key
+
+
+class SampleEstimator(QObject):
+    """Encode a few samples of every input with the batch options and extrapolate size, time and quality
+
+    The samples run on their own JobRunner in a temporary directory that is removed
+    once every estimate is out.
+    """
+    # input path and its SampleEstimate, once all its samples finished
+    estimated = Signal(str, object)
+    finished = Signal()
+
+    def __init__(self, program: str = constants.DEFAULT_FFMPEG_PATH, history: ThroughputHistory = None, parent=None):
+        super().__init__(parent)
+        self.history = history
+        self.runner = JobRunner(program, self)
+        self.runner.report_progress = False
+        self.runner.job_started.connect(self.handle_start)
+        self.runner.job_stderr.connect(self.handle_stderr)
+        self.runner.job_finished.connect(self.handle_finish)
+        self.runner.all_finished.connect(self.handle_all_finished)
+        self.work_directory = None
+        self.jobs = []
+        self.media = {}
+        self.estimates = {}
+        self.remaining = {}
+        self.qualities = {}
+        self.start_times = {}
+        self.stderr = {}
+
+    def is_running(self):
+        return self.runner.is_running
+
+    def start(self, media: dict, arguments: list, file_format: str, workers: int, quality: bool = False):
+        """Estimate every input of media, a dict of path to MediaInfo, encoded with arguments"""
+        self.work_directory = tempfile.mkdtemp(prefix="ffmpeg-gui-samples-")
+        self.jobs = []
+        self.media = media
+        self.estimates = {}
+        self.remaining = {}
+        self.qualities = {}
+        self.start_times = {}
+        self.stderr = {}
+        for path, info in media.items():
+            jobs = build_sample_jobs(path, info.duration, arguments, file_format, self.work_directory,
+                                     len(self.jobs), quality)
+            self.estimates[path] = SampleEstimate(path, info.duration)
+            self.remaining[path] = len(jobs)
+            self.qualities[path] = []
+            self.jobs += jobs
+        self.runner.start(self.jobs, workers)
+
+    def cancel(self):
+        self.runner.cancel_all()
+        self.remove_samples()
+
+    def handle_start(self, index: int):
+        self.start_times[index] = time.monotonic()
+
+    def handle_stderr(self, index: int, data: str):
+        # only the summary at the end of a quality job is needed
+        if self.jobs[index].output_file == "":
+            self.stderr[index] = (self.stderr.get(index, "") + data)[-constants.MAX_STDERR_TAIL:]
+
+    def handle_finish(self, index: int, exit_code: int):
+        job = self.jobs[index]
+        estimate = self.estimates[job.input_file]
+        wall_time = time.monotonic() - self.start_times.pop(index, time.monotonic())
+        if job.state != JobState.DONE:
+            estimate.failed += 1
+        elif job.output_file:
+            try:
+                estimate.sample_bytes += os.path.getsize(job.output_file)
+            except OSError:
+                estimate.failed += 1
+            else:
+                estimate.sample_seconds += job.duration
+                estimate.encode_seconds += wall_time
+                if self.history is not None:
+                    self.history.record(throughput_key(job.arguments, self.media.get(job.input_file)),
+                                        job.duration, wall_time)
+        else:
+            self.qualities[job.input_file].append(parse_quality(self.stderr.pop(index, "")))
+
+        self.remaining[job.input_file] -= 1
+        if self.remaining[job.input_file] == 0:
+            psnr = [value[0] for value in self.qualities[job.input_file] if value[0] is not None]
+            ssim = [value[1] for value in self.qualities[job.input_file] if value[1] is not None]
+            estimate.psnr = sum(psnr) / len(psnr) if psnr else None
+            estimate.ssim = sum(ssim) / len(ssim) if ssim else None
+            self.estimated.emit(job.input_file, estimate)
+
+    def handle_all_finished(self):
+        self.remove_samples()
+        if self.history is not None:
+            try:
+                self.history.save()
+            except OSError:
+                pass
+        self.finished.emit()
+
+    def remove_samples(self):
+        if self.work_directory is not None:
+            shutil.rmtree(self.work_directory, ignore_errors=True)
+            self.work_directory = None
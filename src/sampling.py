@@ -0,0 +1,93 @@
+import os
+import re
+from dataclasses import dataclass
+
+import src.constants as constants
+from src.jobs import Job
+from src.progress import format_seconds, format_size
+
+PSNR_PATTERN = re.compile(r"PSNR .*?average:(\S+)")
+SSIM_PATTERN = re.compile(r"SSIM .*?All:(\S+)")
+
+# both streams start at 0 in the same time base, the source is scaled to the encoded size
+QUALITY_GRAPH = ("[0:v:0]settb=AVTB,setpts=PTS-STARTPTS[source];[1:v:0]settb=AVTB,setpts=PTS-STARTPTS[encoded];"
+                 "[source][encoded]scale2ref=flags=bicubic[reference][distorted];"
+                 "[distorted]split[distorted1][distorted2];[reference]split[reference1][reference2];"
+                 "[distorted1][reference1]psnr;[distorted2][reference2]ssim")
+
+
+def sample_ranges(duration: float, count: int = constants.SAMPLE_COUNT, length: float = constants.SAMPLE_LENGTH):
+    """(start, length) of count samples centered in equal parts of the input, the whole input if it's short"""
+    if duration <= count * length:
+        return [(0.0, duration)]
+    return [(duration * (i + 0.5) / count - length / 2, length) for i in range(count)]
+
+
+def parse_quality(stderr: str):
+    """Return (PSNR average, SSIM all) printed by the psnr and ssim filters, None if missing"""
+    values = []
+    for pattern in (PSNR_PATTERN, SSIM_PATTERN):
+        match = pattern.search(stderr)
+        try:
+            values.append(float(match.group(1)) if match is not None else None)
+        except ValueError:
+            # psnr prints inf for identical frames
+            values.append(None)
+    return tuple(values)
+
+
+@dataclass
+class SampleEstimate:
+    """What encoding a whole input would cost, extrapolated from its samples"""
+    input_file: str
+    duration: float
+    sample_seconds: float = 0.0
+    sample_bytes: int = 0
+    # wall time of the sample encodes, run in parallel like a batch
+    encode_seconds: float = 0.0
+    psnr: float = None
+    ssim: float = None
+    failed: int = 0
+
+    def size(self):
+        return self.sample_bytes / self.sample_seconds * self.duration if self.sample_seconds > 0 else None
+
+    def time(self):
+        return self.encode_seconds / self.sample_seconds * self.duration if self.sample_seconds > 0 else None
+
+    def summary(self):
+        if self.size() is None:
+            return "estimate failed"
+        parts = [f"~{format_size(self.size())}", f"~{format_seconds(self.time())}"]
+        if self.psnr is not None:
+            parts.append(f"PSNR {self.psnr:.1f} dB")
+        if self.ssim is not None:
+            parts.append(f"SSIM {self.ssim:.3f}")
+        if self.failed:
+            parts.append(f"{self.failed} samples failed")
+        return ", ".join(parts)
+
+
+def build_sample_jobs(input_file: str, duration: float, arguments: list, file_format: str, work_directory: str,
+                      first_index: int, quality: bool = False):
+    """Jobs that encode the samples of an input with arguments, each followed by a quality job if asked
+
+    Only the encodes have an estimated time, so the runner starts them before the quality
+    jobs, which would otherwise slow down the encodes being timed.
+    """
+    jobs = []
+    os.makedirs(work_directory, exist_ok=True)
+    stem = os.path.splitext(os.path.basename(input_file))[0]
+    for i, (start, length) in enumerate(sample_ranges(duration)):
+        trim = ["-ss", f"{start:.3f}", "-t", f"{length:.3f}"]
+        sample_path = os.path.join(work_directory, f"{first_index + len(jobs):05d}-{stem}-{i}.{file_format}")
+        encode = Job(index=first_index + len(jobs), arguments=["-y"] + trim + ["-i", input_file] + arguments
+                     + [sample_path], input_file=input_file, output_file=sample_path, duration=length,
+                     estimated_time=length)
+        jobs.append(encode)
+        if quality:
+            jobs.append(Job(index=first_index + len(jobs),
+                            arguments=trim + ["-i", input_file, "-i", sample_path, "-lavfi", QUALITY_GRAPH,
+                                              "-f", "null", "-"],
+                            input_file=input_file, duration=length, depends_on=[encode.index]))
+    return jobs
@@ -0,0 +1,87 @@
+import os
+import shutil
+
+import src.constants as constants
+from src.jobs import Job
+from src.keyframes import nearest_keyframe
+
+
+def plan_segments(duration: float, count: int, keyframes: list = None):
+    """Split [0, duration) into count (start, end) ranges, cutting at keyframes where possible
+
+    The last range ends with None. Cuts that would collide after snapping stay at the even
+    split point, re-encoding from there is still frame accurate, only a bit more decoding.
+    """
+    points = [0.0]
+    for i in range(1, count):
+        target = duration * i / count
+        for point in (nearest_keyframe(keyframes or [], target), target, (points[-1] + duration) / 2):
+            if points[-1] < point < duration:
+                break
+        points.append(point)
+
+    return [(points[i], points[i + 1] if i + 1 < len(points) else None) for i in range(len(points))]
+
+
+def concat_list_entry(path: str):
+    escaped = path.replace("'", "'\\''")
+    return f"file '{escaped}'\n"
+
+
+def build_segmented_jobs(input_file: str, output_file: str, duration: float, count: int, first_index: int,
+                         video_arguments: list, audio_arguments: list, container_arguments: list,
+                         keyframe_cache=None, ffprobe: str = constants.DEFAULT_FFPROBE_PATH,
+                         audio_stream: int = None):
+    """Jobs that encode the video of an input in count parallel pieces and join them with the audio
+
+    An optional ffprobe job indexes the keyframes first, then every segment seeks straight to
+    its range, and a final stream copy job concatenates the segments with the concat demuxer
+    and takes the audio from the original input, audio_stream if given, else the first one.
+    """
+    jobs = []
+    work_directory = f"{output_file}.segments"
+    segment_paths = [os.path.join(work_directory, f"segment-{i:04d}.mkv") for i in range(count)]
+    plan = {}
+
+    if keyframe_cache is not None and keyframe_cache.get(input_file) is None:
+        jobs.append(keyframe_cache.build_index_job(first_index, input_file, ffprobe))
+    index_dependencies = [job.index for job in jobs]
+
+    def get_plan():
+        # every segment reads the same plan, made once the keyframes are known
+        if "segments" not in plan:
+            keyframes = keyframe_cache.get(input_file) if keyframe_cache is not None else None
+            plan["segments"] = plan_segments(duration, count, keyframes)
+        return plan["segments"]
+
+    def prepare_segment(job: Job, segment: int):
+        os.makedirs(work_directory, exist_ok=True)
+        start, end = get_plan()[segment]
+        job.duration = (end if end is not None else duration) - start
+        arguments = ["-y", "-ss", f"{start:.6f}"]
+        if end is not None:
+            arguments += ["-t", f"{end - start:.6f}"]
+        job.arguments = arguments + ["-i", input_file, "-map", "0:v:0"] + video_arguments + [segment_paths[segment]]
+
+    for i in range(count):
+        jobs.append(Job(index=first_index + len(jobs), arguments=[], input_file=input_file, output_file=segment_paths[i],
+                        duration=duration / count, depends_on=index_dependencies,
+                        prepare=lambda job, segment=i: prepare_segment(job, segment)))
+
+    list_path = os.path.join(work_directory, "segments.txt")
+
+    def prepare_concat(job: Job):
+        with open(list_path, "w", encoding="utf-8") as file:
+            file.writelines(concat_list_entry(path) for path in segment_paths)
+
+    def remove_segments(job: Job):
+        shutil.rmtree(work_directory, ignore_errors=True)
+
+    arguments = (["-f", "concat", "-safe", "0", "-i", list_path, "-i", input_file,
+                  "-map", "0:v:0", "-map", f"1:{audio_stream}" if audio_stream is not None else "1:a:0?",
+                  "-map_metadata", "1", "-c:v", "copy"]
+                 + audio_arguments + container_arguments + [output_file])
+    jobs.append(Job(index=first_index + len(jobs), arguments=arguments, input_file=input_file, output_file=output_file,
+                    duration=duration, weight=duration * 0.02,
+                    depends_on=[job.index for job in jobs], prepare=prepare_concat, on_done=remove_segments))
+    return jobs
@@ -0,0 +1,412 @@
+import shlex
+from dataclasses import asdict, dataclass, fields, replace
+
+import src.constants as constants
+from src.jobs import Job, default_worker_count
+from src.ladder import build_ladder_job, parse_renditions
+from src.loudness import LoudnessCache, add_loudness_measurements, loudnorm_filter
+from src.probe import MediaInfo, parse_rate
+from src.segments import build_segmented_jobs
+from src.trim import build_trim_jobs, trim_input_arguments, trimmed_duration
+from src.two_pass import PassLogCache
+from src.utils import get_output_file_path, support_crf
+
+
+@dataclass
+class EncodeSettings:
+    """Everything the config tabs control, independent of the widgets"""
+    # video
+    enable_encode_format: bool = False
+    encode_format: str = "H.264"
+    encode_speed: str = "medium"
+    video_quality: str = "28"
+    enable_video_framerate: bool = False
+    video_framerate: str = "24"
+    enable_video_scale: bool = False
+    video_scale: str = "1920:1080"
+    enable_video_bitrate: bool = False
+    video_bitrate: str = "4000"
+    two_pass: bool = False
+    segmented_encoding: bool = False
+    segment_count: int = 0
+    # copy streams that already match the requested codec, size and framerate
+    auto_stream_copy: bool = False
+    # write several sizes of every input from one decode
+    encoding_ladder: bool = False
+    ladder_renditions: str = constants.DEFAULT_LADDER_RENDITIONS
+
+    # audio
+    audio_copy: bool = True
+    enable_audio_format: bool = False
+    audio_format: str = "MP3"
+    enable_audio_compress: bool = False
+    audio_compress: str = "192"
+    # EBU R128 loudness normalization towards loudness_target LUFS, measured first so it's linear
+    loudness_normalization: bool = False
+    loudness_target: str = constants.DEFAULT_LOUDNESS_TARGET
+
+    # format
+    file_format: str = "avi"
+    faststart: bool = False
+
+    # output
+    output_directory: str = ""
+    enable_rename: bool = False
+    rename_mode: str = "Add Prefix"
+    rename_content: str = ""
+    # skip jobs whose output an identical earlier job already wrote
+    reuse_outputs: bool = True
+    # probe every output once it is written, and decode it too
+    verify_outputs: bool = True
+    verify_decode: bool = False
+
+    def to_dict(self):
+        return asdict(self)
+
+    @staticmethod
+    def from_dict(data: dict):
+        """Build settings from a dict, rejecting unknown keys and unsupported values"""
+        names = {field.name for field in fields(EncodeSettings)}
+        unknown = set(data) - names
+        if unknown:
+            raise ValueError(f"Unknown settings: {', '.join(sorted(unknown))}")
+        settings = EncodeSettings(**data)
+        settings.validate()
+        return settings
+
+    def validate(self):
+        if self.encode_format not in constants.SUPPORT_VIDEO_ENCODE_FORMAT:
+            raise ValueError(f"Unsupported encode format {self.encode_format}")
+        if self.encode_speed not in constants.ENCODE_SPEED:
+            raise ValueError(f"Unsupported encode speed {self.encode_speed}")
+        if self.audio_format not in constants.SUPPORT_AUDIO_ENCODE_FORMAT:
+            raise ValueError(f"Unsupported audio format {self.audio_format}")
+        if self.file_format not in constants.SUPPORT_FILE_FORMAT:
+            raise ValueError(f"Unsupported file format {self.file_format}")
+        if self.enable_video_bitrate and not self.video_bitrate.isdigit():
+            raise ValueError(f"Invalid video bit rate {self.video_bitrate or '(empty)'}, expected kb/s")
+        if self.use_audio_bitrate() and not self.audio_compress.isdigit():
+            raise ValueError(f"Invalid audio bit rate {self.audio_compress or '(empty)'}, expected kb/s")
+        if self.encoding_ladder:
+            parse_renditions(self.ladder_renditions)
+        if self.loudness_normalization:
+            try:
+                target = float(self.loudness_target)
+            except ValueError:
+                raise ValueError(f"Invalid loudness target {self.loudness_target}")
+            if not -70 <= target <= -5:
+                raise ValueError(f"Loudness target {self.loudness_target} is outside -70 to -5 LUFS")
+
+    def use_crf(self):
+        return self.enable_encode_format and support_crf(self.encode_format) and not self.enable_video_bitrate
+
+    def use_two_pass(self):
+        return (self.enable_video_bitrate and self.two_pass and self.enable_encode_format
+                and constants.SUPPORT_VIDEO_ENCODE_FORMAT[self.encode_format] in constants.TWO_PASS_ENCODERS)
+
+    def use_audio_bitrate(self):
+        return not self.audio_copy and self.enable_audio_compress and self.audio_format != "FLAC"
+
+    def use_loudness_normalization(self):
+        return not self.audio_copy and self.loudness_normalization
+
+
+def build_video_arguments(settings: EncodeSettings):
+    arguments = []
+    if settings.enable_encode_format:
+        arguments += ["-c:v", constants.SUPPORT_VIDEO_ENCODE_FORMAT[settings.encode_format]]
+
+    if settings.use_crf():
+        arguments += ["-crf", settings.video_quality]
+
+    if settings.enable_video_bitrate:
+        arguments += ["-b:v", f"{settings.video_bitrate}k"]
+
+    arguments += ["-preset", settings.encode_speed]
+
+    if settings.enable_video_framerate:
+        arguments += ["-r", settings.video_framerate]
+
+    if settings.enable_video_scale:
+        arguments += ["-vf", f"scale={settings.video_scale}"]
+
+    return arguments
+
+
+def build_container_arguments(settings: EncodeSettings):
+    if settings.file_format == "mp4" and settings.faststart:
+        return ["-movflags", "faststart"]
+    return []
+
+
+def build_audio_arguments(settings: EncodeSettings):
+    if settings.audio_copy:
+        return ["-c:a", "copy"]
+
+    arguments = []
+    if settings.enable_audio_format:
+        arguments += ["-c:a", constants.SUPPORT_AUDIO_ENCODE_FORMAT[settings.audio_format]]
+    if settings.use_audio_bitrate():
+        arguments += ["-b:a", f"{settings.audio_compress}k"]
+    if settings.use_loudness_normalization():
+        # build_jobs adds the measured values, without them loudnorm normalizes in one pass
+        arguments += ["-af", loudnorm_filter(settings.loudness_target), "-ar", str(constants.LOUDNORM_SAMPLE_RATE)]
+    return arguments
+
+
+def build_arguments(settings: EncodeSettings):
+    """Build the ffmpeg options between the input and the output file"""
+    return build_video_arguments(settings) + build_container_arguments(settings) + build_audio_arguments(settings)
+
+
+def build_command_line(settings: EncodeSettings):
+    """Build the text shown in the command editor"""
+    return shlex.join(build_arguments(settings))
+
+
+def parse_command_line(command_line: str):
+    """Split an edited command line the way a shell would"""
+    return shlex.split(command_line)
+
+
+def build_output_path(settings: EncodeSettings, index: int, input_file: str):
+    return get_output_file_path(enable_rename=settings.enable_rename,
+                                rename_mode=settings.rename_mode,
+                                rename_content=settings.rename_content,
+                                index=index,
+                                format=settings.file_format,
+                                original_file_path=input_file,
+                                output_directory=settings.output_directory)
+
+
+def build_job_arguments(input_file: str, arguments: list, output_file: str):
+    """Full ffmpeg argument list of one job"""
+    return ["-i", input_file] + arguments + [output_file]
+
+
+def parse_scale(scale: str):
+    """Split a scale filter size such as 1280:-2 into (width, height), or None"""
+    width, separator, height = scale.partition(":")
+    try:
+        return (int(width), int(height)) if separator else None
+    except ValueError:
+        return None
+
+
+def check_video_copy(settings: EncodeSettings, info: MediaInfo):
+    """Return (whether the video stream can be copied, reason)"""
+    stream = info.video_stream()
+    encoder = constants.SUPPORT_VIDEO_ENCODE_FORMAT[settings.encode_format]
+    if stream is None:
+        return False, "no video stream"
+    if not settings.enable_encode_format:
+        return False, "no encoding format chosen"
+    if stream.codec_name != constants.ENCODER_CODEC_NAMES.get(encoder):
+        return False, f"codec {stream.codec_name} differs from {encoder}"
+    # a quality target asks for a new encode, a copy would keep the quality of the source
+    if settings.use_crf():
+        return False, f"CRF {settings.video_quality} requested"
+
+    if settings.enable_video_bitrate and (not stream.bitrate or stream.bitrate > int(settings.video_bitrate) * 1000):
+        return False, f"bitrate {stream.bitrate // 1000} kb/s is above {settings.video_bitrate} kb/s"
+
+    if settings.enable_video_framerate:
+        framerate = parse_rate(settings.video_framerate)
+        if abs(stream.fps - framerate) > 0.01:
+            return False, f"framerate {stream.fps:.3g} differs from {settings.video_framerate}"
+
+    if settings.enable_video_scale:
+        size = parse_scale(settings.video_scale)
+        source = (stream.width, stream.height)
+        # -1 and -2 keep the aspect ratio, so they match when the other side does
+        if size is None or size == (-1, -1) or size == (-2, -2) or any(
+                requested >= 0 and requested != actual for requested, actual in zip(size, source)):
+            return False, f"size {stream.width}x{stream.height} differs from {settings.video_scale}"
+
+    return True, f"{stream.codec_name} {stream.width}x{stream.height} {stream.fps:.3g} fps already matches"
+
+
+def check_audio_copy(settings: EncodeSettings, info: MediaInfo):
+    """Return (whether the audio streams can be copied, reason)"""
+    streams = info.audio_streams()
+    encoder = constants.SUPPORT_AUDIO_ENCODE_FORMAT[settings.audio_format]
+    if not streams:
+        return False, "no audio stream"
+    if settings.audio_copy:
+        return True, "copy requested"
+    if settings.use_loudness_normalization():
+        return False, "loudness normalization"
+    if not settings.enable_audio_format:
+        return False, "no audio format chosen"
+
+    for stream in streams:
+        if stream.codec_name != constants.ENCODER_CODEC_NAMES.get(encoder):
+            return False, f"codec {stream.codec_name} differs from {encoder}"
+        # a lower bitrate than the source is a reason to encode, a higher one isn't
+        if settings.use_audio_bitrate() and (not stream.bitrate or stream.bitrate > int(settings.audio_compress) * 1000):
+            return False, f"bitrate {stream.bitrate // 1000} kb/s is above {settings.audio_compress} kb/s"
+
+    return True, f"{encoder} {', '.join(f'{stream.bitrate // 1000} kb/s' for stream in streams)} already matches"
+
+
+def segment_count_for(settings: EncodeSettings, duration: float = None):
+    """Number of segments to cut an input into, 1 means encoding it as a whole"""
+    # segments need an explicit encoder, the default one depends on the segment container
+    if not settings.segmented_encoding or not settings.enable_encode_format or not duration:
+        return 1
+    count = settings.segment_count
+    if count <= 0:
+        count = max(2, default_worker_count(constants.SUPPORT_VIDEO_ENCODE_FORMAT[settings.encode_format]))
+    return max(1, min(count, int(duration // constants.MIN_SEGMENT_DURATION)))
+
+
+def ignored_by_edited_command(settings: EncodeSettings):
+    """Names of the enabled settings build_jobs can't apply to a hand edited command"""
+    ignored = [("encoding ladder", settings.encoding_ladder),
+               ("loudness normalization", settings.use_loudness_normalization()),
+               ("copying matching streams", settings.auto_stream_copy),
+               ("two-pass", settings.use_two_pass()),
+               ("segmented encoding", settings.segmented_encoding)]
+    return [name for name, is_enabled in ignored if is_enabled]
+
+
+def build_jobs(settings: EncodeSettings, input_files: list, arguments: list = None, media: dict = None,
+               keyframe_cache=None, ffprobe: str = constants.DEFAULT_FFPROBE_PATH, passlog_cache=None,
+               trims: dict = None, loudness_cache=None):
+    """Create the jobs of a batch, using arguments instead of the settings' options if given
+
+    media maps input paths to their probed MediaInfo. Streams that already match the
+    settings are copied, two-pass inputs get a pass 1 job unless its statistics are cached,
+    and with segmented encoding inputs long enough to split get a group of segment jobs
+    instead of one job. An encoding ladder writes all its renditions of an input from one job.
+    trims maps input paths to the (start, end) seconds to keep, a trim whose video is copied
+    only encodes the partial groups of pictures at its cuts. With loudness normalization the
+    audio of every input is measured by an analysis job first, unless the measurement is
+    cached, and normalized linearly by the job that encodes it. arguments is a hand edited
+    command, it is always run as it is, apart from the trim, see ignored_by_edited_command.
+    """
+    is_edited = arguments is not None
+    if arguments is None:
+        arguments = build_arguments(settings)
+    media = media or {}
+    trims = trims or {}
+    renditions = parse_renditions(settings.ladder_renditions) if settings.encoding_ladder and not is_edited else None
+
+    jobs = []
+    # input path -> (loudness measurement file, indices of the jobs measuring it, measured stream)
+    loudness_entries = {}
+    for i, input_file in enumerate(input_files):
+        output_file = build_output_path(settings, i, input_file)
+        info = media.get(input_file)
+        duration = info.duration if info is not None and info.duration > 0 else None
+        trim = trims.get(input_file)
+        # the audio stream ffmpeg would pick itself, for the jobs that have to name it
+        audio_stream = info.default_audio_stream() if info is not None else None
+        audio_index = audio_stream.index if audio_stream is not None else None
+
+        # without a probe the input may have no audio to measure, loudnorm then works in one pass
+        if settings.use_loudness_normalization() and not is_edited and info is not None and info.audio_streams():
+            loudness_cache = loudness_cache or LoudnessCache()
+            entry = loudness_cache.entry_path(input_file, settings.loudness_target, trim, audio_index)
+            if entry is not None and loudness_cache.has(entry):
+                loudness_entries[input_file] = (entry, [], audio_index)
+            elif entry is not None:
+                jobs.append(loudness_cache.build_measure_job(len(jobs), input_file, entry, settings.loudness_target,
+                                                             trim, duration, audio_index))
+                loudness_entries[input_file] = (entry, [jobs[-1].index], audio_index)
+
+        video_arguments = build_video_arguments(settings)
+        audio_arguments = build_audio_arguments(settings)
+        notes = []
+        if settings.auto_stream_copy and info is not None and not is_edited:
+            # every rendition is scaled, so only the audio can be copied
+            copy_video, reason = (False, "encoding ladder") if renditions else check_video_copy(settings, info)
+            notes.append(f"Video {'copied' if copy_video else 'encoded'}: {reason}")
+            if copy_video:
+                video_arguments = ["-c:v", "copy"]
+            copy_audio, reason = check_audio_copy(settings, info)
+            notes.append(f"Audio {'copied' if copy_audio else 'encoded'}: {reason}")
+            if copy_audio:
+                audio_arguments = ["-c:a", "copy"]
+        file_arguments = arguments if is_edited else (video_arguments + build_container_arguments(settings)
+                                                      + audio_arguments)
+
+        if renditions:
+            # two-pass and segments would decode the input again for every rendition
+            video_arguments = build_video_arguments(replace(settings, enable_video_scale=False))
+            jobs.append(build_ladder_job(len(jobs), input_file, output_file, renditions, video_arguments,
+                                         audio_arguments, build_container_arguments(settings),
+                                         trimmed_duration(trim, duration) if trim is not None else duration))
+            jobs[-1].notes = notes + jobs[-1].notes
+            if trim is not None:
+                jobs[-1].arguments = trim_input_arguments(*trim) + jobs[-1].arguments
+                jobs[-1].trim = trim
+            continue
+
+        is_copy = video_arguments == ["-c:v", "copy"]
+        if trim is not None:
+            # pass 1 statistics and segments are made for the whole input
+            group = build_trim_jobs(len(jobs), input_file, output_file, trim, file_arguments,
+                                    encode_arguments=build_video_arguments(settings) if is_copy and not is_edited else None,
+                                    audio_arguments=audio_arguments,
+                                    container_arguments=build_container_arguments(settings),
+                                    duration=duration,
+                                    keyframe_cache=keyframe_cache,
+                                    ffprobe=ffprobe,
+                                    stream=info.video_stream() if info is not None else None)
+            group[0].notes = notes + group[0].notes
+            jobs += group
+            continue
+        if settings.use_two_pass() and not is_edited and not is_copy:
+            passlog_cache = passlog_cache or PassLogCache()
+            prefix = passlog_cache.entry_prefix(input_file, video_arguments)
+            if prefix is not None:
+                depends_on = []
+                if passlog_cache.has(prefix):
+                    notes.append("Two-pass: reusing cached pass 1 statistics")
+                else:
+                    first_pass = passlog_cache.build_first_pass_job(len(jobs), input_file, prefix, video_arguments,
+                                                                    duration)
+                    first_pass.notes = notes + ["Two-pass: running pass 1, its statistics are cached for later runs"]
+                    jobs.append(first_pass)
+                    depends_on = [first_pass.index]
+                    notes = []
+                jobs.append(Job(index=len(jobs),
+                                arguments=build_job_arguments(input_file, video_arguments
+                                                              + ["-pass", "2", "-passlogfile", prefix]
+                                                              + build_container_arguments(settings)
+                                                              + audio_arguments, output_file),
+                                input_file=input_file,
+                                output_file=output_file,
+                                duration=duration,
+                                depends_on=depends_on,
+                                prepare=lambda job, prefix=prefix: passlog_cache.touch(prefix),
+                                notes=notes))
+                continue
+
+        # copying the video is already as fast as it gets, two-pass rate control needs the whole input
+        count = 1 if is_edited or is_copy or settings.use_two_pass() else segment_count_for(settings, duration)
+        if count > 1:
+            group = build_segmented_jobs(input_file, output_file, duration, count, len(jobs),
+                                         video_arguments=video_arguments,
+                                         audio_arguments=audio_arguments,
+                                         container_arguments=build_container_arguments(settings),
+                                         keyframe_cache=keyframe_cache,
+                                         ffprobe=ffprobe,
+                                         audio_stream=audio_index)
+            if info.subtitle_streams():
+                notes.append("Segments: the subtitles of the input are not kept")
+            group[0].notes = notes
+            jobs += group
+            continue
+
+        jobs.append(Job(index=len(jobs),
+                        arguments=build_job_arguments(input_file, file_arguments, output_file),
+                        input_file=input_file,
+                        output_file=output_file,
+                        duration=duration,
+                        notes=notes))
+
+    if loudness_entries:
+        add_loudness_measurements(jobs, loudness_entries, loudness_cache)
+    return jobs
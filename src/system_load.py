@@ -0,0 +1,156 @@
+import os
+import time
+from dataclasses import dataclass
+
+import src.constants as constants
+
+PROC_STAT = "/proc/stat"
+PROC_MEMINFO = "/proc/meminfo"
+PROC_DISKSTATS = "/proc/diskstats"
+
+
+@dataclass
+class LoadSample:
+    """System load since the previous sample, fractions are between 0 and 1"""
+    cpu_busy: float
+    # processes ready to run right now, above the core count they wait for a core
+    run_queue: int
+    memory_available: float
+    # busy time of the busiest disk
+    disk_busy: float
+
+
+def read_cpu_times(path: str = PROC_STAT):
+    """Return (busy, total) jiffies of all cores and the number of runnable processes"""
+    busy, total, running = 0, 0, 0
+    with open(path, "r") as file:
+        for line in file:
+            fields = line.split()
+            if fields[0] == "cpu":
+                values = [int(value) for value in fields[1:]]
+                # idle and iowait, guest time is already counted in user and nice
+                idle = values[3] + (values[4] if len(values) > 4 else 0)
+                total = sum(values[:8])
+                busy = total - idle
+            elif fields[0] == "procs_running":
+                running = int(fields[1])
+    return busy, total, running
+
+
+def read_memory_available(path: str = PROC_MEMINFO):
+    values = {}
+    with open(path, "r") as file:
+        for line in file:
+            name, _, value = line.partition(":")
+            if name in ("MemTotal", "MemAvailable"):
+                values[name] = int(value.split()[0])
+    if not values.get("MemTotal") or "MemAvailable" not in values:
+        raise ValueError("MemTotal or MemAvailable missing")
+    return values["MemAvailable"] / values["MemTotal"]
+
+
+def read_disk_busy_times(path: str = PROC_DISKSTATS):
+    """Milliseconds each whole disk spent doing I/O since boot, keyed by name"""
+    times = {}
+    with open(path, "r") as file:
+        for line in file:
+            fields = line.split()
+            if len(fields) < 13:
+                continue
+            name = fields[2]
+            # partitions repeat the time of their disk, loop and ram devices live in memory
+            if name.startswith(("loop", "ram", "zram")) or not os.path.exists(f"/sys/block/{name}"):
+                continue
+            times[name] = int(fields[12])
+    return times
+
+
+class LoadSampler:
+    """Sample CPU, memory and disk load from /proc, a no-op where there is no /proc"""
+
+    def __init__(self):
+        self.last_time = None
+        self.last_cpu = None
+        self.last_disks = None
+        try:
+            self.read()
+            self.is_supported = True
+        except (OSError, ValueError, IndexError):
+            self.is_supported = False
+
+    def read(self):
+        busy, total, running = read_cpu_times()
+        disks = read_disk_busy_times()
+        memory_available = read_memory_available()
+        now = time.monotonic()
+
+        sample = None
+        if self.last_time is not None and total > self.last_cpu[1]:
+            elapsed_ms = (now - self.last_time) * 1000
+            disk_busy = max((disks[name] - self.last_disks[name] for name in disks if name in self.last_disks),
+                            default=0)
+            sample = LoadSample(cpu_busy=(busy - self.last_cpu[0]) / (total - self.last_cpu[1]),
+                                run_queue=running,
+                                memory_available=memory_available,
+                                disk_busy=min(1.0, disk_busy / elapsed_ms) if elapsed_ms > 0 else 0.0)
+        self.last_time, self.last_cpu, self.last_disks = now, (busy, total), disks
+        return sample
+
+    def sample(self):
+        """Load since the previous call, or None if it can't be measured"""
+        if not self.is_supported:
+            return None
+        try:
+            return self.read()
+        except (OSError, ValueError, IndexError):
+            return None
+
+
+class LoadController:
+    """Grow or shrink the number of parallel workers to keep the system near a target load
+
+    Workers are added one at a time while the CPU has room and taken away when memory
+    or a disk is exhausted or far more processes want a core than there are cores.
+    A running job is never stopped, a smaller count only delays starting the next one.
+    """
+
+    def __init__(self, max_workers: int = None, cpu_count: int = None, sampler: LoadSampler = None):
+        self.cpu_count = cpu_count or os.cpu_count() or 1
+        self.max_workers = max_workers or min(self.cpu_count, constants.MAX_PARALLEL_JOBS)
+        self.sampler = sampler or LoadSampler()
+        self.settle_samples = 0
+
+    def is_supported(self):
+        return self.sampler.is_supported
+
+    def adjust(self, workers: int, running: int, has_waiting: bool):
+        """Return (new worker count, reason), the reason is None if the count stays"""
+        sample = self.sampler.sample()
+        if sample is None:
+            return workers, None
+
+        new_workers, reason = workers, None
+        if sample.memory_available < constants.MIN_AVAILABLE_MEMORY:
+            # running out of memory can't wait for the workers to settle
+            new_workers, reason = workers - 1, f"{sample.memory_available:.0%} memory available"
+        elif self.settle_samples > 0:
+            self.settle_samples -= 1
+        elif sample.disk_busy > constants.MAX_DISK_BUSY:
+            new_workers, reason = workers - 1, f"disk {sample.disk_busy:.0%} busy"
+        elif sample.run_queue > 2 * self.cpu_count:
+            new_workers, reason = workers - 1, f"{sample.run_queue} processes waiting for {self.cpu_count} cores"
+        elif (sample.cpu_busy < constants.TARGET_CPU_USAGE and has_waiting and running >= workers
+              and sample.disk_busy < constants.MAX_DISK_BUSY / 2):
+            # only a count that actually limits the batch is worth raising
+            new_workers, reason = workers + 1, f"CPU {sample.cpu_busy:.0%} busy"
+
+        new_workers = max(1, min(new_workers, self.max_workers))
+        if new_workers == workers:
+            return workers, None
+        self.settle_samples = constants.LOAD_SETTLE_SAMPLES
+        return new_workers, reason
+
+
+def thread_count(cpu_count: int, workers: int):
+    """Threads of one encode so that all workers together use about every core once"""
+    return max(1, cpu_count // max(1, workers))
@@ -0,0 +1,171 @@
+import heapq
+import json
+import os
+from collections import OrderedDict
+
+import src.constants as constants
+from src.jobs import video_encoder_from_arguments
+
+# heights the history groups inputs by, an input counts as the smallest class it fits in
+RESOLUTION_CLASSES = (240, 360, 480, 720, 1080, 1440, 2160, 4320)
+
+
+def resolution_class(height: int):
+    for resolution in RESOLUTION_CLASSES:
+        if height <= resolution:
+            return resolution
+    return RESOLUTION_CLASSES[-1]
+
+
+def option_value(arguments: list, option: str):
+    """Value of the last occurrence of option, or None"""
+    value = None
+    for i, argument in enumerate(arguments[:-1]):
+        if argument == option:
+            value = arguments[i + 1]
+    return value
+
+
+def throughput_key(arguments: list, info=None):
+    """What decides the speed of a job: encoder, preset, pass and the size of its input"""
+    stream = info.video_stream() if info is not None else None
+    return "|".join([video_encoder_from_arguments(arguments) or "default",
+                     option_value(arguments, "-preset") or "",
+                     option_value(arguments, "-pass") or "",
+                     str(resolution_class(stream.height)) if stream is not None and stream.height else "unknown"])
+
+
+class ThroughputHistory:
+    """Average encode speed, media seconds per wall second, by throughput key, persisted as JSON"""
+
+    def __init__(self, path: str = None, max_entries: int = constants.THROUGHPUT_HISTORY_SIZE):
+        self.path = path or os.path.join(constants.CACHE_DIRECTORY, "throughput.json")
+        self.max_entries = max_entries
+        # key -> [speed, samples]
+        self.entries = OrderedDict()
+        self.is_dirty = False
+        self.is_loaded = False
+
+    def load(self):
+        """Read the history file, done on first use so creating a history costs nothing at startup"""
+        if self.is_loaded:
+            return
+        self.is_loaded = True
+        try:
+            with open(self.path, "r", encoding="utf-8") as file:
+                self.entries = OrderedDict(json.load(file))
+        except (OSError, TypeError, ValueError):
+            return
+
+    def save(self):
+        """Write the history to disk if it changed, replacing the old file atomically"""
+        if not self.is_dirty:
+            return
+        self.load()
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as file:
+            json.dump(self.entries, file)
+        os.replace(temp_path, self.path)
+        self.is_dirty = False
+
+    def record(self, key: str, media_seconds: float, wall_seconds: float):
+        if media_seconds <= 0 or wall_seconds <= 0:
+            return
+        self.load()
+        speed = media_seconds / wall_seconds
+        entry = self.entries.get(key)
+        if entry is not None:
+            weight = constants.THROUGHPUT_HISTORY_WEIGHT
+            speed = entry[0] * (1 - weight) + speed * weight
+        self.entries[key] = [speed, (entry[1] if entry is not None else 0) + 1]
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+        self.is_dirty = True
+
+    def speed(self, key: str):
+        """Expected speed of key, else the average of the keys with the same encoder and preset
+        or at least the same encoder, None if nothing alike was measured"""
+        self.load()
+        entry = self.entries.get(key)
+        if entry is not None:
+            return entry[0]
+        parts = key.split("|")
+        for prefix_length in (2, 1):
+            prefix = parts[:prefix_length]
+            speeds = [entry[0] for other, entry in self.entries.items() if other.split("|")[:prefix_length] == prefix]
+            if speeds:
+                return sum(speeds) / len(speeds)
+        return None
+
+
+def estimate_jobs(jobs: list, media: dict, history: ThroughputHistory):
+    """Set the estimated_time of every ffmpeg job from its duration and the history
+
+    Jobs nothing alike was measured for are guessed to run at DEFAULT_ENCODE_SPEED, jobs
+    without a known duration get no estimate. Return the number of guessed jobs.
+    """
+    guessed = 0
+    for job in jobs:
+        job.estimated_time = None
+        # analyses run besides the workers, they don't stretch a batch
+        if job.program is not None or job.is_analysis or not job.duration:
+            continue
+        # segments get their arguments right before they start, their encoder is still unknown
+        speed = history.speed(throughput_key(job.arguments, media.get(job.input_file))) if job.arguments else None
+        if speed is None:
+            speed = constants.DEFAULT_ENCODE_SPEED
+            guessed += 1
+        job.estimated_time = job.duration / speed
+    return guessed
+
+
+def critical_paths(jobs: list):
+    """Estimated time of each job plus the longest chain of jobs waiting for it, by index
+
+    Starting the job with the longest remaining chain first keeps one long input queued
+    last from stretching the end of a batch. Dependencies always have smaller indices.
+    """
+    paths = {}
+    dependents = {}
+    for job in jobs:
+        for index in job.depends_on:
+            dependents.setdefault(index, []).append(job.index)
+    for job in reversed(jobs):
+        paths[job.index] = (job.estimated_time or 0.0) + max(
+            (paths[index] for index in dependents.get(job.index, [])), default=0.0)
+    return paths
+
+
+def estimate_makespan(jobs: list, workers: int):
+    """Seconds a batch takes on workers parallel workers, running the longest chains first
+
+    Jobs without an estimate count as instant, finished jobs are skipped.
+    """
+    paths = critical_paths(jobs)
+    finish_times = {job.index: 0.0 for job in jobs if job.is_finished()}
+    waiting_for = {}
+    dependents = {}
+    ready = []
+    for job in jobs:
+        if job.is_finished():
+            continue
+        waiting_for[job.index] = sum(1 for index in job.depends_on if index not in finish_times)
+        for index in job.depends_on:
+            dependents.setdefault(index, []).append(job.index)
+        if waiting_for[job.index] == 0:
+            heapq.heappush(ready, (-paths[job.index], job.index))
+
+    free_times = [0.0] * max(1, workers)
+    while ready:
+        _, index = heapq.heappop(ready)
+        job = jobs[index]
+        start = max([heapq.heappop(free_times)] + [finish_times[other] for other in job.depends_on])
+        finish_times[index] = start + (job.estimated_time or 0.0)
+        heapq.heappush(free_times, finish_times[index])
+        for other in dependents.get(index, []):
+            waiting_for[other] -= 1
+            if waiting_for[other] == 0:
+                heapq.heappush(ready, (-paths[other], other))
+    return max(finish_times.values(), default=0.0)
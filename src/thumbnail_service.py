@@ -0,0 +1,125 @@
+import math
+from collections import OrderedDict, deque
+
+from PySide6.QtCore import QObject, QProcess, Signal
+from PySide6.QtGui import QImage
+
+import src.constants as constants
+from src.thumbnails import ThumbnailCache, thumbnail_arguments, thumbnail_positions
+
+# (frame width, frame height, frames, columns)
+THUMBNAIL_LAYOUT = (constants.THUMBNAIL_WIDTH, constants.THUMBNAIL_HEIGHT, 1, 1)
+CONTACT_SHEET_LAYOUT = (constants.CONTACT_SHEET_FRAME_WIDTH, constants.CONTACT_SHEET_FRAME_HEIGHT,
+                        constants.CONTACT_SHEET_COLUMNS * constants.CONTACT_SHEET_ROWS, constants.CONTACT_SHEET_COLUMNS)
+
+
+def layout_key(layout: tuple):
+    return "x".join(str(value) for value in layout)
+
+
+class ThumbnailService(QObject):
+    """Render thumbnails and contact sheets with a few ffmpeg processes, answering from the caches first
+
+    The newest request runs first and old ones are dropped when the queue is full, so the
+    rows the user looks at right now win over the ones scrolled past.
+    """
+    ready = Signal(str, object)
+    failed = Signal(str, object, str)
+
+    def __init__(self, program: str = constants.DEFAULT_FFMPEG_PATH, cache: ThumbnailCache = None, parent=None):
+        super().__init__(parent)
+        self.program = program
+        self.cache = cache or ThumbnailCache()
+        self.images = OrderedDict()
+        self.queue = deque()
+        self.queued = set()
+        self.processes = {}
+        self.failures = set()
+
+    def get(self, path: str, layout: tuple = THUMBNAIL_LAYOUT):
+        """Return the image of path from memory or the disk cache, or None"""
+        key = (path, layout)
+        image = self.images.get(key)
+        if image is not None:
+            self.images.move_to_end(key)
+            return image
+        if key in self.queued or key in self.processes or key in self.failures:
+            return None
+
+        entry = self.cache.get(path, layout_key(layout))
+        if entry is None:
+            return None
+        return self.remember(key, *entry)
+
+    def request(self, path: str, layout: tuple = THUMBNAIL_LAYOUT, duration: float = None):
+        """Queue rendering the image of path, return False if it is rendered or failed already"""
+        key = (path, layout)
+        if key in self.failures or key in self.processes or key in self.images:
+            return False
+        if key in self.queued:
+            # asked again, e.g. scrolled back into view, move it to the front
+            self.queue = deque(item for item in self.queue if item[0] != key)
+        self.queue.appendleft((key, duration))
+        self.queued.add(key)
+        while len(self.queue) > constants.THUMBNAIL_QUEUE_SIZE:
+            self.queued.discard(self.queue.pop()[0])
+        self.fill_workers()
+        return True
+
+    def cancel(self):
+        self.queue.clear()
+        self.queued.clear()
+
+    def remember(self, key: tuple, width: int, height: int, pixels: bytes):
+        image = QImage(pixels, width, height, width * 3, QImage.Format_RGB888).copy()
+        self.images[key] = image
+        while len(self.images) > constants.THUMBNAIL_MEMORY_ITEMS:
+            self.images.popitem(last=False)
+        return image
+
+    def fill_workers(self):
+        while self.queue and len(self.processes) < constants.MAX_PARALLEL_THUMBNAILS:
+            key, duration = self.queue.popleft()
+            self.queued.discard(key)
+            self.start_render(key, duration)
+
+    def start_render(self, key: tuple, duration: float):
+        path, (width, height, frames, columns) = key
+        process = QProcess(self)
+        process.finished.connect(lambda exit_code, exit_status: self.handle_finish(key, process, exit_code))
+        process.errorOccurred.connect(lambda error: self.handle_error(key, process, error))
+        self.processes[key] = process
+        process.start(self.program, thumbnail_arguments(path, thumbnail_positions(duration, frames),
+                                                        width, height, columns))
+
+    def handle_finish(self, key: tuple, process: QProcess, exit_code: int):
+        if self.processes.pop(key, None) is None:
+            return
+        process.deleteLater()
+
+        path, layout = key
+        width, height, frames, columns = layout
+        sheet_width = width * min(frames, columns)
+        sheet_height = height * math.ceil(frames / columns)
+        pixels = process.readAllStandardOutput().data()
+        if exit_code == 0 and len(pixels) == sheet_width * sheet_height * 3:
+            try:
+                self.cache.put(path, layout_key(layout), sheet_width, sheet_height, pixels)
+            except OSError:
+                # the image is still shown, only not kept for the next run
+                pass
+            self.remember(key, sheet_width, sheet_height, pixels)
+            self.ready.emit(path, layout)
+        else:
+            self.failures.add(key)
+            error = process.readAllStandardError().data().decode("utf-8", errors="replace").strip()
+            self.failed.emit(path, layout, error or f"ffmpeg wrote {len(pixels)} bytes instead of an image")
+        self.fill_workers()
+
+    def handle_error(self, key: tuple, process: QProcess, error: QProcess.ProcessError):
+        # finished is never emitted for a process that could not be started
+        if error == QProcess.FailedToStart and self.processes.pop(key, None) is not None:
+            process.deleteLater()
+            self.failures.add(key)
+            self.failed.emit(key[0], key[1], process.errorString())
+            self.fill_workers()
@@ -0,0 +1,117 @@
+import hashlib
+import math
+import os
+import struct
+import zlib
+
+import src.constants as constants
+from src.probe import file_identity
+
+# cache file layout: magic, width and height of the whole image, then zlib compressed rgb24 rows
+CACHE_MAGIC = b"FGT1"
+CACHE_HEADER = struct.Struct("<4sHH")
+
+
+def thumbnail_positions(duration: float = None, frames: int = 1):
+    """Seconds to take frames at, one inside each of frames equal slices of the input"""
+    if not duration:
+        return [0.0] * frames
+    return [duration * (i + constants.THUMBNAIL_POSITION) / frames for i in range(frames)]
+
+
+def thumbnail_arguments(path: str, positions: list, width: int, height: int, columns: int = 1):
+    """ffmpeg arguments writing one rgb24 image of all frames, tiled in columns, to stdout
+
+    Every frame gets its own input that seeks to the keyframe before its position and only
+    decodes keyframes, so a frame costs one seek and one decode however long the input is.
+    """
+    arguments = ["-v", "error"]
+    for position in positions:
+        arguments += ["-skip_frame", "nokey", "-noaccurate_seek", "-ss", f"{position:.3f}", "-i", path]
+
+    # the keyframe before a seek position has a negative timestamp, which the output would drop
+    fit = (f"scale={width}:{height}:force_original_aspect_ratio=decrease,"
+           f"pad={width}:{height}:(ow-iw)/2:(oh-ih)/2,setsar=1,setpts=PTS-STARTPTS")
+    if len(positions) == 1:
+        arguments += ["-map", "0:v:0", "-vf", fit]
+    else:
+        rows = math.ceil(len(positions) / columns)
+        graph = ";".join(f"[{i}:v:0]{fit},trim=end_frame=1[v{i}]" for i in range(len(positions)))
+        inputs = "".join(f"[v{i}]" for i in range(len(positions)))
+        graph += f";{inputs}concat=n={len(positions)}:v=1:a=0,tile={columns}x{rows}[sheet]"
+        arguments += ["-filter_complex", graph, "-map", "[sheet]"]
+    return arguments + ["-frames:v", "1", "-f", "rawvideo", "-pix_fmt", "rgb24", "pipe:1"]
+
+
+class ThumbnailCache:
+    """Size capped on-disk cache of rgb24 images keyed by file identity and image layout"""
+
+    def __init__(self, directory: str = None, max_bytes: int = constants.THUMBNAIL_CACHE_BYTES):
+        self.directory = directory or os.path.join(constants.CACHE_DIRECTORY, "thumbnails")
+        self.max_bytes = max_bytes
+        self.puts_since_prune = 0
+
+    def entry_path(self, path: str, layout: str):
+        identity = file_identity(path)
+        if identity is None:
+            return None
+        key = hashlib.sha1(f"{path}|{identity[0]}|{identity[1]}|{layout}".encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, f"{key}.rgbz")
+
+    def get(self, path: str, layout: str):
+        """Return (width, height, rgb24 bytes) or None"""
+        entry_path = self.entry_path(path, layout)
+        if entry_path is None:
+            return None
+        try:
+            with open(entry_path, "rb") as file:
+                data = file.read()
+            magic, width, height = CACHE_HEADER.unpack_from(data)
+            if magic != CACHE_MAGIC:
+                return None
+            pixels = zlib.decompress(data[CACHE_HEADER.size:])
+            os.utime(entry_path)
+        except (OSError, struct.error, zlib.error):
+            return None
+        if len(pixels) != width * height * 3:
+            return None
+        return width, height, pixels
+
+    def put(self, path: str, layout: str, width: int, height: int, pixels: bytes):
+        entry_path = self.entry_path(path, layout)
+        if entry_path is None:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        temp_path = f"{entry_path}.tmp"
+        with open(temp_path, "wb") as file:
+            file.write(CACHE_HEADER.pack(CACHE_MAGIC, width, height))
+            file.write(zlib.compress(pixels, 1))
+        os.replace(temp_path, entry_path)
+
+        # listing the directory is the expensive part, so prune only now and then
+        self.puts_since_prune += 1
+        if self.puts_since_prune >= 100:
+            self.prune()
+
+    def prune(self):
+        """Remove the least recently used entries until the cache fits into max_bytes"""
+        self.puts_since_prune = 0
+        try:
+            entries = []
+            with os.scandir(self.directory) as iterator:
+                for entry in iterator:
+                    if entry.name.endswith(".rgbz"):
+                        stat = entry.stat()
+                        entries.append((stat.st_mtime, stat.st_size, entry.path))
+        except OSError:
+            return
+        total = sum(size for _, size, _ in entries)
+        entries.sort()
+        for _, size, entry_path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(entry_path)
+            except OSError:
+                continue
+            total -= size
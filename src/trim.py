@@ -0,0 +1,222 @@
+import os
+import shutil
+
+import src.constants as constants
+from src.jobs import Job, SkipJob, video_encoder_from_arguments
+from src.probe import StreamInfo
+from src.segments import concat_list_entry
+
+PIECE_NAMES = ["head", "middle", "tail"]
+# options of the video settings the edges of a smart cut keep, the rest comes from the source
+EDGE_RATE_OPTIONS = {"-crf", "-b:v", "-preset"}
+
+
+def parse_time(text: str):
+    """Parse seconds or [[HH:]MM:]SS[.fff] into seconds, raise ValueError if it's invalid"""
+    parts = text.strip().split(":")
+    if not 1 <= len(parts) <= 3:
+        raise ValueError(f"Invalid time {text}, expected seconds or HH:MM:SS")
+    try:
+        seconds = 0.0
+        for part in parts:
+            seconds = seconds * 60 + float(part)
+    except ValueError:
+        raise ValueError(f"Invalid time {text}, expected seconds or HH:MM:SS")
+    if seconds < 0:
+        raise ValueError(f"Invalid time {text}, it must not be negative")
+    return seconds
+
+
+def parse_trim(start, end=None):
+    """Return (start, end or None) in seconds from numbers or time strings, raise ValueError if it's invalid"""
+    start = parse_time(start) if isinstance(start, str) else float(start or 0.0)
+    if isinstance(end, str):
+        end = parse_time(end) if end.strip() else None
+    elif end is not None:
+        end = float(end)
+    if start < 0 or (end is not None and end <= start):
+        raise ValueError("The out point of a trim must come after its in point")
+    return start, end
+
+
+def format_trim(trim: tuple):
+    start, end = trim
+    return f"{start:.3f}s to {f'{end:.3f}s' if end is not None else 'the end'}"
+
+
+def trim_input_arguments(start: float, end: float = None):
+    """Input options that seek to start and stop reading at end"""
+    arguments = ["-ss", f"{start:.6f}"]
+    if end is not None:
+        arguments += ["-t", f"{end - start:.6f}"]
+    return arguments
+
+
+def trimmed_duration(trim: tuple, duration: float = None):
+    """Seconds of media a trim keeps of an input of duration, None if it isn't known"""
+    start, end = trim
+    if duration is None:
+        return end - start if end is not None else None
+    return max(0.0, min(end if end is not None else duration, duration) - start)
+
+
+def plan_smart_cut(keyframes: list, start: float, end: float = None):
+    """Split [start, end) into ("encode" or "copy", start, end) pieces, end None is the end of the input
+
+    The range between the first and the last keyframe inside it is copied, only the partial
+    groups of pictures before and after are encoded. Without such a range it is encoded whole.
+    """
+    tolerance = constants.SMART_CUT_TOLERANCE
+    first = next((keyframe for keyframe in keyframes if keyframe >= start - tolerance), None)
+    if first is None or (end is not None and first >= end - tolerance):
+        return [("encode", start, end)]
+    last = None
+    if end is not None:
+        last = max(keyframe for keyframe in keyframes if keyframe <= end + tolerance)
+        if last <= first:
+            return [("encode", start, end)]
+        if end - last <= tolerance:
+            last = end
+
+    pieces = []
+    if first - start > tolerance:
+        pieces.append(("encode", start, first))
+    pieces.append(("copy", first, last))
+    if last is not None and last < end:
+        pieces.append(("encode", last, end))
+    return pieces
+
+
+def name_pieces(pieces: list):
+    """Map the pieces of a smart cut to head, middle and tail"""
+    named = {}
+    for kind, piece_start, piece_end in pieces:
+        name = "middle" if kind == "copy" else "tail" if "middle" in named else "head"
+        named[name] = (kind, piece_start, piece_end)
+    return named
+
+
+def edge_encode_arguments(encode_arguments: list, stream: StreamInfo = None):
+    """Return (options encoding the edges of a smart cut of stream, None) or (None, why it can't be done)
+
+    The edges are joined with the copied middle by stream copy, so they get the codec,
+    profile, level and pixel format of the source and only the rate control of
+    encode_arguments. Their parameter sets still differ from the source's, every
+    keyframe repeats them in band so the joined stream switches over.
+    """
+    if stream is None:
+        return None, "the video stream wasn't probed"
+    codec = constants.SMART_CUT_ENCODERS.get(stream.codec_name)
+    if codec is None:
+        return None, f"no encoder matches {stream.codec_name} at the cuts"
+    encoder = video_encoder_from_arguments(encode_arguments)
+    if encoder is not None and encoder != codec["encoder"]:
+        return None, f"{encoder} can't continue a {stream.codec_name} stream"
+    profile = codec["profiles"].get(stream.profile)
+    if not stream.profile:
+        return None, "profile of the source unknown"
+    if profile is None:
+        return None, f"profile {stream.profile} of the source can't be matched"
+    if not stream.pix_fmt:
+        return None, "pixel format of the source unknown"
+
+    arguments = ["-c:v", codec["encoder"]]
+    for i, argument in enumerate(encode_arguments[:-1]):
+        if argument in EDGE_RATE_OPTIONS:
+            arguments += [argument, encode_arguments[i + 1]]
+    parameters = "repeat-headers=1"
+    if stream.level > 0:
+        parameters += f":{codec['level']}={stream.level / codec['level_scale']:g}"
+    return arguments + ["-profile:v", profile, "-pix_fmt", stream.pix_fmt, codec["parameters"], parameters], None
+
+
+def build_trim_jobs(first_index: int, input_file: str, output_file: str, trim: tuple, arguments: list,
+                    encode_arguments: list = None, audio_arguments: list = (), container_arguments: list = (),
+                    duration: float = None, keyframe_cache=None, ffprobe: str = constants.DEFAULT_FFPROBE_PATH,
+                    stream: StreamInfo = None):
+    """Jobs writing the trimmed range of an input
+
+    arguments are the options of an untrimmed job. A job that encodes the video anyway, or
+    a cut on keyframes, only seeks the input. When the video is copied, encode_arguments
+    are given and the cut falls between keyframes, the partial groups of pictures at each
+    edge are encoded to match the probed video stream, the middle is copied and a last job
+    joins the pieces and takes the audio from the input. An edge that can't match the
+    stream, see edge_encode_arguments, has the whole range encoded with encode_arguments.
+    The keyframes come from keyframe_cache, indexed by a first job if they are not cached yet.
+    """
+    start, end = trim
+    total = trimmed_duration(trim, duration)
+    plain = Job(index=first_index, arguments=trim_input_arguments(start, end) + ["-i", input_file] + arguments
+                + [output_file], input_file=input_file, output_file=output_file, duration=total, trim=trim,
+                notes=[f"Trim: {format_trim(trim)}"])
+    if encode_arguments is None or keyframe_cache is None:
+        return [plain]
+
+    def encode_whole(reason: str):
+        plain.notes[0] += f", {reason}"
+        plain.arguments = (trim_input_arguments(start, end) + ["-i", input_file] + encode_arguments
+                           + list(container_arguments) + list(audio_arguments) + [output_file])
+        return [plain]
+
+    jobs = []
+    keyframes = keyframe_cache.get(input_file)
+    edge_arguments, reason = edge_encode_arguments(encode_arguments, stream)
+    if keyframes is not None:
+        pieces = plan_smart_cut(keyframes, start, end)
+        if len(pieces) == 1 and pieces[0][0] == "copy":
+            plain.notes[0] += ", cut on keyframes"
+            return [plain]
+        if len(pieces) == 1:
+            return encode_whole("no keyframe inside to copy from")
+    if edge_arguments is None:
+        return encode_whole(f"encoding the whole range, {reason}")
+    if keyframes is None:
+        jobs.append(keyframe_cache.build_index_job(first_index, input_file, ffprobe))
+    plan = {}
+
+    def get_pieces():
+        # all pieces read the same plan, made once the keyframes are known
+        if "pieces" not in plan:
+            plan["pieces"] = name_pieces(plan_smart_cut(keyframe_cache.get(input_file) or [], start, end))
+        return plan["pieces"]
+
+    # MPEG-TS keeps the parameter sets of every piece in band, also those of the copied middle
+    work_directory = f"{output_file}.trim"
+    piece_paths = {name: os.path.join(work_directory, f"{name}.ts") for name in PIECE_NAMES}
+
+    def prepare_piece(job: Job, name: str):
+        piece = get_pieces().get(name)
+        if piece is None:
+            raise SkipJob(f"no {name} to cut")
+        os.makedirs(work_directory, exist_ok=True)
+        kind, piece_start, piece_end = piece
+        job.duration = trimmed_duration((piece_start, piece_end), duration)
+        job.arguments = (["-y"] + trim_input_arguments(piece_start, piece_end) + ["-i", input_file, "-map", "0:v:0"]
+                         + (edge_arguments if kind == "encode" else ["-c:v", "copy"]) + [piece_paths[name]])
+
+    # without the keyframes yet every piece gets a job, the ones the plan doesn't need are skipped
+    index_dependencies = [job.index for job in jobs]
+    names = [name for name in PIECE_NAMES if keyframes is None or name in get_pieces()]
+    for name in names:
+        # a few seconds are encoded at most, the pieces are a small share of the work
+        jobs.append(Job(index=first_index + len(jobs), arguments=[], input_file=input_file,
+                        output_file=piece_paths[name], depends_on=index_dependencies, weight=(total or 0.0) * 0.02,
+                        prepare=lambda job, name=name: prepare_piece(job, name)))
+
+    list_path = os.path.join(work_directory, "pieces.txt")
+
+    def prepare_join(job: Job):
+        with open(list_path, "w", encoding="utf-8") as file:
+            file.writelines(concat_list_entry(piece_paths[name]) for name in PIECE_NAMES if name in get_pieces())
+
+    def remove_pieces(job: Job):
+        shutil.rmtree(work_directory, ignore_errors=True)
+
+    arguments = (["-f", "concat", "-safe", "0", "-i", list_path] + trim_input_arguments(start, end)
+                 + ["-i", input_file, "-map", "0:v:0", "-map", "1:a:0?", "-map_metadata", "1", "-c:v", "copy"]
+                 + list(audio_arguments) + list(container_arguments) + [output_file])
+    jobs.append(Job(index=first_index + len(jobs), arguments=arguments, input_file=input_file, output_file=output_file,
+                    duration=total, weight=(total or 0.0) * 0.02, trim=trim,
+                    depends_on=[job.index for job in jobs], prepare=prepare_join, on_done=remove_pieces,
+                    notes=[f"Trim: {format_trim(trim)}, encoding only the partial groups of pictures at the cuts"]))
+    return jobs
@@ -0,0 +1,82 @@
+import hashlib
+import os
+
+import src.constants as constants
+from src.jobs import Job
+from src.probe import file_identity
+
+
+def strip_bitrate(arguments: list):
+    """Video options without the target bitrate, pass 1 statistics don't depend on it"""
+    result = []
+    skip = False
+    for argument in arguments:
+        if skip:
+            skip = False
+        elif argument == "-b:v":
+            skip = True
+        else:
+            result.append(argument)
+    return result
+
+
+class PassLogCache:
+    """Pass 1 statistics per input and video options, shared by pass 2 at any bitrate"""
+
+    def __init__(self, directory: str = None, max_entries: int = constants.PASSLOG_CACHE_SIZE):
+        self.directory = directory or os.path.join(constants.CACHE_DIRECTORY, "passlogs")
+        self.max_entries = max_entries
+
+    def entry_prefix(self, path: str, video_arguments: list):
+        """passlogfile prefix of path encoded with video_arguments, or None if it can't be read"""
+        identity = file_identity(path)
+        if identity is None:
+            return None
+        key = "|".join([path, str(identity[0]), str(identity[1])] + strip_bitrate(video_arguments))
+        return os.path.join(self.directory, hashlib.sha1(key.encode("utf-8")).hexdigest())
+
+    def has(self, prefix: str):
+        return os.path.exists(f"{prefix}-0.log")
+
+    def build_first_pass_job(self, index: int, input_file: str, prefix: str, video_arguments: list,
+                             duration: float = None):
+        """Job running pass 1 into temp statistics files that are moved into the cache when done"""
+        os.makedirs(self.directory, exist_ok=True)
+        temp_prefix = f"{prefix}.part"
+
+        def on_done(job: Job):
+            # ffmpeg appends the stream index and encoders add their own suffixes, e.g. .mbtree
+            temp_name = os.path.basename(temp_prefix)
+            for name in os.listdir(self.directory):
+                if name.startswith(f"{temp_name}-"):
+                    os.replace(os.path.join(self.directory, name),
+                               f"{prefix}{name[len(temp_name):]}")
+            self.prune()
+
+        arguments = (["-y", "-i", input_file] + video_arguments
+                     + ["-pass", "1", "-passlogfile", temp_prefix, "-an", "-f", "null", os.devnull])
+        # pass 1 skips audio and muxing and often uses faster analysis, count it as half the work
+        return Job(index=index, arguments=arguments, input_file=input_file, output_file=f"{prefix}-0.log",
+                   duration=duration, weight=duration * 0.5 if duration else None, on_done=on_done)
+
+    def touch(self, prefix: str):
+        """Mark statistics as used, raise OSError if they were removed in the meantime"""
+        os.utime(f"{prefix}-0.log")
+
+    def prune(self):
+        """Remove the statistics of the least recently used entries above the size limit"""
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return
+        entries = [name[:-len("-0.log")] for name in names if name.endswith("-0.log") and ".part" not in name]
+        if len(entries) <= self.max_entries:
+            return
+        entries.sort(key=lambda entry: os.path.getmtime(os.path.join(self.directory, f"{entry}-0.log")))
+        removed = set(entries[:len(entries) - self.max_entries])
+        for name in names:
+            if name.split("-", 1)[0] in removed:
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                except OSError:
+                    pass
@@ -1,7 +1,5 @@
 from enum import Enum
 
-from PySide6.QtCore import Signal, QObject
-
 
 class LOG_LEVEL(Enum):
     DEBUG = 1
@@ -9,9 +7,6 @@ class LOG_LEVEL(Enum):
     WARNING = 3
     ERROR = 4
 
-class MySignal(QObject):
-    update_signal = Signal(int)
-
 def support_crf(encode_format: str):
     support_list = [
         "H.264",
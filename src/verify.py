@@ -0,0 +1,139 @@
+import hashlib
+import os
+
+import src.constants as constants
+from src.jobs import Job, JobState
+from src.probe import MediaInfo, parse_probe_output, probe_arguments
+
+
+def invalid_output_path(output_file: str):
+    """Name an output that failed verification is moved to, so it never looks finished"""
+    root, extension = os.path.splitext(output_file)
+    return f"{root}.invalid{extension}"
+
+
+# output options of a hand edited command that end an output before its input ends
+LIMITING_OPTIONS = {"-t", "-to", "-ss", "-fs", "-frames:v", "-vframes", "-shortest"}
+
+
+def limits_duration(arguments: list):
+    """True if options after the last input cut the output short"""
+    last_input = max((i for i, argument in enumerate(arguments) if argument == "-i"), default=-1)
+    return any(argument in LIMITING_OPTIONS for argument in arguments[last_input + 1:])
+
+
+def check_output(info: MediaInfo, source: MediaInfo = None, duration: float = None, arguments: list = ()):
+    """Return the reasons info doesn't look like the complete output of a job, empty if it does
+
+    duration is the expected media seconds, source the probe of the input the output
+    should keep the video and audio of unless the arguments drop them.
+    """
+    problems = []
+    if info.duration <= 0:
+        problems.append("no duration, the output is likely truncated")
+    elif duration and not limits_duration(arguments):
+        tolerance = max(constants.VERIFY_DURATION_TOLERANCE, duration * constants.VERIFY_DURATION_SHARE)
+        if abs(info.duration - duration) > tolerance:
+            problems.append(f"duration {info.duration:.2f}s, expected {duration:.2f}s")
+    if source is not None:
+        if source.video_stream() is not None and "-vn" not in arguments and info.video_stream() is None:
+            problems.append("no video stream")
+        if source.audio_streams() and "-an" not in arguments and not info.audio_streams():
+            problems.append("no audio stream")
+    return problems
+
+
+def decode_arguments(output_file: str, duration: float = None):
+    """ffmpeg options decoding output_file, or evenly spread samples of it if it is long"""
+    if not duration or duration <= constants.VERIFY_FULL_DECODE_DURATION:
+        return ["-xerror", "-i", output_file, "-map", "0", "-f", "null", os.devnull]
+    count, length = constants.VERIFY_SAMPLE_COUNT, constants.VERIFY_SAMPLE_LENGTH
+    inputs, outputs = [], []
+    for i in range(count):
+        start = (duration - length) * (i + 0.5) / count
+        inputs += ["-ss", f"{start:.3f}", "-t", f"{length:.3f}", "-i", output_file]
+        outputs += ["-map", str(i), "-f", "null", os.devnull]
+    return ["-xerror"] + inputs + outputs
+
+
+def add_verify_jobs(jobs: list, media: dict = None, decode: bool = False, directory: str = None,
+                    ffprobe: str = constants.DEFAULT_FFPROBE_PATH):
+    """Append analysis jobs that check every output of the batch once the job writing it is done
+
+    Each output is probed and its duration and streams compared with what the job should
+    have written, with decode its content is decoded as well. An output that fails is moved
+    to its invalid name and its job marked FAILED, so resuming the batch writes it again;
+    reject_unverified does that for checks whose process failed. Outputs already done, e.g.
+    reused ones, are not checked. Return the number of added jobs.
+    """
+    media = media or {}
+    directory = directory or os.path.join(constants.CACHE_DIRECTORY, "verify")
+    needed = {index for job in jobs for index in job.depends_on}
+    # only final outputs, intermediate files such as segments are checked through what they make up
+    checked = [job for job in jobs if job.index not in needed and job.program is None and job.output_file
+               and not job.is_analysis and job.state != JobState.DONE]
+    count = len(jobs)
+    for job in checked:
+        source = media.get(job.input_file)
+        for output in job.outputs():
+            probe_path = os.path.join(directory, f"{hashlib.sha1(output.encode('utf-8')).hexdigest()}.json")
+
+            def verify(verify_job: Job, job=job, output=output, probe_path=probe_path, source=source):
+                with open(probe_path, "r", encoding="utf-8") as file:
+                    text = file.read()
+                os.remove(probe_path)
+                try:
+                    problems = check_output(parse_probe_output(output, text), source, job.duration, job.arguments)
+                except ValueError:
+                    problems = ["ffprobe can't read it"]
+                if problems:
+                    raise ValueError(reject_output(job, output, ", ".join(problems)))
+
+            os.makedirs(directory, exist_ok=True)
+            probe = Job(index=len(jobs), arguments=probe_arguments(output), input_file=job.input_file,
+                        depends_on=[job.index], program=ffprobe, stdout_file=probe_path, weight=0.0,
+                        is_analysis=True, verifies=job.index, on_done=verify,
+                        notes=[f"Verify: probing {output}"])
+            jobs.append(probe)
+            if not decode:
+                continue
+
+            # -xerror ends ffmpeg on the first broken packet, only its exit code matters
+            duration = job.duration if job.duration and job.duration <= constants.VERIFY_FULL_DECODE_DURATION \
+                else constants.VERIFY_SAMPLE_COUNT * constants.VERIFY_SAMPLE_LENGTH if job.duration else None
+            jobs.append(Job(index=len(jobs), arguments=["-v", "error"] + decode_arguments(output, job.duration),
+                            input_file=job.input_file, duration=duration, weight=(duration or 0.0) * 0.05,
+                            depends_on=[probe.index], is_analysis=True, verifies=job.index,
+                            notes=[f"Verify: decoding {output}"]))
+    return len(jobs) - count
+
+
+def checked_output(verify_job: Job):
+    """The output a verify job checks, the last argument of ffprobe or the first input of ffmpeg"""
+    if verify_job.program is not None:
+        return verify_job.arguments[-1]
+    return verify_job.arguments[verify_job.arguments.index("-i") + 1]
+
+
+def reject_output(job: Job, output: str, reason: str):
+    """Move an output that failed verification aside and mark its job FAILED, return why"""
+    job.state = JobState.FAILED
+    try:
+        os.replace(output, invalid_output_path(output))
+    except OSError:
+        pass
+    job.failure = f"{output} failed verification: {reason}, moved to {invalid_output_path(output)}"
+    return job.failure
+
+
+def reject_unverified(jobs: list, verify_job: Job):
+    """Reject the output of a check whose process failed, return why or None if there is nothing to reject
+
+    A check that couldn't start, e.g. without ffprobe, says nothing about the output.
+    """
+    # a probe that found a problem already rejected the output and exited with 0
+    if verify_job.state != JobState.FAILED or verify_job.exit_code is None or verify_job.exit_code <= 0:
+        return None
+    job = jobs[verify_job.verifies]
+    reason = "ffprobe can't read it" if verify_job.program is not None else "it doesn't decode"
+    return reject_output(job, checked_output(verify_job), reason)